@@ -0,0 +1,248 @@
+"""
+Benchmark suite for the 180-day rule calculation engines.
+
+Runs every engine over a grid of synthetic travel histories, records the time
+and peak memory of each case and compares them against a JSON baseline.
+
+Usage:
+    python benchmarks/bench_calculation.py                    # full grid, compare with baseline
+    python benchmarks/bench_calculation.py --grid quick       # small grid for quick checks
+    python benchmarks/bench_calculation.py --update-baseline  # record a new baseline
+
+The process exits with status 1 when any case regresses beyond the threshold.
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from histories import DEFAULT_DECISION_DATE, TRIP_PROFILES, generate_history
+from engines import load_engines
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baselines", "calculation.json")
+
+# Grids of (number of periods, trip profiles, horizons in years)
+GRIDS = {
+    "quick": ([1, 10, 100], list(TRIP_PROFILES), [5, 10]),
+    "full": ([1, 10, 100, 1000, 5000], list(TRIP_PROFILES), [5, 10]),
+}
+
+# Repeat a case at least MIN_REPEATS times and until it has run for
+# MIN_CASE_SECONDS, but at most MAX_REPEATS times; cases slower than
+# MIN_CASE_SECONDS / MIN_REPEATS still get MIN_REPEATS runs for their median
+MIN_REPEATS = 5
+MIN_CASE_SECONDS = 0.5
+MAX_REPEATS = 50
+
+
+def case_key(engine, num_periods, profile, horizon_years):
+    """Build the key that identifies a benchmark case in the baseline"""
+    return f"{engine}/{num_periods}/{profile}/{horizon_years}y"
+
+
+def time_case(calculate, absence_periods, decision_date):
+    """
+    Time one engine on one history.
+
+    Returns:
+        Tuple of (median seconds, number of repeats)
+    """
+    # One untimed run first, so caches filled on first use are not timed
+    calculate(absence_periods, decision_date)
+    timings = []
+    while len(timings) < MAX_REPEATS:
+        started = time.perf_counter()
+        calculate(absence_periods, decision_date)
+        timings.append(time.perf_counter() - started)
+        if len(timings) >= MIN_REPEATS and sum(timings) >= MIN_CASE_SECONDS:
+            break
+    return statistics.median(timings), len(timings)
+
+
+def measure_peak_memory(calculate, absence_periods, decision_date):
+    """Measure the peak memory allocated by one run, in KiB"""
+    tracemalloc.start()
+    try:
+        calculate(absence_periods, decision_date)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def run_suite(grid, engine_names=None, case_budget=None):
+    """
+    Run the benchmark grid.
+
+    Period counts run in increasing order, and once an engine needs more than
+    case_budget seconds for one history the larger histories with the same
+    profile and horizon are skipped for that engine.
+
+    Args:
+        grid: Name of the grid to run (see GRIDS)
+        engine_names: Names of the engines to run, or None for all of them
+        case_budget: Seconds per run after which larger cases are skipped, or None
+
+    Returns:
+        Dictionary mapping case keys to measurements
+    """
+    engines = load_engines()
+    if engine_names:
+        unknown = set(engine_names) - set(engines)
+        if unknown:
+            raise ValueError(f"Unknown engines: {', '.join(sorted(unknown))}")
+        engines = {name: engines[name] for name in engine_names}
+
+    period_counts, profiles, horizons = GRIDS[grid]
+    decision_date = DEFAULT_DECISION_DATE
+    results = {}
+
+    for profile in profiles:
+        for horizon_years in horizons:
+            over_budget = set()
+            for num_periods in sorted(period_counts):
+                history = generate_history(num_periods, profile, horizon_years, decision_date)
+                for engine_name, (prepare, calculate) in engines.items():
+                    key = case_key(engine_name, num_periods, profile, horizon_years)
+                    case = {
+                        "engine": engine_name,
+                        "periods": num_periods,
+                        "profile": profile,
+                        "horizon_years": horizon_years,
+                    }
+
+                    if engine_name in over_budget:
+                        case["skipped"] = True
+                        results[key] = case
+                        print(f"{key:<32} {'skipped (over budget)':>32}")
+                        continue
+
+                    absence_periods, engine_decision_date = prepare(history, decision_date)
+                    seconds, repeats = time_case(calculate, absence_periods, engine_decision_date)
+                    peak_kib = measure_peak_memory(calculate, absence_periods, engine_decision_date)
+
+                    case.update({
+                        "seconds": round(seconds, 6),
+                        "repeats": repeats,
+                        "peak_kib": round(peak_kib, 1),
+                    })
+                    results[key] = case
+                    print(f"{key:<32} {seconds * 1000:>12.3f} ms {peak_kib:>12.1f} KiB")
+
+                    if case_budget is not None and seconds > case_budget:
+                        over_budget.add(engine_name)
+
+    return results
+
+
+def find_regressions(results, baseline, threshold, min_delta_ms, min_delta_kib):
+    """
+    Compare results against a baseline.
+
+    A case regresses when it is slower (or uses more memory) than the baseline
+    by more than the relative threshold and by more than an absolute noise floor.
+    Cases missing from either side are ignored.
+
+    Returns:
+        List of human readable regression descriptions
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous or previous.get("skipped"):
+            continue
+
+        if current.get("skipped"):
+            regressions.append(f"{key}: measured in the baseline but now over the time budget")
+            continue
+
+        time_limit = previous["seconds"] * (1 + threshold)
+        if current["seconds"] > time_limit and (current["seconds"] - previous["seconds"]) * 1000 > min_delta_ms:
+            regressions.append(
+                f"{key}: time {previous['seconds'] * 1000:.3f} ms -> {current['seconds'] * 1000:.3f} ms"
+            )
+
+        memory_limit = previous["peak_kib"] * (1 + threshold)
+        if current["peak_kib"] > memory_limit and current["peak_kib"] - previous["peak_kib"] > min_delta_kib:
+            regressions.append(
+                f"{key}: peak memory {previous['peak_kib']:.1f} KiB -> {current['peak_kib']:.1f} KiB"
+            )
+    return regressions
+
+
+def load_baseline(path):
+    """Load the cases of a baseline file, or an empty dict if there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as baseline_file:
+        return json.load(baseline_file).get("results", {})
+
+
+def write_report(path, grid, results, existing=None):
+    """Write results to a JSON file, merged over any existing cases"""
+    merged = dict(existing or {})
+    merged.update(results)
+    report = {
+        "version": 1,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "grid": grid,
+        "decision_date": DEFAULT_DECISION_DATE.isoformat(),
+        "results": dict(sorted(merged.items())),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+        report_file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the 180-day rule calculation engines")
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="full", help="Benchmark grid to run")
+    parser.add_argument("--engine", action="append", dest="engines", help="Engine to run (repeatable, default: all)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results of this run to a JSON file")
+    parser.add_argument("--case-budget", type=float, default=10.0,
+                        help="Skip larger histories once an engine needs more seconds than this (default: 10)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression (default: 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Ignore time regressions smaller than this, in ms (default: 5.0)")
+    parser.add_argument("--min-delta-kib", type=float, default=64.0, help="Ignore memory regressions smaller than this")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.grid, args.engines, args.case_budget)
+    baseline = load_baseline(args.baseline)
+
+    if args.output:
+        write_report(args.output, args.grid, results)
+
+    if args.update_baseline:
+        write_report(args.baseline, args.grid, results, existing=baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"No baseline found at {args.baseline}, run with --update-baseline to create one")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold, args.min_delta_ms, args.min_delta_kib)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Compression benchmark for /api/calculate responses.
+
+Renders calculation results for a few travel histories the way the API sends
+them and compresses each payload with every gzip level and a range of brotli
+qualities. For each setting it prints the compressed size, the ratio and the
+median time to compress, which is the cost CompressionMiddleware adds to a
+request. Use it to choose COMPRESSION_GZIP_LEVEL and COMPRESSION_BROTLI_QUALITY.
+
+Needs the server requirements (FastAPI, orjson, brotli) to be installed;
+brotli rows are left out without it.
+
+Usage:
+    python benchmarks/bench_compression.py
+"""
+import os
+import statistics
+import sys
+import time
+
+from histories import DEFAULT_DECISION_DATE, generate_history
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+from absence_engine import calculate_180_day_rule  # noqa: E402
+from utils.compression import CompressionMiddleware, brotli  # noqa: E402
+from utils.responses import FastJSONResponse  # noqa: E402
+
+# (number of periods, trip profile) of the histories to benchmark
+CASES = [(1, "short"), (25, "medium"), (100, "short")]
+GZIP_LEVELS = [1, 3, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 11]
+REPEATS = 20
+
+
+def median_ms(function, repeats=REPEATS):
+    """Median wall time of a function call, in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def settings():
+    """(label, encoding, middleware) for every compression setting to measure"""
+    for level in GZIP_LEVELS:
+        yield f"gzip {level}", "gzip", CompressionMiddleware(None, gzip_level=level)
+    if brotli is not None:
+        for quality in BROTLI_QUALITIES:
+            yield f"br {quality}", "br", CompressionMiddleware(None, brotli_quality=quality)
+
+
+def main():
+    if brotli is None:
+        print("brotli is not installed, only gzip is measured\n")
+
+    for num_periods, profile in CASES:
+        history = generate_history(num_periods, profile, 5, DEFAULT_DECISION_DATE)
+        body = FastJSONResponse(calculate_180_day_rule(history, DEFAULT_DECISION_DATE)).body
+
+        print(f"{num_periods} {profile} periods: {len(body) / 1024:.1f} KiB uncompressed")
+        print(f"  {'setting':<10}{'size KiB':>10}{'ratio':>8}{'ms':>9}")
+        for label, encoding, middleware in settings():
+            compressed = middleware.compress(body, encoding)
+            ms = median_ms(lambda: middleware.compress(body, encoding))
+            print(f"  {label:<10}{len(compressed) / 1024:>10.1f}{len(compressed) / len(body):>8.3f}{ms:>9.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
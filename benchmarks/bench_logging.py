@@ -0,0 +1,165 @@
+"""
+Logging overhead benchmark.
+
+Measures what a log line costs the request that writes it, for a print, a
+logging handler that formats and writes in the calling thread, and the
+queue handler the server uses, which leaves formatting and writing to a
+listener thread. Each is timed twice: writing to a file, and writing to a
+slow output, like a log collector that is behind and applies back-pressure
+to the server's stderr pipe. It also times a minimal request with and
+without the request log middleware, logged and sampled out.
+
+Usage:
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --slow-write-ms 5
+"""
+from logging.handlers import QueueListener
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+import logs  # noqa: E402
+
+CALLS = 20000
+REPEATS = 5
+
+FIELDS = {"method": "POST", "path": "/api/calculate", "status": 200, "duration_ms": 4.2, "user_id": "a1b2c3"}
+
+
+class SlowStream:
+    """Output that takes a fixed time per write, like a pipe that is full"""
+
+    def __init__(self, stream, write_seconds):
+        self.stream = stream
+        self.write_seconds = write_seconds
+
+    def write(self, text):
+        time.sleep(self.write_seconds)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def median_per_call(function, calls=CALLS, repeats=REPEATS):
+    """Median time of one call over several runs, in microseconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - started) / calls)
+    return statistics.median(timings) * 1_000_000
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logs.StructuredLogger(logger)
+
+
+def log_calls(output, calls):
+    """Time of one log line in the calling thread, per way of writing it"""
+    stream_handler = logging.StreamHandler(output)
+    stream_handler.setFormatter(logs.JsonFormatter())
+    blocking = make_logger("bench.blocking", stream_handler)
+
+    # The queue is large enough to hold every record, so none is dropped and
+    # the time is what the caller pays while the listener writes in the background
+    log_queue = queue.SimpleQueue()
+    queued = make_logger("bench.queued", logs.NonBlockingQueueHandler(log_queue, max_size=calls * REPEATS))
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+
+    results = {
+        "print": median_per_call(lambda: print("POST /api/calculate 200 4.2 ms user a1b2c3", file=output), calls),
+        "logging, blocking handler": median_per_call(lambda: blocking.info("request", **FIELDS), calls),
+        "logging, queue handler": median_per_call(lambda: queued.info("request", **FIELDS), calls),
+        "below the level": median_per_call(lambda: queued.debug("request", **FIELDS), calls),
+    }
+    drain_started = time.perf_counter()
+    listener.stop()
+    results["(listener backlog, s)"] = time.perf_counter() - drain_started
+    return results
+
+
+def request_calls():
+    """Time of a request that does nothing, with and without the request log middleware"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/api/health", "state": {}}
+    variants = {
+        "no request log": app,
+        "request logged": logs.RequestLogMiddleware(app, sample_rates={}, enabled=True),
+        "request sampled out": logs.RequestLogMiddleware(app, sample_rates={"GET /api/health": 0.0}, enabled=True),
+    }
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    for name, variant in variants.items():
+        async def run_many(variant=variant):
+            for _ in range(CALLS):
+                await variant(scope, receive, send)
+
+        timings = []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            loop.run_until_complete(run_many())
+            timings.append((time.perf_counter() - started) / CALLS)
+        results[name] = statistics.median(timings) * 1_000_000
+    loop.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cost of log lines and of the request log")
+    parser.add_argument("--slow-write-ms", type=float, default=1.0,
+                        help="Time each write takes on the slow output (default: 1 ms)")
+    args = parser.parse_args(argv)
+
+    # Applies the same logging settings as the server
+    logs.configure_logging()
+
+    with tempfile.TemporaryFile("w") as output:
+        file_results = log_calls(output, CALLS)
+        # Fewer calls, or the blocking variants take minutes
+        slow_results = log_calls(SlowStream(output, args.slow_write_ms / 1000), 200)
+
+        print(f"{'log line':<28}{'file, us':>12}{f'slow {args.slow_write_ms:g} ms, us':>20}")
+        for name in file_results:
+            if not name.startswith("("):
+                print(f"{name:<28}{file_results[name]:>12.2f}{slow_results[name]:>20.2f}")
+
+        # The middleware logs through the server's queue, here into the temporary file
+        logs._listener.handlers[0].setStream(output)
+        print(f"\n{'request':<28}{'us per request':>15}")
+        for name, microseconds in request_calls().items():
+            print(f"{name:<28}{microseconds:>15.2f}")
+        logs.flush_logs()
+
+    report = logs.logging_report()
+    print(f"\nServer queue: {report['queued']} records queued, {report['dropped']} dropped "
+          f"(LOG_QUEUE_SIZE {logs.LOG_QUEUE_SIZE})")
+
+
+if __name__ == "__main__":
+    main()
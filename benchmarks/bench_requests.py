@@ -0,0 +1,129 @@
+"""
+Request parsing benchmark for /api/calculate with absence periods sent inline.
+
+Compares the string pipeline the route used to have (periods validated as
+strings with strptime, then parsed again with strptime in the handler) with
+the typed pipeline (periods parsed once into date fields when the request is
+validated). It then times the whole request through the application, with
+an in-memory SQLite database, to show which share parsing takes.
+
+Needs the server requirements (FastAPI, Tortoise) to be installed.
+
+Usage:
+    python benchmarks/bench_requests.py
+    python benchmarks/bench_requests.py --periods 5000
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from histories import DEFAULT_DECISION_DATE, generate_history
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+# The whole request is measured, not the rate limits, against a throwaway database
+os.environ["ADMISSION_ENABLED"] = "0"
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_SQLITE_PATH", ":memory:")
+
+from pydantic import BaseModel, field_validator  # noqa: E402
+from periods.models import CalculationRequest  # noqa: E402
+from periods.intervals import merge_periods  # noqa: E402
+
+REPEATS = 20
+
+
+class LegacyCalculationRequest(BaseModel):
+    """The request model as it was before dates were typed"""
+    decision_date: str
+    absence_periods: Optional[List[Dict[str, str]]] = None
+
+    @field_validator("decision_date")
+    def validate_decision_date(cls, v):
+        datetime.strptime(v, "%Y-%m-%d")
+        return v
+
+
+def legacy_pipeline(body: bytes):
+    """Validate strings, then parse every date again as the handler did"""
+    request = LegacyCalculationRequest.model_validate_json(body)
+    decision_date = datetime.strptime(request.decision_date, "%Y-%m-%d").date()
+    periods = []
+    for period in request.absence_periods:
+        periods.append((datetime.strptime(period["start_date"], "%Y-%m-%d").date(),
+                        datetime.strptime(period["end_date"], "%Y-%m-%d").date()))
+    return decision_date, merge_periods(periods)
+
+
+def typed_pipeline(body: bytes):
+    """Validate into date fields once, as the route does now"""
+    request = CalculationRequest.model_validate_json(body)
+    periods = [(period.start_date, period.end_date) for period in request.absence_periods]
+    return request.decision_date, merge_periods(periods)
+
+
+def median_time(function, repeats=REPEATS):
+    """Median wall time of a function call, in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def request_body(num_periods: int) -> bytes:
+    """JSON body of a calculate request with num_periods short trips"""
+    history = generate_history(num_periods, "short", 5, DEFAULT_DECISION_DATE)
+    return json.dumps({
+        "decision_date": DEFAULT_DECISION_DATE.isoformat(),
+        "absence_periods": [{"start_date": start.isoformat(), "end_date": end.isoformat()} for start, end in history],
+    }).encode()
+
+
+def time_request(body: bytes) -> float:
+    """Median time of POST /api/calculate through the application, in milliseconds"""
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as client:
+        credentials = {"username": "benchmark", "password": "benchmark-password"}
+        client.post("/api/signup", json={**credentials, "email": "benchmark@example.com"})
+        token = client.post("/api/login", json=credentials).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+        def post():
+            response = client.post("/api/calculate", content=body, headers=headers)
+            assert response.status_code == 200, response.text
+
+        post()
+        return median_time(post, repeats=max(5, REPEATS // 2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--periods", type=int, default=1000, help="Absence periods in the request (default: 1000)")
+    args = parser.parse_args(argv)
+
+    body = request_body(args.periods)
+    assert legacy_pipeline(body) == typed_pipeline(body), "The pipelines disagree"
+
+    legacy_ms = median_time(lambda: legacy_pipeline(body))
+    typed_ms = median_time(lambda: typed_pipeline(body))
+    request_ms = time_request(body)
+
+    print(f"{args.periods} inline periods, {len(body) / 1024:.1f} KiB body\n")
+    print(f"{'parsing':<28}{'ms':>10}{'of request':>12}")
+    print(f"{'strings + strptime twice':<28}{legacy_ms:>10.2f}{legacy_ms / (request_ms - typed_ms + legacy_ms):>12.1%}")
+    print(f"{'typed dates, parsed once':<28}{typed_ms:>10.2f}{typed_ms / request_ms:>12.1%}")
+    print(f"\nPOST /api/calculate: {request_ms:.2f} ms median, parsing {legacy_ms / typed_ms:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
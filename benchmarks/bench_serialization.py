@@ -0,0 +1,95 @@
+"""
+Serialization benchmark for /api/calculate responses.
+
+Compares the default FastAPI response path (jsonable_encoder followed by the
+standard library json module, as JSONResponse does) with the fast path used by
+the calculate route (FastJSONResponse rendering the result directly), and shows
+which share of the request's CPU time goes to serialization in each case.
+It also times building the 1,826 'YYYY-MM-DD to YYYY-MM-DD' window keys with
+strftime against the cached ISO strings the engine uses.
+
+Needs the server requirements (FastAPI, orjson) to be installed.
+
+Usage:
+    python benchmarks/bench_serialization.py
+"""
+from datetime import timedelta
+import os
+import statistics
+import sys
+import time
+
+from histories import DEFAULT_DECISION_DATE, generate_history
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+import absence_engine as calculation  # noqa: E402
+from utils.responses import FastJSONResponse, orjson  # noqa: E402
+
+# (number of periods, trip profile) of the histories to benchmark
+CASES = [(1, "short"), (10, "short"), (25, "medium"), (100, "short")]
+REPEATS = 20
+
+
+def median_time(function, repeats=REPEATS):
+    """Median wall time of a function call, in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def default_path(result):
+    """What FastAPI does with a returned dict: encode it, then render it with json"""
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def fast_path(result):
+    """What the calculate route does: render the primitive payload directly"""
+    return FastJSONResponse(result).body
+
+
+def strftime_keys(decision_date, num_windows):
+    """Window keys built the way the engine used to, with two strftime calls per window"""
+    keys = []
+    for check_day in range(num_windows):
+        period_end = decision_date - timedelta(days=check_day)
+        period_start = period_end - timedelta(days=365)
+        keys.append(f"{period_start.strftime('%Y-%m-%d')} to {period_end.strftime('%Y-%m-%d')}")
+    return keys
+
+
+def main():
+    decision_date = DEFAULT_DECISION_DATE
+    num_windows = 5 * 365 + 1
+
+    print(f"orjson: {'installed' if orjson else 'NOT installed, fast path falls back to json'}\n")
+
+    old_keys = median_time(lambda: strftime_keys(decision_date, num_windows))
+    uncached_keys = median_time(lambda: calculation.window_keys.__wrapped__(decision_date, num_windows))
+    cached_keys = median_time(lambda: calculation.window_keys(decision_date, num_windows))
+    print(f"Window keys: strftime {old_keys:.3f} ms, isoformat {uncached_keys:.3f} ms, cached {cached_keys:.4f} ms\n")
+
+    print(f"{'history':<16}{'payload':>10}{'calc ms':>10}{'default ms':>12}{'share':>8}{'fast ms':>10}{'share':>8}")
+    for num_periods, profile in CASES:
+        history = generate_history(num_periods, profile, 5, decision_date)
+        result = calculation.calculate_180_day_rule(history, decision_date)
+
+        calc_ms = median_time(lambda: calculation.calculate_180_day_rule(history, decision_date), repeats=5)
+        default_ms = median_time(lambda: default_path(result))
+        fast_ms = median_time(lambda: fast_path(result))
+        payload_kib = len(fast_path(result)) / 1024
+
+        default_share = default_ms / (calc_ms + default_ms)
+        fast_share = fast_ms / (calc_ms + fast_ms)
+        print(f"{f'{num_periods} {profile}':<16}{payload_kib:>8.1f}Ki{calc_ms:>10.2f}{default_ms:>12.3f}"
+              f"{default_share:>8.1%}{fast_ms:>10.3f}{fast_share:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
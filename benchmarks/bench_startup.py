@@ -0,0 +1,152 @@
+"""
+Cold-start benchmark for the API server.
+
+Starts fresh interpreters that import server/app.py and run its startup events
+against an in-memory SQLite database, which is what a new uvicorn worker or an
+autoscaled pod goes through before it can serve requests. The median timings
+are checked against the cold-start budget in baselines/startup.json.
+
+Usage:
+    python benchmarks/bench_startup.py                    # check against the budget
+    python benchmarks/bench_startup.py --runs 10          # more runs for a stabler median
+    python benchmarks/bench_startup.py --update-baseline  # record the measured timings
+
+The process exits with status 1 when a median exceeds its budget.
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "server")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baselines", "startup.json")
+
+# Default budgets in milliseconds, used when the baseline file has none
+DEFAULT_BUDGETS_MS = {
+    "import_app": 1500,
+    "startup_events": 500,
+    "process_total": 2500,
+}
+
+# Runs inside the child interpreter, with the server directory as working directory
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+sys.path.insert(0, ".")
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+asyncio.run(app.app.router.startup())
+ready = time.perf_counter()
+from timing import startup_report
+report = startup_report()
+asyncio.run(app.app.router.shutdown())
+print(json.dumps({
+    "import_app": (imported - started) * 1000,
+    "startup_events": (ready - imported) * 1000,
+    "phases": report["phases"],
+}))
+"""
+
+
+def run_once():
+    """
+    Start one server process, run its startup and measure it.
+
+    Returns:
+        Dictionary of timings in milliseconds
+    """
+    env = dict(os.environ)
+    env.update({"DB_BACKEND": "sqlite", "DB_SQLITE_PATH": ":memory:"})
+    env.pop("DATABASE_URL", None)
+
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT], cwd=SERVER_DIR, env=env, capture_output=True, text=True
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Server startup failed:\n{completed.stderr}")
+
+    # The startup report is printed too, so the timings are on the last line
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings["process_total"] = total_ms
+    return timings
+
+
+def summarize(runs):
+    """Median of each timing over all runs"""
+    summary = {}
+    for key in ("import_app", "startup_events", "process_total"):
+        summary[key] = round(statistics.median(run[key] for run in runs), 2)
+
+    phases = {}
+    for name in runs[0]["phases"]:
+        phases[name] = round(statistics.median(run["phases"].get(name, 0) for run in runs), 2)
+    summary["phases"] = phases
+    return summary
+
+
+def load_budgets(path):
+    """Load the budgets from the baseline file, falling back to the defaults"""
+    if not os.path.exists(path):
+        return dict(DEFAULT_BUDGETS_MS)
+    with open(path, "r") as baseline_file:
+        budgets = json.load(baseline_file).get("budgets_ms", {})
+    return {**DEFAULT_BUDGETS_MS, **budgets}
+
+
+def write_baseline(path, budgets, summary):
+    """Store the budgets together with the timings measured on this machine"""
+    baseline = {
+        "version": 1,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "budgets_ms": budgets,
+        "measured_ms": summary,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+        baseline_file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the API server")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh processes to start (default: 5)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file with the budgets")
+    parser.add_argument("--update-baseline", action="store_true", help="Record the measured timings in the baseline")
+    args = parser.parse_args(argv)
+
+    # Warm the OS file cache so the first run is not an outlier
+    run_once()
+    runs = [run_once() for _ in range(args.runs)]
+    summary = summarize(runs)
+    budgets = load_budgets(args.baseline)
+
+    print(f"Median over {args.runs} cold starts:")
+    for name, ms in summary["phases"].items():
+        print(f"  {name:<24} {ms:>10.2f} ms")
+    over_budget = []
+    for key, budget in budgets.items():
+        status = "ok" if summary[key] <= budget else "OVER BUDGET"
+        print(f"{key:<26} {summary[key]:>10.2f} ms  (budget {budget} ms) {status}")
+        if summary[key] > budget:
+            over_budget.append(key)
+
+    if args.update_baseline:
+        write_baseline(args.baseline, budgets, summary)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
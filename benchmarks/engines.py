@@ -0,0 +1,32 @@
+from functools import partial
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(REPO_ROOT, "server")
+
+
+def _as_is(absence_periods, decision_date):
+    return absence_periods, decision_date
+
+
+def load_engines():
+    """
+    Load every calculation backend of the absence_engine package that can run here.
+
+    The server and the command line version both calculate through the package,
+    so its backends are the engines of the repository.
+
+    Returns:
+        Dictionary mapping backend names to (prepare, calculate) tuples, where
+        prepare converts (absence_periods, decision_date) given as dates into
+        the argument types the engine expects
+    """
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    from absence_engine import calculate_180_day_rule, available_backends
+
+    return {
+        backend: (_as_is, partial(calculate_180_day_rule, backend=backend))
+        for backend in available_backends()
+    }
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+from typing import List, Tuple
+import random
+
+# Trip length ranges in days (start and end dates included)
+TRIP_PROFILES = {
+    "short": (1, 14),
+    "medium": (15, 90),
+    "long": (180, 365),
+}
+
+# Fixed decision date so that every run works on the same calendar
+DEFAULT_DECISION_DATE = date(2025, 10, 15)
+
+
+def generate_history(num_periods: int, profile: str, horizon_years: int,
+                     decision_date: date = DEFAULT_DECISION_DATE, seed: int = 0) -> List[Tuple[date, date]]:
+    """
+    Generate a synthetic travel history.
+    
+    Trips are spread uniformly over the horizon that ends on the decision date.
+    Trips may overlap, which is what a careless export looks like and what the
+    engines have to cope with.
+    
+    Args:
+        num_periods: Number of trips to generate
+        profile: Name of the trip length profile (see TRIP_PROFILES)
+        horizon_years: Length of the history in years, counted back from the decision date
+        decision_date: The date of decision
+        seed: Seed for the random generator, so that histories are reproducible
+    
+    Returns:
+        Sorted list of tuples containing (start_date, end_date)
+    """
+    if profile not in TRIP_PROFILES:
+        raise ValueError(f"Unknown trip profile: {profile}")
+    
+    rng = random.Random(f"{seed}:{num_periods}:{profile}:{horizon_years}")
+    min_days, max_days = TRIP_PROFILES[profile]
+    horizon_days = horizon_years * 365
+    horizon_start = decision_date - timedelta(days=horizon_days)
+    
+    periods = []
+    for _ in range(num_periods):
+        length = rng.randint(min_days, max_days)
+        offset = rng.randint(0, max(horizon_days - length, 0))
+        start_date = horizon_start + timedelta(days=offset)
+        periods.append((start_date, start_date + timedelta(days=length)))
+    
+    periods.sort()
+    return periods
@@ -1,105 +1,33 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import List, Tuple, Dict, Any
+from itertools import groupby
+from array import array
+from typing import List, Tuple, Dict, Any, Iterator
+import argparse
 import csv
+import glob
+import json
+import mmap
 import os
+import struct
+import sys
+import time
 
+# The calculation is shared with the server: the absence_engine package in server/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'server'))
+from absence_engine import (  # noqa: E402
+    RuleSet, RULE_SETS, DEFAULT_RULE_SET, calculate_180_day_rule, evaluate_rule_sets, available_backends, plan_trips,
+)
 
-def calculate_180_day_rule(absence_periods: List[Tuple[datetime, datetime]], decision_date: datetime = None) -> Dict[str, Any]:
-    """
-    Calculate if the 180-day rule is satisfied for UK residency applications.
-    
-    The 180-day rule states that an applicant must not have spent more than 180 days
-    outside the UK in any rolling 12-month period during the qualifying period.
-    
-    This 12-month period is not considered as fixed calendar years, but as periods 
-    that slide back from the decision date.
-    
-    Args:
-        absence_periods: List of tuples containing (start_date, end_date) of periods spent outside the UK
-        decision_date: The date of decision (defaults to current date if not provided)
-    
-    Returns:
-        Dictionary containing:
-            - 'complies': Boolean indicating if the 180-day rule is satisfied
-            - 'total_days_absent': Total days spent outside the UK
-            - 'worst_period': The 12-month period with the highest number of absence days
-            - 'worst_period_days': Number of days absent in the worst period
-            - 'detailed_periods': Dictionary with dates as keys and absence days as values
-    """
-    # If decision date is not provided, use current date
-    if decision_date is None:
-        decision_date = datetime.now()
-    
-    # Convert absence periods to a list of individual days
-    all_absence_days = []
-    for start_date, end_date in absence_periods:
-        # Calculate the number of days in this period (excluding start and end dates)
-        delta = (end_date - start_date).days - 1
-        if delta > 0:  # Only process if there are days between start and end
-            for i in range(1, delta + 1):  # Start from 1 to skip start_date, end before end_date
-                day = start_date + timedelta(days=i)
-                all_absence_days.append(day)
-    
-    # Sort the absence days
-    all_absence_days.sort()
-    
-    # If no absences, return early
-    if not all_absence_days:
-        return {
-            'complies': True,
-            'total_days_absent': 0,
-            'worst_period': None,
-            'worst_period_days': 0,
-            'detailed_periods': {}
-        }
-    
-    # Calculate the start date of the 5-year qualifying period
-    qualifying_start = decision_date - timedelta(days=5*365)
-    
-    # Filter out absence days before the qualifying period
-    relevant_absence_days = [day for day in all_absence_days if day >= qualifying_start]
-    
-    # Initialize variables to track the worst 12-month period
-    worst_period_start = None
-    worst_period_end = None
-    worst_period_days = 0
-    detailed_periods = {}
-    
-    # Check each possible 12-month period by sliding back from the decision date
-    for check_day in range((decision_date - qualifying_start).days + 1):
-        # Define the current 12-month period we're checking
-        period_end = decision_date - timedelta(days=check_day)
-        period_start = period_end - timedelta(days=365)
-        
-        # Count days absent in this period
-        days_absent_in_period = sum(1 for day in relevant_absence_days 
-                                  if period_start <= day <= period_end)
-        
-        # Store the result for this period
-        period_key = period_start.strftime('%Y-%m-%d') + ' to ' + period_end.strftime('%Y-%m-%d')
-        detailed_periods[period_key] = days_absent_in_period
-        
-        # Update the worst period if this one has more absence days
-        if days_absent_in_period > worst_period_days:
-            worst_period_days = days_absent_in_period
-            worst_period_start = period_start
-            worst_period_end = period_end
-    
-    # Determine if the application complies with the 180-day rule
-    complies = worst_period_days <= 180
-    
-    # Format the worst period for the result
-    worst_period = None
-    if worst_period_start and worst_period_end:
-        worst_period = f"{worst_period_start.strftime('%Y-%m-%d')} to {worst_period_end.strftime('%Y-%m-%d')}"
-    
-    return {
-        'complies': complies,
-        'total_days_absent': len(relevant_absence_days),
-        'worst_period': worst_period,
-        'worst_period_days': worst_period_days,
-        'detailed_periods': detailed_periods
-    }
+# Parsed-input cache written next to each batch CSV file (see load_cached_applicants).
+# Layout: header, start/end day ordinals of every period as uint32, JSON metadata
+# with the source path and the (applicant_id, period count) of every applicant.
+CACHE_SUFFIX = '.absence-cache'
+CACHE_MAGIC = b'ABSC'
+CACHE_VERSION = 1
+CACHE_BYTEORDER = 0 if sys.byteorder == 'little' else 1
+# magic, version, byte order, source mtime (ns), source size, parse seconds, metadata offset
+CACHE_HEADER = struct.Struct('<4sHH q q d Q')
 
 
 def parse_date(date_str: str) -> datetime:
@@ -112,6 +40,13 @@ def parse_date(date_str: str) -> datetime:
     Returns:
         datetime object
     """
+    # fromisoformat is much faster than strptime; other spellings that strptime
+    # accepts, such as '2023-1-5', still go through strptime
+    if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
     return datetime.strptime(date_str, '%Y-%m-%d')
 
 
@@ -160,6 +95,439 @@ def read_absence_periods_from_csv(csv_file_path: str) -> List[Tuple[datetime, da
     return absence_periods
 
 
+def find_csv_files(inputs: List[str]) -> List[str]:
+    """
+    Expand batch inputs into a list of CSV files.
+    
+    Args:
+        inputs: CSV files, directories (all *.csv files inside) or glob patterns
+    
+    Returns:
+        Sorted list of CSV file paths, without duplicates
+    """
+    csv_files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            csv_files.extend(glob.glob(os.path.join(item, '*.csv')))
+        elif glob.has_magic(item):
+            csv_files.extend(glob.glob(item, recursive=True))
+        elif os.path.exists(item):
+            csv_files.append(item)
+        else:
+            raise FileNotFoundError(f"CSV file not found: {item}")
+    return sorted(set(csv_files))
+
+
+def parse_period_rows(rows: Iterator[List[str]], start_index: int, end_index: int, label: str) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Parse CSV rows into absence periods, skipping invalid rows with a warning.
+    
+    Args:
+        rows: CSV rows as lists of fields
+        start_index: Position of the start_date column
+        end_index: Position of the end_date column
+        label: Description of the rows' source for warnings
+    
+    Yields:
+        Tuples of (start_date, end_date)
+    """
+    for row in rows:
+        try:
+            start_date = parse_date(row[start_index])
+            end_date = parse_date(row[end_index])
+        except (ValueError, IndexError) as e:
+            print(f"Warning: Skipping row of {label} due to date parsing error: {e}", file=sys.stderr)
+            continue
+        if end_date < start_date:
+            print(f"Warning: Skipping invalid date range of {label}: {row[start_index]} to {row[end_index]}", file=sys.stderr)
+            continue
+        yield start_date, end_date
+
+
+def read_csv_applicants(csv_file_path: str) -> Iterator[Tuple[str, List[Tuple[datetime, datetime]]]]:
+    """
+    Stream the absence periods of every applicant in one CSV file.
+    
+    A CSV file with an 'applicant_id' column may hold many applicants, whose rows
+    must be grouped together (e.g. sorted by applicant_id). Applicants are read one
+    at a time, so memory use depends on the largest applicant, not on the file.
+    Any other CSV file holds a single applicant, named after the file.
+    
+    Args:
+        csv_file_path: Path to the CSV file
+    
+    Yields:
+        Tuples of (applicant_id, absence periods)
+    
+    Raises:
+        ValueError: If the rows of an applicant are not grouped together
+    """
+    with open(csv_file_path, 'r', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = [column.strip() for column in next(reader, [])]
+        if 'start_date' not in header or 'end_date' not in header:
+            print(f"Warning: Skipping {csv_file_path}: CSV file must contain columns: start_date, end_date", file=sys.stderr)
+            return
+        start_index = header.index('start_date')
+        end_index = header.index('end_date')
+        # Blank lines come through as empty rows
+        rows = (row for row in reader if row)
+        
+        if 'applicant_id' not in header:
+            applicant_id = os.path.splitext(os.path.basename(csv_file_path))[0]
+            yield applicant_id, list(parse_period_rows(rows, start_index, end_index, csv_file_path))
+            return
+        
+        applicant_index = header.index('applicant_id')
+        seen_applicants = set()
+        for applicant_id, applicant_rows in groupby(rows, key=lambda row: row[applicant_index] if len(row) > applicant_index else ''):
+            if applicant_id in seen_applicants:
+                raise ValueError(
+                    f"Rows of applicant {applicant_id} in {csv_file_path} are not grouped together; "
+                    "sort the file by applicant_id first"
+                )
+            seen_applicants.add(applicant_id)
+            label = f"applicant {applicant_id}"
+            yield applicant_id, list(parse_period_rows(applicant_rows, start_index, end_index, label))
+
+
+def cache_path_for(csv_file_path: str) -> str:
+    """Path of the parsed-input cache of a CSV file, next to the file"""
+    return csv_file_path + CACHE_SUFFIX
+
+
+def _source_key(csv_file_path: str) -> Tuple[str, int, int]:
+    """Absolute path, modification time and size that a cache must match"""
+    stat = os.stat(csv_file_path)
+    return os.path.abspath(csv_file_path), stat.st_mtime_ns, stat.st_size
+
+
+def load_cached_applicants(csv_file_path: str):
+    """
+    Open the parsed-input cache of a CSV file if it matches the file.
+    
+    Args:
+        csv_file_path: Path to the CSV file
+    
+    Returns:
+        Tuple of (applicants iterator, seconds the original parse took), or
+        None if there is no cache or it belongs to another version of the file
+    """
+    cache_path = cache_path_for(csv_file_path)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cache = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    
+    try:
+        magic, version, byteorder, mtime_ns, size, parse_seconds, metadata_offset = CACHE_HEADER.unpack_from(cache)
+        metadata = json.loads(cache[metadata_offset:])
+    except (struct.error, ValueError):
+        cache.close()
+        return None
+    
+    source, source_mtime_ns, source_size = _source_key(csv_file_path)
+    if (magic, version, byteorder) != (CACHE_MAGIC, CACHE_VERSION, CACHE_BYTEORDER) \
+            or (metadata['source'], mtime_ns, size) != (source, source_mtime_ns, source_size):
+        cache.close()
+        return None
+    
+    def applicants():
+        # Start and end day ordinals of every period, read straight from the mapped file
+        view = memoryview(cache)
+        ordinals = view[CACHE_HEADER.size:metadata_offset].cast('I')
+        try:
+            position = 0
+            for applicant_id, count in metadata['applicants']:
+                end = position + 2 * count
+                days = ordinals[position:end].tolist()
+                position = end
+                yield applicant_id, [(datetime.fromordinal(days[i]), datetime.fromordinal(days[i + 1]))
+                                     for i in range(0, len(days), 2)]
+        finally:
+            ordinals.release()
+            view.release()
+            cache.close()
+    
+    return applicants(), parse_seconds
+
+
+def write_cache_while_reading(csv_file_path: str, applicants: Iterator[Tuple[str, List[Tuple[datetime, datetime]]]], stats: Dict[str, Any]):
+    """
+    Pass applicants through while writing them to the cache of their CSV file.
+    
+    The cache is only kept if every applicant was read; it is written to a
+    temporary file first, so an interrupted run never leaves a partial cache.
+    
+    Args:
+        csv_file_path: Path to the CSV file the applicants come from
+        applicants: Iterator of (applicant_id, absence periods)
+        stats: Run statistics; 'parse_seconds' must hold the time spent parsing this file so far
+    
+    Yields:
+        The applicants, unchanged
+    """
+    source, mtime_ns, size = _source_key(csv_file_path)
+    cache_path = cache_path_for(csv_file_path)
+    parse_seconds_before = stats['parse_seconds']
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        cache_file = open(temporary_path, 'wb')
+    except OSError as e:
+        print(f"Warning: Cannot write cache {cache_path}: {e}", file=sys.stderr)
+        yield from applicants
+        return
+    
+    completed = False
+    try:
+        with cache_file:
+            cache_file.write(bytes(CACHE_HEADER.size))
+            index = []
+            for applicant_id, absence_periods in applicants:
+                days = array('I')
+                for start_date, end_date in absence_periods:
+                    days.append(start_date.toordinal())
+                    days.append(end_date.toordinal())
+                cache_file.write(days.tobytes())
+                index.append((applicant_id, len(absence_periods)))
+                yield applicant_id, absence_periods
+            
+            metadata_offset = cache_file.tell()
+            cache_file.write(json.dumps({'source': source, 'applicants': index}).encode())
+            cache_file.seek(0)
+            parse_seconds = stats['parse_seconds'] - parse_seconds_before
+            cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, CACHE_BYTEORDER, mtime_ns, size, parse_seconds, metadata_offset))
+        os.replace(temporary_path, cache_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _timed(iterator, stats: Dict[str, Any], key: str):
+    """Pass an iterator through, adding the time spent producing its items to stats[key]"""
+    iterator = iter(iterator)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats[key] += time.perf_counter() - started
+            return
+        stats[key] += time.perf_counter() - started
+        yield item
+
+
+def iter_applicants(csv_files: List[str], use_cache: bool = True, stats: Dict[str, Any] = None) -> Iterator[Tuple[str, str, List[Tuple[datetime, datetime]]]]:
+    """
+    Stream the absence periods of every applicant in a list of CSV files.
+    
+    With use_cache, a CSV file whose cache matches its path, modification time
+    and size is read from the memory-mapped cache instead of being parsed; any
+    other file is parsed and its cache (re)written. See read_csv_applicants for
+    the CSV layout.
+    
+    Args:
+        csv_files: Paths of the CSV files
+        use_cache: Whether to read and write parsed-input caches
+        stats: Dictionary that receives timing statistics (see new_read_stats)
+    
+    Yields:
+        Tuples of (applicant_id, source file, absence periods)
+    
+    Raises:
+        ValueError: If the rows of an applicant are not grouped together
+    """
+    stats = stats if stats is not None else new_read_stats()
+    for csv_file_path in csv_files:
+        cached = load_cached_applicants(csv_file_path) if use_cache else None
+        if cached is not None:
+            applicants, original_parse_seconds = cached
+            stats['cached_files'] += 1
+            stats['saved_seconds'] += original_parse_seconds
+            for applicant_id, absence_periods in _timed(applicants, stats, 'cache_seconds'):
+                yield applicant_id, csv_file_path, absence_periods
+            continue
+        
+        stats['parsed_files'] += 1
+        applicants = _timed(read_csv_applicants(csv_file_path), stats, 'parse_seconds')
+        if use_cache:
+            applicants = write_cache_while_reading(csv_file_path, applicants, stats)
+        for applicant_id, absence_periods in applicants:
+            yield applicant_id, csv_file_path, absence_periods
+    
+    # What the cached files would have cost to parse, minus what loading them cost
+    stats['saved_seconds'] = max(0.0, stats['saved_seconds'] - stats['cache_seconds']) if stats['cached_files'] else 0.0
+
+
+def new_read_stats() -> Dict[str, Any]:
+    """Empty timing statistics for iter_applicants"""
+    return {'parsed_files': 0, 'parse_seconds': 0.0, 'cached_files': 0, 'cache_seconds': 0.0, 'saved_seconds': 0.0}
+
+
+def clear_caches(csv_files: List[str]) -> int:
+    """
+    Delete the parsed-input caches of a list of CSV files.
+    
+    Returns:
+        Number of caches deleted
+    """
+    removed = 0
+    for csv_file_path in csv_files:
+        try:
+            os.remove(cache_path_for(csv_file_path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def summarize_applicant(job: Tuple[str, str, List[Tuple[datetime, datetime]], datetime, List[RuleSet], str]) -> Dict[str, Any]:
+    """
+    Check the 180-day rule, and any further rule sets, for one applicant of a batch.
+    
+    Runs in a worker process, so only the summary is sent back and not the
+    detailed periods. All rule sets are checked in one pass over the periods.
+    
+    Args:
+        job: Tuple of (applicant_id, source file, absence periods, decision date, further rule sets,
+            calculation backend or None for the default)
+    
+    Returns:
+        Summary row for the batch output, with '<rule set>_complies' and
+        '<rule set>_worst_period_days' columns for every further rule set
+    """
+    applicant_id, source, absence_periods, decision_date, rule_sets, backend = job
+    summary = {
+        'applicant_id': applicant_id,
+        'source': source,
+        'periods': len(absence_periods),
+        'complies': None,
+        'total_days_absent': None,
+        'worst_period': None,
+        'worst_period_days': None,
+        'error': None,
+    }
+    for rule_set in rule_sets:
+        summary[f'{rule_set.name}_complies'] = None
+        summary[f'{rule_set.name}_worst_period_days'] = None
+    try:
+        evaluated = [DEFAULT_RULE_SET] + [rule_set for rule_set in rule_sets if rule_set != DEFAULT_RULE_SET]
+        results = evaluate_rule_sets(absence_periods, decision_date, evaluated, backend)
+        result = results[DEFAULT_RULE_SET.name]
+        summary['complies'] = result.complies
+        summary['total_days_absent'] = result.total_days_absent
+        summary['worst_period'] = result.worst_period
+        summary['worst_period_days'] = result.worst_period_days
+        for rule_set in rule_sets:
+            summary[f'{rule_set.name}_complies'] = results[rule_set.name].complies
+            summary[f'{rule_set.name}_worst_period_days'] = results[rule_set.name].worst_period_days
+    except Exception as e:
+        summary['error'] = str(e)
+    return summary
+
+
+def run_batch(inputs: List[str], decision_date: datetime, jobs: int = None, progress: bool = True,
+              use_cache: bool = True, clear_cache: bool = False, stats: Dict[str, Any] = None,
+              rule_sets: List[RuleSet] = None, backend: str = None) -> List[Dict[str, Any]]:
+    """
+    Calculate the 180-day rule for every applicant in a set of CSV files.
+    
+    Applicants are spread over a pool of worker processes. At most a few jobs
+    per worker are queued at a time, so the input is never read far ahead of
+    the workers.
+    
+    Args:
+        inputs: CSV files, directories or glob patterns
+        decision_date: The date of decision used for every applicant
+        jobs: Number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+        progress: Whether to report progress on stderr
+        use_cache: Whether to read and write parsed-input caches next to the CSV files
+        clear_cache: Whether to delete the caches of the CSV files first
+        stats: Dictionary that receives the input timing statistics (see new_read_stats)
+        rule_sets: Further rule sets to check besides the 180-day rule
+        backend: Calculation backend (see absence_engine), or None for the default
+    
+    Returns:
+        List of applicant summaries in input order
+    """
+    jobs = jobs or os.cpu_count() or 1
+    csv_files = find_csv_files(inputs)
+    if clear_cache:
+        clear_caches(csv_files)
+    stats = stats if stats is not None else new_read_stats()
+    rule_sets = rule_sets or []
+    applicants = ((applicant_id, source, periods, decision_date, rule_sets, backend)
+                  for applicant_id, source, periods in iter_applicants(csv_files, use_cache, stats))
+    
+    # Summaries by input position, as workers may finish out of order
+    summaries: Dict[int, Dict[str, Any]] = {}
+    started = time.perf_counter()
+    last_report = 0.0
+    
+    def report(final=False):
+        nonlocal last_report
+        now = time.perf_counter()
+        if not progress or (not final and now - last_report < 0.5):
+            return
+        last_report = now
+        elapsed = now - started
+        rate = len(summaries) / elapsed if elapsed > 0 else 0.0
+        print(f"\rProcessed {len(summaries)} applicants from {len(csv_files)} files ({rate:.1f}/s)", end='\n' if final else '', file=sys.stderr)
+    
+    if jobs == 1:
+        for index, job in enumerate(applicants):
+            summaries[index] = summarize_applicant(job)
+            report()
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            positions = {}
+            
+            def collect(done):
+                for future in done:
+                    summaries[positions.pop(future)] = future.result()
+                report()
+            
+            for index, job in enumerate(applicants):
+                future = executor.submit(summarize_applicant, job)
+                positions[future] = index
+                # Keep a bounded number of jobs in flight
+                if len(positions) >= jobs * 4:
+                    done, _ = wait(positions, return_when=FIRST_COMPLETED)
+                    collect(done)
+            while positions:
+                done, _ = wait(positions, return_when=FIRST_COMPLETED)
+                collect(done)
+    
+    report(final=True)
+    return [summaries[index] for index in range(len(summaries))]
+
+
+def write_summary(summaries: List[Dict[str, Any]], output_path: str):
+    """
+    Write the batch summaries to a CSV or JSON file.
+    
+    Args:
+        summaries: Applicant summaries from run_batch
+        output_path: Output file; a .json extension writes JSON, anything else CSV
+    """
+    if output_path.lower().endswith('.json'):
+        with open(output_path, 'w') as output_file:
+            json.dump(summaries, output_file, indent=2)
+            output_file.write('\n')
+        return
+    
+    fieldnames = ['applicant_id', 'source', 'periods', 'complies', 'total_days_absent', 'worst_period', 'worst_period_days', 'error']
+    if summaries:
+        # Columns of further rule sets follow the standard ones
+        fieldnames += [key for key in summaries[0] if key not in fieldnames]
+    with open(output_path, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
 def example_usage():
     """
     Example of how to use the calculate_180_day_rule function.
@@ -267,9 +635,116 @@ def restore_sample_data():
     print("Sample data has been restored.")
 
 
+def plan_command(csv_file_path: str, departure_dates: List[datetime], rule_set: RuleSet) -> int:
+    """
+    Print the longest trip from each departure date that keeps a rule set.
+    
+    Args:
+        csv_file_path: CSV file with the absence periods so far
+        departure_dates: Departure dates of the candidate trips
+        rule_set: Rule set the trips must comply with
+    
+    Returns:
+        Process exit status
+    """
+    try:
+        absence_periods = read_absence_periods_from_csv(csv_file_path)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    print(f"Longest trips under {rule_set.name}: {rule_set.description}")
+    for trip in plan_trips(absence_periods, [departure_date.date() for departure_date in departure_dates], rule_set):
+        if trip.max_days_absent == 0:
+            print(f"Leaving {trip.departure_date}: no day abroad keeps the rule")
+        else:
+            print(f"Leaving {trip.departure_date}: up to {trip.max_days_absent} days abroad, "
+                  f"returning by {trip.latest_return_date}")
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Command line entry point.
+    
+    Without a command the example is run on absence_periods.csv. The 'batch'
+    command processes many applicants in parallel, and the 'plan' command finds
+    the longest trip from each of several departure dates.
+    
+    Args:
+        argv: Command line arguments (defaults to sys.argv[1:])
+    
+    Returns:
+        Process exit status
+    """
+    parser = argparse.ArgumentParser(description="Check the UK 180-day absence rule")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    batch_parser = subparsers.add_parser('batch', help="Check many applicants and write a summary file")
+    batch_parser.add_argument('inputs', nargs='+',
+                              help="CSV files, directories or glob patterns; CSV files with an applicant_id column may hold many applicants")
+    batch_parser.add_argument('--decision-date', type=parse_date, default=None,
+                              help="Decision date as YYYY-MM-DD (default: today)")
+    batch_parser.add_argument('--jobs', '-j', type=int, default=None,
+                              help="Number of worker processes (default: number of CPUs)")
+    batch_parser.add_argument('--output', '-o', default='batch_summary.csv',
+                              help="Summary file; .json writes JSON, anything else CSV (default: batch_summary.csv)")
+    batch_parser.add_argument('--no-progress', action='store_true', help="Do not report progress on stderr")
+    batch_parser.add_argument('--no-cache', action='store_true',
+                              help=f"Parse every CSV file without reading or writing the {CACHE_SUFFIX} files next to it")
+    batch_parser.add_argument('--clear-cache', action='store_true',
+                              help=f"Delete the {CACHE_SUFFIX} files of the inputs before running")
+    batch_parser.add_argument('--rules', default='',
+                              help=f"Comma-separated further rule sets to check, adding columns per rule set ({', '.join(RULE_SETS)})")
+    batch_parser.add_argument('--backend', choices=available_backends(), default=None,
+                              help="Calculation backend (default: ABSENCE_ENGINE_BACKEND, or prefix_sum)")
+    
+    plan_parser = subparsers.add_parser('plan', help="Find the longest trip from each departure date that keeps the rule")
+    plan_parser.add_argument('csv_file', help="CSV file with the absence periods so far (start_date, end_date)")
+    plan_parser.add_argument('departure_dates', nargs='+', type=parse_date,
+                             help="Departure dates as YYYY-MM-DD")
+    plan_parser.add_argument('--rule', choices=list(RULE_SETS), default=DEFAULT_RULE_SET.name,
+                             help=f"Rule set the trips must comply with (default: {DEFAULT_RULE_SET.name})")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'plan':
+        return plan_command(args.csv_file, args.departure_dates, RULE_SETS[args.rule])
+    
+    if args.command != 'batch':
+        # Only create a sample CSV file if it doesn't exist
+        if not os.path.exists('absence_periods.csv'):
+            create_sample_csv()
+        # Run the example
+        example_usage()
+        return 0
+    
+    rule_names = [name.strip() for name in args.rules.split(',') if name.strip()]
+    unknown = [name for name in rule_names if name not in RULE_SETS]
+    if unknown:
+        print(f"Error: unknown rule sets: {', '.join(unknown)} (available: {', '.join(RULE_SETS)})", file=sys.stderr)
+        return 2
+    
+    decision_date = args.decision_date or parse_date(datetime.now().strftime('%Y-%m-%d'))
+    stats = new_read_stats()
+    try:
+        summaries = run_batch(args.inputs, decision_date, jobs=args.jobs, progress=not args.no_progress,
+                              use_cache=not args.no_cache, clear_cache=args.clear_cache, stats=stats,
+                              rule_sets=[RULE_SETS[name] for name in rule_names], backend=args.backend)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    write_summary(summaries, args.output)
+    
+    print(f"Input: parsed {stats['parsed_files']} files in {stats['parse_seconds']:.2f}s, "
+          f"loaded {stats['cached_files']} from cache in {stats['cache_seconds']:.2f}s "
+          f"(parse time saved: {stats['saved_seconds']:.2f}s)")
+    
+    failing = sum(1 for summary in summaries if summary['complies'] is False)
+    errors = sum(1 for summary in summaries if summary['error'])
+    print(f"Wrote {len(summaries)} applicant summaries to {args.output} ({failing} do not comply, {errors} errors)")
+    return 0
+
+
 if __name__ == "__main__":
-    # Only create a sample CSV file if it doesn't exist
-    if not os.path.exists('absence_periods.csv'):
-        create_sample_csv()
-    # Run the example
-    example_usage()
+    sys.exit(main())
@@ -6,11 +6,15 @@
 #   ./dev.sh restart - Restart all servers
 #   ./dev.sh stop - Stop all servers
 #   ./dev.sh init-db - Initialize database schema
+#   ./dev.sh migrate [CSV files] [--user NAME] - Initialize the schema and bulk load CSV files
+#   ./dev.sh lite - Start backend and frontend on an SQLite file (no Docker needed)
 
 # Configuration
 BACKEND_PORT=5001
 FRONTEND_PORT=8000
 PROJECT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+# Directory the script was run from, for relative paths in arguments
+CALLER_DIR="$(pwd)"
 SERVER_DIR="$PROJECT_DIR/server"
 VENV_DIR="$SERVER_DIR/venv"
 VENV_ACTIVATE="$VENV_DIR/bin/activate"
@@ -29,6 +33,10 @@ PG_PASSWORD="postgres"
 PG_DB="absence_calculator"
 PG_DATA_DIR="$PROJECT_DIR/.postgres_data"
 
+# SQLite configuration (used by the lite command)
+SQLITE_DATA_DIR="$PROJECT_DIR/.sqlite_data"
+SQLITE_PATH="$SQLITE_DATA_DIR/absence_calculator.sqlite3"
+
 # Function to check if a port is in use
 is_port_in_use() {
     lsof -i :"$1" >/dev/null 2>&1
@@ -185,7 +193,7 @@ initialize_database() {
     
     # Create database schema using Tortoise ORM models
     cd "$SERVER_DIR"
-    python -c "from models import run_schema_migration; run_schema_migration()" || {
+    python migrations.py || {
         echo "Error: Failed to initialize database schema."
         return 1
     }
@@ -194,6 +202,38 @@ initialize_database() {
     return 0
 }
 
+# Function to bulk load absence periods from CSV files into PostgreSQL
+load_csv_files() {
+    echo "Loading absence periods from CSV files..."
+    
+    # Activate virtual environment
+    source "$VENV_ACTIVATE"
+    
+    # Set environment variables for database connection
+    export DB_USER="$PG_USER"
+    export DB_PASSWORD="$PG_PASSWORD"
+    export DB_HOST="localhost"
+    export DB_PORT="$PG_PORT"
+    export DB_NAME="$PG_DB"
+    
+    # Files given relative to the caller's directory are found from the server directory
+    local args=()
+    for arg in "$@"; do
+        if [[ "$arg" != /* && -f "$CALLER_DIR/$arg" ]]; then
+            arg="$CALLER_DIR/$arg"
+        fi
+        args+=("$arg")
+    done
+    
+    cd "$SERVER_DIR"
+    python bulk_load.py "${args[@]}" || {
+        echo "Error: Failed to load CSV files."
+        return 1
+    }
+    
+    return 0
+}
+
 # Function to start the backend server
 start_backend() {
     echo "Starting backend server..."
@@ -254,6 +294,47 @@ start_backend() {
     return 1
 }
 
+# Function to start the backend server on SQLite (single-node mode)
+start_backend_lite() {
+    echo "Starting backend server on SQLite ($SQLITE_PATH)..."
+    
+    # Check if the port is in use
+    if is_port_in_use "$BACKEND_PORT"; then
+        echo "Error: Port $BACKEND_PORT is already in use. Cannot start backend server."
+        return 1
+    fi
+    
+    # Create logs and data directories if they don't exist
+    mkdir -p "$LOGS_DIR" "$SQLITE_DATA_DIR"
+    
+    # Activate virtual environment
+    source "$VENV_ACTIVATE"
+    
+    # Select the SQLite backend
+    export DB_BACKEND="sqlite"
+    export DB_SQLITE_PATH="$SQLITE_PATH"
+    
+    # Start the backend server
+    cd "$SERVER_DIR"
+    nohup uvicorn app:app --host 0.0.0.0 --port "$BACKEND_PORT" > "$BACKEND_LOG" 2>&1 &
+    BACKEND_PID=$!
+    echo $BACKEND_PID > "$PID_FILE.backend"
+    
+    # Wait for the server to start
+    echo "Waiting for backend server to start..."
+    for i in {1..10}; do
+        if curl -s http://localhost:$BACKEND_PORT/api/health > /dev/null; then
+            echo "Backend server started successfully!"
+            return 0
+        fi
+        echo -n "."
+        sleep 1
+    done
+    
+    echo "\nError: Backend server failed to start within 10 seconds."
+    return 1
+}
+
 # Function to start the frontend server
 start_frontend() {
     echo "Starting frontend server on port $FRONTEND_PORT..."
@@ -512,9 +593,40 @@ case "$1" in
         ensure_postgres || exit 1
         initialize_database
         ;;
+    migrate)
+        check_venv
+        
+        # Ensure PostgreSQL is running (will try to start Docker if needed)
+        ensure_postgres || exit 1
+        initialize_database || exit 1
+        
+        # Bulk load any CSV files given after the command
+        if [ $# -gt 1 ]; then
+            load_csv_files "${@:2}" || exit 1
+        fi
+        ;;
     pg-status)
         check_postgres_status
         ;;
+    lite)
+        # Stop any existing servers
+        stop_servers
+        
+        # Check requirements
+        check_venv
+        
+        # Start application servers on SQLite
+        start_backend_lite || exit 1
+        start_frontend
+        open_browser
+        
+        echo ""
+        echo "180-Day Rule Calculator is now running with SQLite!"
+        echo "Database file: $SQLITE_PATH"
+        echo "Backend server: http://localhost:$BACKEND_PORT"
+        echo "Frontend interface: http://localhost:$FRONTEND_PORT"
+        echo "Use './dev.sh stop' to stop all servers."
+        ;;
     frontend)
         # Only start the frontend server
         echo "Starting only the frontend server..."
@@ -544,13 +656,16 @@ case "$1" in
         echo "Use './dev.sh stop' to stop all servers."
         ;;
     *)
-        echo "Usage: $0 {start|restart|stop|logs|init-db|pg-status|frontend}"
+        echo "Usage: $0 {start|restart|stop|logs|init-db|migrate|pg-status|lite|frontend}"
         echo "  start     - Start PostgreSQL, backend, and frontend servers"
         echo "  restart   - Restart all servers"
         echo "  stop      - Stop all servers"
         echo "  logs      - View server logs (press Ctrl+C to exit)"
         echo "  init-db   - Initialize database schema"
+        echo "  migrate   - Initialize database schema, then bulk load the CSV files given"
+        echo "              (e.g. ./dev.sh migrate legacy/*.csv --user alice)"
         echo "  pg-status - Check PostgreSQL container status"
+        echo "  lite      - Start backend and frontend on SQLite (no Docker needed)"
         echo "  frontend  - Start only the frontend server"
         exit 1
         ;;
@@ -0,0 +1,531 @@
+"""
+Load-testing harness for the Absence Calculator API.
+
+Starts the FastAPI server (or targets one that is already running), seeds users
+with realistic absence periods and drives a weighted mix of login, list, create,
+update and calculate requests at a fixed target rate. Results are written as a
+JSON report that records the scenario version, so runs can be compared.
+
+Usage:
+    python loadtest/run.py run loadtest/scenarios/mixed.json --db sqlite
+    python loadtest/run.py run loadtest/scenarios/mixed.json --db postgres
+    python loadtest/run.py run loadtest/scenarios/mixed.json --base-url http://localhost:5001
+    python loadtest/run.py compare loadtest/reports/old.json loadtest/reports/new.json
+"""
+from datetime import date, datetime, timedelta
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(LOADTEST_DIR)
+SERVER_DIR = os.path.join(REPO_ROOT, "server")
+DEFAULT_REPORT_DIR = os.path.join(LOADTEST_DIR, "reports")
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+from histories import generate_history  # noqa: E402
+
+REPORT_VERSION = 1
+OPERATIONS = ["login", "list", "create", "update", "calculate"]
+PASSWORD = "loadtest-password"
+
+# PostgreSQL container used by --db postgres
+PG_CONTAINER_NAME = "absence-calculator-db-loadtest"
+PG_PORT = 5433
+PG_USER = "postgres"
+PG_PASSWORD = "postgres"
+PG_DB = "absence_calculator"
+
+
+def load_scenario(path):
+    """Load a scenario file and check that it is complete"""
+    with open(path, "r") as scenario_file:
+        scenario = json.load(scenario_file)
+
+    required = ["name", "version", "users", "seed_periods", "rate", "duration_seconds", "mix"]
+    missing = [key for key in required if key not in scenario]
+    if missing:
+        raise ValueError(f"Scenario {path} is missing: {', '.join(missing)}")
+
+    unknown = set(scenario["mix"]) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Scenario {path} has unknown operations: {', '.join(sorted(unknown))}")
+
+    scenario.setdefault("warmup_seconds", 0)
+    scenario.setdefault("max_in_flight", 100)
+    return scenario
+
+
+def free_port():
+    """Ask the OS for a free TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    """Return the current git commit of the repository, if available"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_postgres():
+    """Start a throwaway PostgreSQL container and return the DB_* environment"""
+    if not shutil.which("docker"):
+        raise RuntimeError("Docker is required for --db postgres")
+
+    subprocess.run(["docker", "rm", "-f", PG_CONTAINER_NAME], capture_output=True)
+    subprocess.run(
+        [
+            "docker", "run", "-d", "--rm",
+            "--name", PG_CONTAINER_NAME,
+            "-e", f"POSTGRES_USER={PG_USER}",
+            "-e", f"POSTGRES_PASSWORD={PG_PASSWORD}",
+            "-e", f"POSTGRES_DB={PG_DB}",
+            "-p", f"{PG_PORT}:5432",
+            "postgres:15",
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+    print("Waiting for PostgreSQL to start...")
+    for _ in range(60):
+        ready = subprocess.run(
+            ["docker", "exec", PG_CONTAINER_NAME, "pg_isready", "-U", PG_USER], capture_output=True
+        )
+        if ready.returncode == 0:
+            break
+        time.sleep(1)
+    else:
+        raise RuntimeError("PostgreSQL container did not become ready")
+
+    return {
+        "DB_AUTO_MIGRATE": "1",
+        "DB_USER": PG_USER,
+        "DB_PASSWORD": PG_PASSWORD,
+        "DB_HOST": "localhost",
+        "DB_PORT": str(PG_PORT),
+        "DB_NAME": PG_DB,
+    }
+
+
+def stop_postgres():
+    """Stop the throwaway PostgreSQL container (it is removed automatically)"""
+    subprocess.run(["docker", "stop", PG_CONTAINER_NAME], capture_output=True)
+
+
+def start_server(db_env, port, log_path):
+    """
+    Start the API server in a subprocess.
+
+    Args:
+        db_env: Environment variables that select the database
+        port: Port to listen on
+        log_path: File that receives the server output
+
+    Returns:
+        The server process
+    """
+    env = dict(os.environ)
+    env.update(db_env)
+    # All simulated users log in at once, more than the login route admits at a
+    # time; admission control stays off unless ADMISSION_ENABLED is set explicitly
+    env.setdefault("ADMISSION_ENABLED", "0")
+    log_file = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=SERVER_DIR,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_for_server(base_url, process=None, timeout=60):
+    """Wait until the health endpoint answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout} seconds")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class Stats:
+    """Latencies and status codes per operation"""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.statuses = {name: {} for name in OPERATIONS}
+        self.errors = {name: 0 for name in OPERATIONS}
+        self.dropped = 0
+
+    def record(self, operation, seconds, status):
+        self.latencies[operation].append(seconds)
+        self.statuses[operation][status] = self.statuses[operation].get(status, 0) + 1
+        if status == "error" or int(status) >= 400:
+            self.errors[operation] += 1
+
+    def summary(self, duration):
+        """Build the per-endpoint section of the report"""
+        endpoints = {}
+        for operation in OPERATIONS:
+            latencies = sorted(self.latencies[operation])
+            if not latencies:
+                continue
+            endpoints[operation] = {
+                "requests": len(latencies),
+                "errors": self.errors[operation],
+                "throughput_rps": round(len(latencies) / duration, 2),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+                "status": dict(sorted(self.statuses[operation].items())),
+            }
+        return endpoints
+
+
+class VirtualUser:
+    """A seeded user and the absence periods the harness knows about"""
+
+    def __init__(self, username):
+        self.username = username
+        self.token = None
+        self.period_ids = []
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def login(client, user):
+    response = await client.post("/api/login", json={"username": user.username, "password": PASSWORD})
+    if response.status_code == 200:
+        user.token = response.json()["access_token"]
+    return response
+
+
+def random_trip(rng):
+    """A short trip somewhere in the last five years"""
+    start_date = date.today() - timedelta(days=rng.randint(30, 5 * 365))
+    end_date = start_date + timedelta(days=rng.randint(1, 21))
+    return {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+
+
+async def seed_users(client, scenario, run_id, concurrency=10):
+    """
+    Create the scenario's users, log them in and give them absence periods.
+
+    Returns:
+        List of VirtualUser objects
+    """
+    seed = scenario["seed_periods"]
+    semaphore = asyncio.Semaphore(concurrency)
+    users = [VirtualUser(f"lt{run_id}u{index}") for index in range(scenario["users"])]
+
+    async def seed_user(index, user):
+        async with semaphore:
+            response = await client.post("/api/signup", json={
+                "username": user.username,
+                "email": f"{user.username}@loadtest.example.com",
+                "password": PASSWORD,
+            })
+            response.raise_for_status()
+            (await login(client, user)).raise_for_status()
+
+            history = generate_history(seed["count"], seed["profile"], seed["horizon_years"],
+                                       date.today(), seed=index)
+            for start_date, end_date in history:
+                response = await client.post("/api/absence-periods", headers=user.headers, json={
+                    "start_date": start_date.isoformat(),
+                    "end_date": end_date.isoformat(),
+                })
+                response.raise_for_status()
+                user.period_ids.append(response.json()["id"])
+
+    await asyncio.gather(*(seed_user(index, user) for index, user in enumerate(users)))
+    return users
+
+
+async def perform(client, operation, user, rng):
+    """Send one request for an operation and return its response"""
+    if operation == "login":
+        return await login(client, user)
+    if operation == "list":
+        return await client.get("/api/absence-periods", headers=user.headers)
+    if operation == "create":
+        response = await client.post("/api/absence-periods", headers=user.headers, json=random_trip(rng))
+        if response.status_code == 200:
+            user.period_ids.append(response.json()["id"])
+        return response
+    if operation == "update":
+        if not user.period_ids:
+            return await client.get("/api/absence-periods", headers=user.headers)
+        period_id = rng.choice(user.period_ids)
+        return await client.put(f"/api/absence-periods/{period_id}", headers=user.headers, json=random_trip(rng))
+    if operation == "calculate":
+        return await client.post("/api/calculate", headers=user.headers,
+                                 json={"decision_date": date.today().isoformat()})
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+async def drive_traffic(client, users, scenario, stats, rng):
+    """
+    Issue requests at the scenario's target rate (open loop).
+
+    Requests are scheduled on a fixed clock regardless of how long earlier
+    requests take. When max_in_flight requests are outstanding, new requests
+    are dropped and counted instead of queueing up in the client.
+
+    Returns:
+        Length of the measured window in seconds
+    """
+    loop = asyncio.get_running_loop()
+    operations = list(scenario["mix"])
+    weights = [scenario["mix"][name] for name in operations]
+    interval = 1.0 / scenario["rate"]
+    warmup = scenario["warmup_seconds"]
+    started = loop.time()
+    measure_from = started + warmup
+    finish_at = measure_from + scenario["duration_seconds"]
+    in_flight = set()
+
+    async def timed(operation, user, measured):
+        request_started = time.perf_counter()
+        try:
+            response = await perform(client, operation, user, rng)
+            status = str(response.status_code)
+        except httpx.HTTPError:
+            status = "error"
+        if measured:
+            stats.record(operation, time.perf_counter() - request_started, status)
+
+    tick = 0
+    while True:
+        scheduled = started + tick * interval
+        if scheduled >= finish_at:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tick += 1
+
+        measured = scheduled >= measure_from
+        if len(in_flight) >= scenario["max_in_flight"]:
+            if measured:
+                stats.dropped += 1
+            continue
+
+        operation = rng.choices(operations, weights)[0]
+        task = asyncio.create_task(timed(operation, rng.choice(users), measured))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return max(loop.time() - measure_from, 1e-9)
+
+
+async def run_load(base_url, scenario, seed):
+    """Seed the users and drive the scenario against a running server"""
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=scenario["max_in_flight"], max_keepalive_connections=scenario["max_in_flight"])
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        print(f"Seeding {scenario['users']} users with {scenario['seed_periods']['count']} periods each...")
+        users = await seed_users(client, scenario, run_id)
+
+        print(f"Driving {scenario['rate']} req/s for {scenario['duration_seconds']}s "
+              f"(+{scenario['warmup_seconds']}s warm-up)...")
+        stats = Stats()
+        duration = await drive_traffic(client, users, scenario, stats, rng)
+
+    return stats, duration
+
+
+def build_report(scenario, target, stats, duration):
+    """Assemble the JSON report of one run"""
+    endpoints = stats.summary(duration)
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "report_version": REPORT_VERSION,
+        "scenario": scenario,
+        "target": target,
+        "git_commit": git_commit(),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "summary": {
+            "duration_seconds": round(duration, 2),
+            "target_rps": scenario["rate"],
+            "requests": total,
+            "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+            "dropped": stats.dropped,
+            "throughput_rps": round(total / duration, 2),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report):
+    summary = report["summary"]
+    print(f"\nScenario {report['scenario']['name']} v{report['scenario']['version']} "
+          f"against {report['target']['db'] or report['target']['base_url']}")
+    print(f"{summary['requests']} requests in {summary['duration_seconds']}s: "
+          f"{summary['throughput_rps']} req/s (target {summary['target_rps']}), "
+          f"{summary['errors']} errors, {summary['dropped']} dropped\n")
+    print(f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, endpoint in report["endpoints"].items():
+        print(f"{name:<12}{endpoint['requests']:>10}{endpoint['errors']:>8}{endpoint['throughput_rps']:>9}"
+              f"{endpoint['p50_ms']:>10}{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}")
+
+
+def write_report(report, report_dir):
+    """Write the report as <scenario>-v<version>-<timestamp>.json"""
+    os.makedirs(report_dir, exist_ok=True)
+    scenario = report["scenario"]
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(report_dir, f"{scenario['name']}-v{scenario['version']}-{timestamp}.json")
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+        report_file.write("\n")
+    return path
+
+
+def command_run(args):
+    scenario = load_scenario(args.scenario)
+    for key in ("users", "rate", "duration_seconds"):
+        override = getattr(args, key)
+        if override is not None:
+            scenario[key] = override
+
+    process = None
+    work_dir = tempfile.mkdtemp(prefix="absence-loadtest-")
+    use_postgres = args.db == "postgres" and not args.base_url
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+        else:
+            if use_postgres:
+                db_env = start_postgres()
+            else:
+                db_env = {"DB_BACKEND": "sqlite", "DB_SQLITE_PATH": os.path.join(work_dir, "loadtest.sqlite3")}
+            port = args.port or free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            log_path = os.path.join(work_dir, "server.log")
+            print(f"Starting server on {base_url} ({args.db}), log: {log_path}")
+            process = start_server(db_env, port, log_path)
+
+        wait_for_server(base_url, process)
+        stats, duration = asyncio.run(run_load(base_url, scenario, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if use_postgres:
+            stop_postgres()
+
+    target = {"db": None if args.base_url else args.db, "base_url": base_url}
+    report = build_report(scenario, target, stats, duration)
+    print_report(report)
+    path = write_report(report, args.report_dir)
+    print(f"\nReport written to {path}")
+    return 0
+
+
+def command_compare(args):
+    with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current, "r") as current_file:
+        current = json.load(current_file)
+
+    for report in (baseline, current):
+        scenario = report["scenario"]
+        print(f"{scenario['name']} v{scenario['version']} @ {report.get('git_commit')} ({report['finished_at']})")
+    if (baseline["scenario"]["name"], baseline["scenario"]["version"]) != \
+            (current["scenario"]["name"], current["scenario"]["version"]):
+        print("Warning: the reports come from different scenarios or scenario versions")
+
+    def change(old, new):
+        if not old:
+            return "n/a"
+        return f"{(new - old) / old:+.1%}"
+
+    print(f"\n{'endpoint':<12}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    old_summary, new_summary = baseline["summary"], current["summary"]
+    print(f"{'all':<12}{'throughput_rps':<16}{old_summary['throughput_rps']:>12}"
+          f"{new_summary['throughput_rps']:>12}{change(old_summary['throughput_rps'], new_summary['throughput_rps']):>10}")
+    for name in OPERATIONS:
+        old, new = baseline["endpoints"].get(name), current["endpoints"].get(name)
+        if not old or not new:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            print(f"{name:<12}{metric:<16}{old[metric]:>12}{new[metric]:>12}{change(old[metric], new[metric]):>10}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Absence Calculator API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a load-test scenario")
+    run_parser.add_argument("scenario", help="Scenario JSON file")
+    run_parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite",
+                            help="Database for the server started by the harness (default: sqlite)")
+    run_parser.add_argument("--base-url", help="Target an already running server instead of starting one")
+    run_parser.add_argument("--port", type=int, help="Port for the server started by the harness")
+    run_parser.add_argument("--users", type=int, help="Override the number of users")
+    run_parser.add_argument("--rate", type=float, help="Override the target rate in requests per second")
+    run_parser.add_argument("--duration", dest="duration_seconds", type=float, help="Override the duration in seconds")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed for the traffic mix")
+    run_parser.add_argument("--report-dir", default=DEFAULT_REPORT_DIR, help="Directory for the JSON report")
+    run_parser.set_defaults(handler=command_run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two reports")
+    compare_parser.add_argument("baseline", help="Earlier report")
+    compare_parser.add_argument("current", help="Later report")
+    compare_parser.set_defaults(handler=command_compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
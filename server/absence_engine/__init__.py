@@ -0,0 +1,24 @@
+"""
+The absence rule calculation, shared by the server and the command line version.
+
+    from absence_engine import evaluate_rule_sets, RULE_SETS
+    results = evaluate_rule_sets(absence_periods, decision_date, [RULE_SETS["uk_ilr_5y"]])
+
+Rule sets are evaluated by one of several backends, which return the same
+RuleResult for the same input: 'reference' counts day by day as the rule is
+written, 'prefix_sum' (the default) counts windows from prefix sums, and
+'vectorized' does the same with NumPy arrays. Overlapping periods are
+merged before any backend sees them. tests/test_differential.py checks
+every backend against the reference. chart.py downsamples the windows of a
+result for drawing, and planner.py finds the longest trip that keeps a rule
+set's windows within its threshold.
+"""
+from .rules import RuleSet, RULE_SETS, DEFAULT_RULE_SET, get_rule_sets
+from .result import RuleResult, window_keys
+from .registry import register_backend, get_backend, available_backends, DEFAULT_BACKEND
+from .calculation import evaluate_rule_sets, calculate_180_day_rule, merge_periods
+from .chart import chart_series, peak_buckets
+from .planner import TripPlan, TripPlanner, plan_trips
+
+# Importing the backends registers them
+from . import reference, prefix_sum, vectorized  # noqa: F401,E402
@@ -0,0 +1,103 @@
+from datetime import date, datetime
+from typing import List, Tuple, Dict, Any, Iterable, Optional
+
+from .registry import get_backend
+from .result import RuleResult
+from .rules import RuleSet, DEFAULT_RULE_SET
+
+
+def merge_periods(absence_periods: Iterable[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """
+    Combine overlapping absence periods into the minimal set of periods with the
+    same absence days, each day counted once.
+
+    Periods without any absence day (ending on or the day after their start) are
+    left out.
+
+    Args:
+        absence_periods: (start_date, end_date) tuples in any order
+
+    Returns:
+        Sorted (start_date, end_date) tuples that do not overlap
+    """
+    merged = []
+    for start_date, end_date in sorted(absence_periods):
+        if (end_date - start_date).days < 2:
+            continue
+        if merged and start_date < merged[-1][1]:
+            if end_date > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end_date)
+        else:
+            merged.append((start_date, end_date))
+    return merged
+
+
+def evaluate_rule_sets(absence_periods: List[Tuple[date, date]], decision_date: date, rule_sets: List[RuleSet],
+                       backend: Optional[str] = None) -> Dict[str, RuleResult]:
+    """
+    Evaluate several rule sets against the same absence periods.
+
+    Overlapping periods are merged first, so a day covered by several periods
+    is counted once whichever backend evaluates them and whoever calls.
+
+    Args:
+        absence_periods: List of tuples containing (start_date, end_date) of periods spent outside the UK
+            (dates or datetimes; the start and end date themselves are not absences)
+        decision_date: The date of decision
+        rule_sets: Rule sets to evaluate
+        backend: Name of the calculation backend (default: ABSENCE_ENGINE_BACKEND, or prefix_sum)
+
+    Returns:
+        Dictionary mapping rule set names to their RuleResult
+    """
+    # Results carry plain dates, whether the caller works with dates or datetimes
+    if isinstance(decision_date, datetime):
+        decision_date = decision_date.date()
+    return get_backend(backend)(merge_periods(absence_periods), decision_date, rule_sets)
+
+
+def calculate_180_day_rule(absence_periods: List[Tuple[date, date]], decision_date: date,
+                           rule_sets: Optional[List[RuleSet]] = None, backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Calculate if the 180-day rule is satisfied for UK residency applications.
+
+    The 180-day rule states that an applicant must not have spent more than 180 days
+    outside the UK in any rolling 12-month period during the qualifying period.
+
+    This 12-month period is not considered as fixed calendar years, but as periods
+    that slide back from the decision date.
+
+    Args:
+        absence_periods: List of tuples containing (start_date, end_date) of periods spent outside the UK
+        decision_date: The date of decision
+        rule_sets: Further rule sets to evaluate against the same absence days
+        backend: Name of the calculation backend (see evaluate_rule_sets)
+
+    Returns:
+        Dictionary containing, whether or not there are absences:
+            - 'decision_date': The decision date
+            - 'qualifying_start': Start of the qualifying period
+            - 'total_days_absent': Days absent after the start of the qualifying period
+            - 'worst_period': The 12-month period with the highest number of absence days, or None
+            - 'worst_period_days': Number of days absent in the worst period
+            - 'complies': Boolean indicating if the 180-day rule is satisfied
+            - 'detailed_periods': Dictionary with dates as keys and absence days as values
+            - 'rules': Summary of each of the rule_sets by name, if any were given
+    """
+    # The 180-day rule is the default rule set; all rule sets share one pass over the absence days
+    evaluated = [DEFAULT_RULE_SET] + [rule_set for rule_set in rule_sets or [] if rule_set != DEFAULT_RULE_SET]
+    results = evaluate_rule_sets(absence_periods, decision_date, evaluated, backend)
+    result = results[DEFAULT_RULE_SET.name]
+
+    response = {
+        "decision_date": result.decision_date.isoformat(),
+        "qualifying_start": result.qualifying_start.isoformat(),
+        "total_days_absent": result.total_days_absent,
+        "worst_period": result.worst_period,
+        "worst_period_days": result.worst_period_days,
+        "complies": result.complies,
+        "detailed_periods": result.detailed_periods(),
+    }
+    if rule_sets:
+        response["rules"] = {rule_set.name: results[rule_set.name].summary() for rule_set in rule_sets}
+    return response
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from typing import List, Sequence, Dict, Any
+
+from .result import RuleResult
+
+
+def peak_buckets(values: Sequence[int], points: int) -> List[int]:
+    """
+    Choose the values to draw when a series is shown with at most `points` points.
+
+    The first and last value are kept so the chart spans the whole series. The
+    series is split into points // 2 - 1 buckets of consecutive values, and the
+    lowest and highest value of each bucket are kept. Every peak and trough of
+    the series is therefore drawn, and the highest value of all in particular.
+
+    Args:
+        values: The series
+        points: Most points to keep, at least 4
+
+    Returns:
+        Ascending indexes of the values to keep
+    """
+    if points >= len(values):
+        return list(range(len(values)))
+
+    buckets = points // 2 - 1
+    kept = {0, len(values) - 1}
+    for bucket in range(buckets):
+        start = bucket * len(values) // buckets
+        end = (bucket + 1) * len(values) // buckets
+        window = values[start:end]
+        kept.add(start + window.index(min(window)))
+        kept.add(start + window.index(max(window)))
+    return sorted(kept)
+
+
+def chart_series(result: RuleResult, points: int) -> Dict[str, Any]:
+    """
+    Downsample the days absent in every window of a result for a line chart.
+
+    Args:
+        result: The RuleResult to draw
+        points: Most points to return, at least 4
+
+    Returns:
+        Dictionary of the rule set, the worst period and two arrays of the same
+        length, oldest window first:
+            - 'window_ends': End date of each window drawn
+            - 'days_absent': Days absent in that window
+    """
+    # Windows are numbered back from the decision date; charts run forwards in time
+    values = result.window_days_absent[::-1]
+    last = len(values) - 1
+    kept = peak_buckets(values, points)
+
+    return {
+        "rule_set": result.rule_set.name,
+        "decision_date": result.decision_date.isoformat(),
+        "window_days": result.rule_set.window_days,
+        "threshold": result.rule_set.threshold,
+        "windows": len(values),
+        "worst_period": result.worst_period,
+        "worst_period_days": result.worst_period_days,
+        "complies": result.complies,
+        "window_ends": [(result.decision_date - timedelta(days=last - index)).isoformat() for index in kept],
+        "days_absent": [values[index] for index in kept],
+    }
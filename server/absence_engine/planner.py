@@ -0,0 +1,165 @@
+"""
+Trip planning: the longest trip starting on a departure date that keeps every
+window of a rule set within its threshold.
+
+A trip leaving on day X and lasting L days adds the days X + 1 to X + L, and
+the traveller returns on day X + L + 1. Adding days never lowers a window, so
+the longest trip is found by a binary search over L. Each step checks every
+window the trip touches in constant time, from range maxima of series that
+are computed once for all the departure dates of a request.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List, Tuple, Dict, Any, Iterable
+
+from .prefix_sum import AbsenceSeries
+from .rules import RuleSet
+
+
+class RangeMax:
+    """Maximum of any range of a list in constant time, from a sparse table"""
+
+    def __init__(self, values: List[int]):
+        # levels[k][i] is the maximum of values[i:i + 2 ** k]
+        self.levels = [values]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append([max(previous[i], previous[i + width]) for i in range(len(previous) - width)])
+            width *= 2
+
+    def query(self, first: int, last: int) -> int:
+        """Maximum of values[first:last + 1]; the range must not be empty"""
+        level = (last - first + 1).bit_length() - 1
+        values = self.levels[level]
+        return max(values[first], values[last - (1 << level) + 1])
+
+
+@dataclass(frozen=True)
+class TripPlan:
+    """The longest trip from one departure date"""
+    departure_date: date
+    # Days absent of the longest trip; 0 if a single day would break the rule
+    max_days_absent: int
+
+    @property
+    def latest_return_date(self) -> date:
+        """Return date of the longest trip (neither departure nor return day is an absence)"""
+        return self.departure_date + timedelta(days=self.max_days_absent + 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "departure_date": self.departure_date.isoformat(),
+            "max_days_absent": self.max_days_absent,
+            "latest_return_date": self.latest_return_date.isoformat(),
+        }
+
+
+class TripPlanner:
+    """
+    Longest trips that keep every window of a rule set that contains a day of
+    the trip at or below the threshold.
+
+    Windows that do not contain a day of the trip are not changed by it, and are
+    not checked. Days of the trip on which the traveller is already recorded as
+    absent are not counted twice, nor are days of overlapping periods.
+    """
+
+    def __init__(self, absence_periods: List[Tuple[date, date]], rule_set: RuleSet, departure_dates: Iterable[date]):
+        """
+        Args:
+            absence_periods: List of (start_date, end_date) tuples already recorded
+            rule_set: The rule set whose windows a trip must keep within its threshold
+            departure_dates: Every departure date that will be planned
+        """
+        self.rule_set = rule_set
+        window = rule_set.window_days
+        # A trip of more than threshold days breaks every window that holds all of it
+        self.longest = min(rule_set.threshold, window + 1)
+
+        # Windows a trip can touch end from the day after the earliest departure to
+        # window days after the latest trip can end; day ordinals are stored from first
+        departures = [departure_date.toordinal() for departure_date in departure_dates]
+        self.first = min(departures)
+        last = max(departures) + self.longest + window
+        series = AbsenceSeries(absence_periods, self.first - window, last)
+
+        # Days absent from the start of the series, counting a day covered by
+        # overlapping periods once, as evaluate_rule_sets does after merging them
+        absent_days = 0
+        absent_before = [0]
+        for day in range(self.first - window, last + 1):
+            absent_days += series.count(day, day) > 0
+            absent_before.append(absent_days)
+
+        # Per day d: absent[d] is the days absent in the window ending on d, and
+        # free[d] the days from first to d without any absence
+        absent = [absent_before[i + window + 1] - absent_before[i] for i in range(last - self.first + 1)]
+        free = [i + 1 - (absent_before[i + window + 1] - absent_before[window]) for i in range(last - self.first + 1)]
+        self.free = free
+
+        # A trip's days in a window, when it starts inside the window, ends inside
+        # it, or both, are differences of free days; these let each case be
+        # maximised over a range of windows in constant time
+        self.rising = RangeMax([absent[i] + free[i] for i in range(len(absent))])
+        self.covering = RangeMax(absent)
+        self.falling = RangeMax([absent[i] - free[i - window - 1] if i > window else absent[i]
+                                 for i in range(len(absent))])
+
+    def fits(self, departure_day: int, days: int) -> bool:
+        """Whether a trip of days absent from departure_day keeps the windows it touches within the threshold"""
+        if days == 0:
+            return True
+        window = self.rule_set.window_days
+        free = self.free
+        # Positions of the first and last day of the trip
+        first = departure_day + 1 - self.first
+        last = first + days - 1
+        # New absences of the trip, up to and including a day i, are free[i] - free[first - 1]
+        before = free[first - 1]
+
+        # Windows ending on a day of the trip that start before it
+        worst = self.rising.query(first, last) - before
+        # Windows ending after the trip that start before it hold all of it
+        if last + 1 <= first + window:
+            worst = max(worst, self.covering.query(last + 1, first + window) + free[last] - before)
+        # Windows ending after the trip that start inside it
+        if days > 1:
+            worst = max(worst, self.falling.query(first + window + 1, last + window) + free[last])
+        return worst <= self.rule_set.threshold
+
+    def plan(self, departure_date: date) -> TripPlan:
+        """
+        Find the longest trip from a departure date given to the constructor.
+
+        Returns:
+            The TripPlan of the departure date
+        """
+        departure_day = departure_date.toordinal()
+        # The longest trip that fits is between low and high
+        low, high = 0, self.longest
+        while low < high:
+            days = (low + high + 1) // 2
+            if self.fits(departure_day, days):
+                low = days
+            else:
+                high = days - 1
+        return TripPlan(departure_date, low)
+
+
+def plan_trips(absence_periods: List[Tuple[date, date]], departure_dates: List[date], rule_set: RuleSet) -> List[TripPlan]:
+    """
+    Find the longest trip from each of several departure dates.
+
+    Args:
+        absence_periods: List of (start_date, end_date) tuples already recorded
+        departure_dates: Departure dates of the candidate trips
+        rule_set: The rule set the trips must comply with
+
+    Returns:
+        A TripPlan per departure date, in the order given
+    """
+    if not departure_dates:
+        return []
+    planner = TripPlanner(absence_periods, rule_set, departure_dates)
+    return [planner.plan(departure_date) for departure_date in departure_dates]
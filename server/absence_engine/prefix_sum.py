@@ -0,0 +1,95 @@
+"""
+The prefix-sum backend: absences are counted per day once, in a single pass
+over the periods, and every window of every rule set is then the difference
+of two prefix sums.
+"""
+from datetime import date
+from itertools import accumulate
+from typing import List, Tuple, Dict
+
+from .registry import register_backend
+from .result import RuleResult
+from .rules import RuleSet
+
+
+class AbsenceSeries:
+    """
+    Number of absences on every day from first_day to last_day, with prefix sums
+    so the absences in any range of days are counted in constant time.
+
+    A period counts the days strictly between its start and end date, and
+    overlapping periods count a shared day more than once.
+    """
+
+    def __init__(self, absence_periods: List[Tuple[date, date]], first_day: int, last_day: int):
+        """
+        Args:
+            absence_periods: List of (start_date, end_date) tuples (dates or datetimes)
+            first_day: Ordinal of the first day to count
+            last_day: Ordinal of the last day to count
+        """
+        self.first_day = first_day
+        self.last_day = last_day
+
+        # Mark where each period starts and stops covering days, then add up
+        changes = [0] * (last_day - first_day + 2)
+        for start_date, end_date in absence_periods:
+            first = max(start_date.toordinal() + 1, first_day)
+            last = min(end_date.toordinal() - 1, last_day)
+            if first <= last:
+                changes[first - first_day] += 1
+                changes[last - first_day + 1] -= 1
+        daily = accumulate(changes[:-1])
+
+        # prefix[i] is the number of absences on the days before first_day + i
+        self.prefix = [0, *accumulate(daily)]
+
+    def count(self, first: int, last: int) -> int:
+        """Absences from day ordinal first to day ordinal last, both included"""
+        first = max(first, self.first_day)
+        last = min(last, self.last_day)
+        if first > last:
+            return 0
+        return self.prefix[last - self.first_day + 1] - self.prefix[first - self.first_day]
+
+
+@register_backend("prefix_sum")
+def evaluate_prefix_sum(absence_periods: List[Tuple[date, date]], decision_date: date,
+                        rule_sets: List[RuleSet]) -> Dict[str, RuleResult]:
+    """
+    Evaluate rule sets against one shared per-day absence series.
+
+    Args:
+        absence_periods: List of (start_date, end_date) tuples (dates or datetimes)
+        decision_date: The date of decision
+        rule_sets: Rule sets to evaluate
+
+    Returns:
+        Dictionary mapping rule set names to their RuleResult
+    """
+    decision_day = decision_date.toordinal()
+
+    # Days on or before the start of a qualifying period never count, so the
+    # series starts the day after the earliest one
+    first_day = decision_day - max(rule_set.horizon_days for rule_set in rule_sets) + 1
+    last_day = max([decision_day] + [end_date.toordinal() - 1 for _, end_date in absence_periods])
+    series = AbsenceSeries(absence_periods, first_day, last_day)
+    prefix = series.prefix
+
+    results = {}
+    for rule_set in rule_sets:
+        # Positions in the prefix sums: the first day counted and the decision day
+        counted_from = decision_day - rule_set.horizon_days + 1 - first_day
+        decision_index = decision_day - first_day
+        window = rule_set.window_days
+
+        # Window i ends i days before the decision date; the last one ends the day
+        # before counted_from and so counts nothing
+        window_days_absent = [
+            prefix[period_end + 1] - prefix[max(period_end - window, counted_from)]
+            for period_end in range(decision_index, decision_index - rule_set.horizon_days - 1, -1)
+        ]
+        results[rule_set.name] = RuleResult.from_windows(
+            rule_set, decision_date, series.count(first_day + counted_from, last_day), window_days_absent
+        )
+    return results
@@ -0,0 +1,56 @@
+"""
+The reference backend: every absence day is listed and every window counted
+day by day, as the rule is written. It is slow, and kept as the definition
+the other backends are checked against (see tests/test_differential.py).
+"""
+from collections import Counter
+from datetime import date
+from typing import List, Tuple, Dict
+
+from .registry import register_backend
+from .result import RuleResult
+from .rules import RuleSet
+
+
+@register_backend("reference")
+def evaluate_reference(absence_periods: List[Tuple[date, date]], decision_date: date,
+                       rule_sets: List[RuleSet]) -> Dict[str, RuleResult]:
+    """
+    Evaluate rule sets by counting every window day by day.
+
+    Args:
+        absence_periods: List of (start_date, end_date) tuples (dates or datetimes)
+        decision_date: The date of decision
+        rule_sets: Rule sets to evaluate
+
+    Returns:
+        Dictionary mapping rule set names to their RuleResult
+    """
+    # Days absent, as day ordinals: the days strictly between the start and end
+    # date of each period. Overlapping periods count a shared day once per period.
+    absence_days = Counter()
+    for start_date, end_date in absence_periods:
+        for day in range(start_date.toordinal() + 1, end_date.toordinal()):
+            absence_days[day] += 1
+
+    decision_day = decision_date.toordinal()
+    results = {}
+    for rule_set in rule_sets:
+        # Only days after the start of the qualifying period count
+        qualifying_start = decision_day - rule_set.horizon_days
+        counted_days = {day: count for day, count in absence_days.items() if day > qualifying_start}
+
+        # Days absent on every day of the windows, from the start of the earliest one
+        first_day = qualifying_start - rule_set.window_days
+        daily = [counted_days.get(day, 0) for day in range(first_day, decision_day + 1)]
+
+        window_days_absent = []
+        for check_day in range(rule_set.horizon_days + 1):
+            period_end = decision_day - check_day
+            period_start = period_end - rule_set.window_days
+            window_days_absent.append(sum(daily[period_start - first_day:period_end - first_day + 1]))
+
+        results[rule_set.name] = RuleResult.from_windows(
+            rule_set, decision_date, sum(counted_days.values()), window_days_absent
+        )
+    return results
@@ -0,0 +1,49 @@
+from typing import Callable, Dict, List, Optional
+import os
+
+# Backend used when none is named
+DEFAULT_BACKEND = os.getenv("ABSENCE_ENGINE_BACKEND", "prefix_sum")
+
+# Backends by name; each takes (absence_periods, decision_date, rule_sets) and
+# returns a dictionary mapping rule set names to RuleResult
+_backends: Dict[str, Callable] = {}
+
+# Backends whose optional dependency is missing, with the reason
+_unavailable: Dict[str, str] = {}
+
+
+def register_backend(name: str, missing: Optional[str] = None):
+    """
+    Decorator registering a calculation backend under a name.
+
+    Args:
+        name: Name the backend is selected by
+        missing: Why the backend cannot run here (e.g. a missing package), if it cannot
+    """
+    def register(backend: Callable) -> Callable:
+        if missing:
+            _unavailable[name] = missing
+        else:
+            _backends[name] = backend
+        return backend
+    return register
+
+
+def get_backend(name: Optional[str] = None) -> Callable:
+    """
+    Look up a backend by name, or the default backend.
+
+    Raises:
+        ValueError: If no backend has that name, or it cannot run here
+    """
+    name = name or DEFAULT_BACKEND
+    if name in _unavailable:
+        raise ValueError(f"Calculation backend {name} is not available: {_unavailable[name]}")
+    if name not in _backends:
+        raise ValueError(f"Unknown calculation backend: {name}. Available: {', '.join(_backends)}")
+    return _backends[name]
+
+
+def available_backends() -> List[str]:
+    """Names of the backends that can run here, in registration order"""
+    return list(_backends)
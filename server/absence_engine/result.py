@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import List, Tuple, Dict, Any, Optional
+
+from .rules import RuleSet
+
+
+@lru_cache(maxsize=64)
+def window_keys(decision_date: date, num_windows: int, window_days: int = 365) -> Tuple[str, ...]:
+    """
+    Build the keys of the rolling windows that end on the decision date and on
+    each of the num_windows - 1 days before it.
+
+    Every date is formatted once, and the keys are cached because most requests
+    share a handful of decision dates.
+
+    Returns:
+        Tuple of 'YYYY-MM-DD to YYYY-MM-DD' strings, index i being the window that
+        ends i days before the decision date
+    """
+    first_start = decision_date - timedelta(days=num_windows - 1 + window_days)
+    iso_days = [(first_start + timedelta(days=i)).isoformat() for i in range(num_windows + window_days)]
+    return tuple(f"{iso_days[i]} to {iso_days[i + window_days]}" for i in range(num_windows - 1, -1, -1))
+
+
+@dataclass(frozen=True)
+class RuleResult:
+    """
+    The result of one rule set, the same whichever backend computed it.
+
+    Windows are numbered back from the decision date: window i ends i days
+    before it, so there are horizon_days + 1 of them.
+    """
+    rule_set: RuleSet
+    decision_date: date
+    # Days absent after the start of the qualifying period
+    total_days_absent: int
+    # Days absent in every window, index i being the window ending i days before the decision date
+    window_days_absent: List[int]
+    # Index of the first window with the most days absent, None if no window has any
+    worst_window: Optional[int]
+    worst_period_days: int
+
+    @classmethod
+    def from_windows(cls, rule_set: RuleSet, decision_date: date, total_days_absent: int,
+                     window_days_absent: List[int]) -> "RuleResult":
+        """Build a result, finding the worst window of window_days_absent"""
+        worst_period_days = max(window_days_absent, default=0)
+        worst_window = window_days_absent.index(worst_period_days) if worst_period_days > 0 else None
+        return cls(rule_set, decision_date, total_days_absent, window_days_absent, worst_window, worst_period_days)
+
+    @property
+    def qualifying_start(self) -> date:
+        """Start of the qualifying period; only absence days after it count"""
+        return self.decision_date - timedelta(days=self.rule_set.horizon_days)
+
+    @property
+    def complies(self) -> bool:
+        """Whether no window has more days absent than the threshold"""
+        return self.worst_period_days <= self.rule_set.threshold
+
+    def window_key(self, index: int) -> str:
+        """'YYYY-MM-DD to YYYY-MM-DD' of window index"""
+        return window_keys(self.decision_date, len(self.window_days_absent), self.rule_set.window_days)[index]
+
+    @property
+    def worst_period(self) -> Optional[str]:
+        """Dates of the worst window, or None if no window has any days absent"""
+        return self.window_key(self.worst_window) if self.worst_window is not None else None
+
+    def detailed_periods(self) -> Dict[str, int]:
+        """Window keys mapped to the days absent in each window"""
+        keys = window_keys(self.decision_date, len(self.window_days_absent), self.rule_set.window_days)
+        return dict(zip(keys, self.window_days_absent))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Describe the result for an API response or a report.
+
+        Returns:
+            Dictionary of strings, numbers and booleans only
+        """
+        return {
+            "description": self.rule_set.description,
+            "window_days": self.rule_set.window_days,
+            "threshold": self.rule_set.threshold,
+            "horizon_days": self.rule_set.horizon_days,
+            "qualifying_start": self.qualifying_start.isoformat(),
+            "total_days_absent": self.total_days_absent,
+            "worst_period": self.worst_period,
+            "worst_period_days": self.worst_period_days,
+            "complies": self.complies,
+        }
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from typing import List, Iterable
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """
+    An absence rule: no more than threshold days absent in any rolling window
+    during the qualifying period before the decision date.
+
+    A window ending on day E covers the days from E - window_days to E, both
+    included, as in the original 180-day rule. Windows end on the decision date
+    and on each of the horizon_days days before it, and only absence days after
+    the start of the qualifying period (decision date - horizon_days) count.
+    """
+    name: str
+    window_days: int
+    threshold: int
+    horizon_days: int
+    description: str = ""
+
+
+UK_ILR_5Y = RuleSet(
+    "uk_ilr_5y", window_days=365, threshold=180, horizon_days=5 * 365,
+    description="Settlement: at most 180 days absent in any 12 months of the 5-year qualifying period",
+)
+UK_LONG_RESIDENCE_10Y = RuleSet(
+    "uk_long_residence_10y", window_days=365, threshold=180, horizon_days=10 * 365,
+    description="Long residence: at most 180 days absent in any 12 months of the 10-year qualifying period",
+)
+UK_NATURALISATION_TOTAL = RuleSet(
+    "uk_naturalisation_total", window_days=5 * 365, threshold=450, horizon_days=5 * 365,
+    description="Naturalisation: at most 450 days absent in the 5 years before the application",
+)
+UK_NATURALISATION_FINAL_YEAR = RuleSet(
+    "uk_naturalisation_final_year", window_days=365, threshold=90, horizon_days=365,
+    description="Naturalisation: at most 90 days absent in the final 12 months",
+)
+
+# Rule sets that requests can select by name
+RULE_SETS = {rule_set.name: rule_set for rule_set in (
+    UK_ILR_5Y,
+    UK_LONG_RESIDENCE_10Y,
+    UK_NATURALISATION_TOTAL,
+    UK_NATURALISATION_FINAL_YEAR,
+)}
+
+# The rule behind calculate_180_day_rule and the top-level /api/calculate result
+DEFAULT_RULE_SET = UK_ILR_5Y
+
+
+def get_rule_sets(names: Iterable[str]) -> List[RuleSet]:
+    """
+    Look up rule sets by name.
+
+    Raises:
+        ValueError: If a name is not in RULE_SETS
+    """
+    unknown = [name for name in names if name not in RULE_SETS]
+    if unknown:
+        raise ValueError(f"Unknown rule sets: {', '.join(unknown)}. Available: {', '.join(RULE_SETS)}")
+    return [RULE_SETS[name] for name in names]
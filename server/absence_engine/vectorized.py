@@ -0,0 +1,73 @@
+"""
+The vectorized backend: the prefix-sum method with NumPy arrays, so the
+per-day series and all the windows of a rule set are computed without a
+Python loop over days or windows. Needs NumPy, and is left out without it.
+
+NumPy is imported on the first calculation, not when the backend is
+registered, so processes that never use this backend do not load it.
+"""
+from datetime import date
+from typing import List, Tuple, Dict
+import importlib.util
+
+from .registry import register_backend
+from .result import RuleResult
+from .rules import RuleSet
+
+NUMPY_MISSING = None if importlib.util.find_spec("numpy") is not None else "numpy is not installed"
+
+
+@register_backend("vectorized", missing=NUMPY_MISSING)
+def evaluate_vectorized(absence_periods: List[Tuple[date, date]], decision_date: date,
+                        rule_sets: List[RuleSet]) -> Dict[str, RuleResult]:
+    """
+    Evaluate rule sets against one shared per-day absence series held in arrays.
+
+    Args:
+        absence_periods: List of (start_date, end_date) tuples (dates or datetimes)
+        decision_date: The date of decision
+        rule_sets: Rule sets to evaluate
+
+    Returns:
+        Dictionary mapping rule set names to their RuleResult
+    """
+    import numpy
+
+    decision_day = decision_date.toordinal()
+    first_day = decision_day - max(rule_set.horizon_days for rule_set in rule_sets) + 1
+
+    # First and last day absent of every period, as positions from first_day
+    count = len(absence_periods)
+    firsts = numpy.fromiter((start_date.toordinal() + 1 for start_date, _ in absence_periods), numpy.int64, count) - first_day
+    lasts = numpy.fromiter((end_date.toordinal() - 1 for _, end_date in absence_periods), numpy.int64, count) - first_day
+    num_days = max(decision_day - first_day, int(lasts.max()) if count else 0) + 1
+
+    # Mark where each period starts and stops covering days, then add up twice:
+    # to absences per day, and to prefix[i], the absences before position i
+    firsts = numpy.maximum(firsts, 0)
+    lasts = numpy.minimum(lasts, num_days - 1)
+    covering = firsts <= lasts
+    changes = (numpy.bincount(firsts[covering], minlength=num_days + 1)
+               - numpy.bincount(lasts[covering] + 1, minlength=num_days + 1))
+    prefix = numpy.zeros(num_days + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.cumsum(changes[:-1]), out=prefix[1:])
+
+    results = {}
+    for rule_set in rule_sets:
+        counted_from = decision_day - rule_set.horizon_days + 1 - first_day
+        # Window i ends i days before the decision date
+        period_ends = numpy.arange(decision_day - first_day, decision_day - first_day - rule_set.horizon_days - 1, -1)
+        period_starts = numpy.maximum(period_ends - rule_set.window_days, counted_from)
+        window_days_absent = prefix[period_ends + 1] - prefix[period_starts]
+
+        worst_window = int(window_days_absent.argmax())
+        worst_period_days = int(window_days_absent[worst_window])
+        results[rule_set.name] = RuleResult(
+            rule_set,
+            decision_date,
+            int(prefix[-1] - prefix[counted_from]),
+            window_days_absent.tolist(),
+            worst_window if worst_period_days > 0 else None,
+            worst_period_days,
+        )
+    return results
@@ -1,48 +1,113 @@
-from fastapi import FastAPI, Depends
-from fastapi.middleware.cors import CORSMiddleware
-from tortoise.contrib.fastapi import register_tortoise
-import os
+# Import timing first so the startup timeline starts here
+from timing import phase, mark
+
+with phase("import.framework"):
+    from fastapi import FastAPI, Depends
+    from fastapi.middleware.cors import CORSMiddleware
+    from tortoise.contrib.fastapi import register_tortoise
+    import os
+
+# Send log records through the queue before any module logs
+with phase("import.logging"):
+    from logs import configure_logging, RequestLogMiddleware, LOG_REQUESTS
+    configure_logging()
+
+# Import the JSON response class used by default and the compression middleware
+with phase("import.utils"):
+    from utils.responses import FastJSONResponse
+    from utils.compression import CompressionMiddleware
+    from utils.admission import AdmissionMiddleware
 
 # Import database configuration
-from database import TORTOISE_ORM
+with phase("import.database"):
+    from database import TORTOISE_ORM
 
 # Import routers from modules
-from auth import auth_router, AuthMiddleware
-from periods import periods_router
-from health import health_router, register_db_events
-
-# Create FastAPI application
-app = FastAPI(title="Absence Calculator API")
-
-# Configure CORS to allow requests from any origin
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Add authentication middleware
-app.add_middleware(AuthMiddleware)
-
-# Include routers from modules
-app.include_router(auth_router)
-app.include_router(periods_router)
-app.include_router(health_router)
-
-# Register database event handlers
-register_db_events(app)
-
-# Register Tortoise ORM with FastAPI
-register_tortoise(
-    app,
-    config=TORTOISE_ORM,
-    generate_schemas=True,
-    add_exception_handlers=True,
-)
+with phase("import.auth"):
+    from auth import auth_router, AuthMiddleware
+with phase("import.periods"):
+    from periods import periods_router, start_live_listener, stop_live_listener
+with phase("import.jobs"):
+    from jobs import jobs_router, start_job_queue, stop_job_queue
+with phase("import.tracing"):
+    from tracing import QueryTracingMiddleware, instrument_tortoise
+with phase("import.health"):
+    from health import health_router, register_db_events, begin_startup
+
+with phase("app.setup"):
+    # Create FastAPI application
+    app = FastAPI(title="Absence Calculator API", default_response_class=FastJSONResponse)
+
+    # Shed excess requests to CPU-heavy routes with 429 (added first, so it runs
+    # after authentication and its responses still get CORS headers)
+    app.add_middleware(AdmissionMiddleware, enabled=os.getenv("ADMISSION_ENABLED", "1") == "1")
+
+    # Configure CORS to allow requests from any origin
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Let the frontend read ETags for conditional requests
+        expose_headers=["ETag", "X-Next-Cursor", "Link", "Retry-After", "Server-Timing"],
+    )
+
+    # Add authentication middleware
+    app.add_middleware(AuthMiddleware)
+
+    # Compress large responses such as calculation results (added after the
+    # others, so it also compresses error and CORS responses)
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
+
+    # Count the queries of each request and report them with the auth and
+    # calculation times in a Server-Timing header
+    app.add_middleware(QueryTracingMiddleware)
+
+    # Log one line per request, sampled per route (added last, so the duration
+    # includes every other middleware)
+    app.add_middleware(RequestLogMiddleware)
+
+    # Include routers from modules
+    app.include_router(auth_router)
+    app.include_router(periods_router)
+    app.include_router(jobs_router)
+    app.include_router(health_router)
+
+    # Start the startup clock before Tortoise connects to the database
+    app.add_event_handler("startup", begin_startup)
+
+    # Register Tortoise ORM with FastAPI (schemas are managed by migrations.py)
+    register_tortoise(
+        app,
+        config=TORTOISE_ORM,
+        generate_schemas=False,
+        add_exception_handlers=True,
+    )
+
+    # Register database event handlers (after Tortoise, so the connection is open)
+    register_db_events(app)
+
+    # Trace the queries of the database backend Tortoise has loaded
+    app.add_event_handler("startup", instrument_tortoise)
+
+    # Push period changes made by any process to the live streams of this one
+    app.add_event_handler("startup", start_live_listener)
+    app.add_event_handler("shutdown", stop_live_listener)
+
+    # Run the calculation jobs of this process on a bounded number of workers
+    app.add_event_handler("startup", start_job_queue)
+    app.add_event_handler("shutdown", stop_job_queue)
+
+mark("app.imported")
 
 # Run the application
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=5001)
+    # The request log replaces uvicorn's access log, which writes on the event loop
+    uvicorn.run(app, host='0.0.0.0', port=5001, access_log=not LOG_REQUESTS)
@@ -4,7 +4,8 @@ import jwt
 from datetime import datetime
 import os
 
-from models import User, Token as TokenModel
+from logs import get_logger
+from models import Token as TokenModel
 
 # Security
 security = HTTPBearer()
@@ -12,6 +13,8 @@ security = HTTPBearer()
 # JWT Secret key
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
 
+logger = get_logger(__name__)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Dependency for authenticating users with JWT tokens.
@@ -23,8 +26,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         payload = jwt.decode(token_str, JWT_SECRET, algorithms=["HS256"])
         user_id = payload.get("sub")
         
-        # Check if token exists in database
-        db_token = await TokenModel.filter(token=token_str).first()
+        # Check if token exists in database, loading its user in the same query
+        db_token = await TokenModel.filter(token=token_str).select_related("user").first()
         if not db_token:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,16 +53,16 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                     headers={"WWW-Authenticate": "Bearer"}
                 )
         except Exception as e:
-            print(f"Token expiry check error: {e}")
+            logger.warning("token_expiry_check_failed", error=str(e))
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token validation error",
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
-        # Get user
-        user = await User.get(id=user_id)
-        if not user:
+        # The user was loaded with the token, and must be the one it was issued to
+        user = db_token.user
+        if not user or str(user.id) != user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found",
@@ -70,17 +73,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         return {
             "id": str(user.id),
             "username": user.username,
-            "email": user.email
+            "email": user.email,
+            "data_version": user.data_version
         }
     except jwt.PyJWTError as e:
-        print(f"JWT Error: {e}")
+        logger.info("invalid_token", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"}
         )
     except Exception as e:
-        print(f"Authentication error: {e}")
+        logger.warning("authentication_error", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication error",
@@ -5,22 +5,31 @@ from datetime import datetime
 import os
 from typing import List
 
-from models import User, Token as TokenModel
+from logs import get_logger
+from models import Token as TokenModel
+from tracing import trace_phase
 from .dependencies import JWT_SECRET
+from .tickets import redeem_stream_ticket
 
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.types import ASGIApp
 
+logger = get_logger(__name__)
+
 class AuthMiddleware(BaseHTTPMiddleware):
     """Middleware for JWT authentication at the request level"""
     
-    def __init__(self, app: ASGIApp, exempt_paths: List[str] = None):
+    def __init__(self, app: ASGIApp, exempt_paths: List[str] = None, ticket_paths: List[str] = None):
         """
         Initialize the middleware with paths that don't require authentication
         
         Args:
             app: The ASGI application
             exempt_paths: List of API paths that don't require authentication
+            ticket_paths: List of API paths that also accept a single-use ticket
+                (see auth/tickets.py) as the 'ticket' query parameter, for
+                clients such as EventSource that cannot set headers. The
+                session token itself is never accepted in the query string.
         """
         super().__init__(app)
         self.exempt_paths = exempt_paths or [
@@ -31,6 +40,9 @@ class AuthMiddleware(BaseHTTPMiddleware):
             "/redoc",
             "/openapi.json"
         ]
+        self.ticket_paths = ticket_paths or [
+            "/api/calculate/stream"
+        ]
     
     async def dispatch(self, request: Request, call_next: RequestResponseEndpoint):
         """
@@ -53,6 +65,8 @@ class AuthMiddleware(BaseHTTPMiddleware):
         
         # Get authorization header
         auth_header = request.headers.get("Authorization")
+        if not auth_header and request.url.path in self.ticket_paths and request.query_params.get("ticket"):
+            return await self.dispatch_with_ticket(request, call_next)
         if not auth_header:
             return JSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,50 +92,47 @@ class AuthMiddleware(BaseHTTPMiddleware):
         
         # Validate the token
         try:
-            # Verify the JWT token
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            user_id = payload.get("sub")
-            
-            # Check if token exists in database
-            db_token = await TokenModel.filter(token=token).first()
-            if not db_token:
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "Invalid token or token expired"},
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-            
-            # Check if token is expired
-            current_time = datetime.now().replace(tzinfo=None)
-            token_expiry = db_token.expires_at
-            
-            # If token_expiry has timezone info, convert to naive datetime
-            if hasattr(token_expiry, 'tzinfo') and token_expiry.tzinfo:
-                token_expiry = token_expiry.replace(tzinfo=None)
+            with trace_phase("auth"):
+                # Verify the JWT token
+                payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+                user_id = payload.get("sub")
                 
-            if token_expiry < current_time:
-                await db_token.delete()
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "Token expired"},
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-            
-            # Get user
-            user = await User.get(id=user_id)
-            if not user:
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "User not found"},
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
+                # Check if token exists in database, loading its user in the same query
+                db_token = await TokenModel.filter(token=token).select_related("user").first()
+                if not db_token:
+                    return JSONResponse(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        content={"detail": "Invalid token or token expired"},
+                        headers={"WWW-Authenticate": "Bearer"}
+                    )
+                
+                # Check if token is expired
+                current_time = datetime.now().replace(tzinfo=None)
+                token_expiry = db_token.expires_at
+                
+                # If token_expiry has timezone info, convert to naive datetime
+                if hasattr(token_expiry, 'tzinfo') and token_expiry.tzinfo:
+                    token_expiry = token_expiry.replace(tzinfo=None)
+                    
+                if token_expiry < current_time:
+                    await db_token.delete()
+                    return JSONResponse(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        content={"detail": "Token expired"},
+                        headers={"WWW-Authenticate": "Bearer"}
+                    )
+                
+                # The user was loaded with the token, and must be the one it was issued to
+                user = db_token.user
+                if not user or str(user.id) != user_id:
+                    return JSONResponse(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        content={"detail": "User not found"},
+                        headers={"WWW-Authenticate": "Bearer"}
+                    )
             
             # Add user to request state
-            request.state.user = {
-                "id": str(user.id),
-                "username": user.username,
-                "email": user.email
-            }
+            request.state.user = self.request_user(user)
             
             # Continue with the request
             return await call_next(request)
@@ -133,8 +144,36 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 headers={"WWW-Authenticate": "Bearer"}
             )
         except Exception as e:
+            logger.warning("authentication_error", path=request.url.path, error=str(e))
             return JSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 content={"detail": f"Authentication error: {str(e)}"},
                 headers={"WWW-Authenticate": "Bearer"}
             )
+    
+    async def dispatch_with_ticket(self, request: Request, call_next: RequestResponseEndpoint):
+        """Authenticate a request by the single-use ticket in its query string"""
+        try:
+            with trace_phase("auth"):
+                user = await redeem_stream_ticket(request.query_params["ticket"])
+        except Exception as e:
+            logger.warning("authentication_error", path=request.url.path, error=str(e))
+            user = None
+        if user is None:
+            return JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={"detail": "Invalid, expired or used ticket"},
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        request.state.user = self.request_user(user)
+        return await call_next(request)
+    
+    @staticmethod
+    def request_user(user) -> dict:
+        """The user as the request state holds it"""
+        return {
+            "id": str(user.id),
+            "username": user.username,
+            "email": user.email,
+            "data_version": user.data_version
+        }
@@ -30,6 +30,11 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str
 
+class StreamTicketResponse(BaseModel):
+    ticket: str
+    # Seconds the ticket may wait before it opens its stream
+    expires_in: int
+
 class UserResponse(BaseModel):
     id: str
     username: str
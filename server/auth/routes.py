@@ -1,33 +1,40 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import bcrypt
 import jwt
 import uuid
 from datetime import datetime, timedelta
 import os
+from tortoise.expressions import Q
 
+from logs import get_logger
+from tracing import trace_phase
 from models import User, Token as TokenModel
-from .models import UserCreate, UserLogin, TokenResponse, UserResponse
-from .dependencies import get_current_user, JWT_SECRET
+from .models import UserCreate, UserLogin, TokenResponse, UserResponse, StreamTicketResponse
+from .dependencies import JWT_SECRET
+from .request_user import get_request_user
+from .tickets import issue_stream_ticket, STREAM_TICKET_TTL_SECONDS
 
 router = APIRouter(prefix="/api", tags=["authentication"])
 
+logger = get_logger(__name__)
+
 @router.post('/signup', response_model=UserResponse)
 async def signup(user: UserCreate):
     """Register a new user"""
     try:
-        # Check if username already exists
-        existing_user = await User.filter(username=user.username).first()
-        if existing_user:
+        # Check if username or email already exists, in one query
+        existing = await User.filter(Q(username=user.username) | Q(email=user.email)).values_list("username", "email")
+        if any(username == user.username for username, _ in existing):
             raise HTTPException(status_code=400, detail="Username already exists")
-        
-        # Check if email already exists
-        existing_email = await User.filter(email=user.email).first()
-        if existing_email:
+        if existing:
             raise HTTPException(status_code=400, detail="Email already exists")
         
-        # Hash the password
-        password_hash = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Hash the password in a worker thread; bcrypt would block the event loop
+        with trace_phase("auth"):
+            password_hash = await run_in_threadpool(bcrypt.hashpw, user.password.encode('utf-8'), bcrypt.gensalt())
+        password_hash = password_hash.decode('utf-8')
         
         # Create new user
         new_user = await User.create(
@@ -52,33 +59,33 @@ async def login(user: UserLogin):
         # Find user by username
         db_user = await User.filter(username=user.username).first()
         if not db_user:
-            print(f"User not found: {user.username}")
+            logger.info("login_failed", username=user.username, reason="unknown_user")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid username or password",
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
-        # Debug info
-        print(f"Found user: {db_user.username}, checking password")
-        print(f"Stored hash: {db_user.password_hash}")
-        
-        # Verify password
+        # Verify password in a worker thread; bcrypt would block the event loop
         try:
-            password_matches = bcrypt.checkpw(
-                user.password.encode('utf-8'), 
-                db_user.password_hash.encode('utf-8')
-            )
-            print(f"Password match result: {password_matches}")
-            
+            with trace_phase("auth"):
+                password_matches = await run_in_threadpool(
+                    bcrypt.checkpw,
+                    user.password.encode('utf-8'), 
+                    db_user.password_hash.encode('utf-8')
+                )
             if not password_matches:
+                logger.info("login_failed", username=user.username, reason="wrong_password")
+                # The detail clients have always received for a wrong password
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid username or password",
+                    detail="Password verification error",
                     headers={"WWW-Authenticate": "Bearer"}
                 )
+        except HTTPException:
+            raise
         except Exception as pwd_err:
-            print(f"Password verification error: {pwd_err}")
+            logger.warning("password_verification_failed", user_id=str(db_user.id), error=str(pwd_err))
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Password verification error",
@@ -95,9 +102,6 @@ async def login(user: UserLogin):
         
         # Store token in database
         try:
-            # Debug info
-            print(f"Creating token for user_id: {db_user.id}, token: {token_str[:10]}...")
-            
             # Create token with explicit fields
             token_id = uuid.uuid4()
             new_token = await TokenModel.create(
@@ -106,18 +110,16 @@ async def login(user: UserLogin):
                 token=token_str,
                 expires_at=expiration
             )
-            print(f"Token created successfully with ID: {new_token.id}")
-        except Exception as token_err:
-            print(f"Token creation error: {token_err}")
-            import traceback
-            traceback.print_exc()
+            logger.info("login_succeeded", user_id=str(db_user.id), token_id=str(new_token.id))
+        except Exception:
+            logger.exception("token_creation_failed", user_id=str(db_user.id))
             raise HTTPException(status_code=500, detail="Token creation error")
         
         return {"access_token": token_str, "token_type": "bearer"}
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.exception("login_error", error=str(e))
         raise HTTPException(status_code=500, detail="Authentication error")
 
 @router.post('/logout')
@@ -127,19 +129,25 @@ async def logout(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(
         # Get token from header
         token_str = credentials.credentials
         
-        # Find token in database
-        token = await TokenModel.filter(token=token_str).first()
-        if not token:
+        # Delete token, if it is in the database
+        deleted = await TokenModel.filter(token=token_str).delete()
+        if not deleted:
             raise HTTPException(status_code=400, detail="Invalid token")
         
-        # Delete token
-        await token.delete()
-        
         return {"message": "Successfully logged out"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post('/stream-tickets', response_model=StreamTicketResponse)
+async def create_stream_ticket(current_user: dict = Depends(get_request_user)):
+    """Issue a single-use ticket that opens one result stream (see auth/tickets.py)"""
+    try:
+        ticket = await issue_stream_ticket(current_user["id"])
+        return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL_SECONDS}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get('/me', response_model=UserResponse)
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
+async def get_current_user_info(current_user: dict = Depends(get_request_user)):
     """Get the current authenticated user's information"""
     return current_user
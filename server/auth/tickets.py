@@ -0,0 +1,49 @@
+"""
+Single-use tickets for the result stream.
+
+EventSource cannot send an Authorization header, so the stream is opened
+with a ticket in its URL instead of the session token. A ticket is issued to
+a logged-in user by POST /api/stream-tickets, opens one stream, and expires
+after STREAM_TICKET_TTL_SECONDS if it is not used, so a URL that ends up in
+a proxy log or the browser history cannot be replayed.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import os
+import secrets
+
+from models import StreamTicket, User
+
+# Seconds a ticket may wait before it opens its stream
+STREAM_TICKET_TTL_SECONDS = int(os.getenv("STREAM_TICKET_TTL_SECONDS", "60"))
+
+async def issue_stream_ticket(user_id: str) -> str:
+    """
+    Issue a ticket that opens one result stream for a user.
+
+    Returns:
+        The ticket
+    """
+    now = datetime.now(timezone.utc)
+    # Expired tickets of every user are removed as new ones are issued
+    await StreamTicket.filter(expires_at__lt=now).delete()
+    ticket = secrets.token_urlsafe(32)
+    await StreamTicket.create(ticket=ticket, user_id=user_id,
+                              expires_at=now + timedelta(seconds=STREAM_TICKET_TTL_SECONDS))
+    return ticket
+
+async def redeem_stream_ticket(ticket: str) -> Optional[User]:
+    """
+    Use up a ticket.
+
+    Returns:
+        The user the ticket was issued to, or None if it does not exist, has
+        expired or was already used
+    """
+    found = await StreamTicket.filter(ticket=ticket).select_related("user").first()
+    if found is None:
+        return None
+    # Only one of several requests with the same ticket deletes it, even in
+    # different worker processes
+    deleted = await StreamTicket.filter(ticket=ticket, expires_at__gte=datetime.now(timezone.utc)).delete()
+    return found.user if deleted else None
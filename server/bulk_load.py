@@ -0,0 +1,353 @@
+"""
+Bulk load absence periods from CSV files into the database.
+
+Reads CSV files in the format of the command line version (start_date and
+end_date columns) and inserts their periods in batches, each in its own
+transaction: with COPY on PostgreSQL and executemany on SQLite. Dates must be
+exactly YYYY-MM-DD, as the API accepts them. Files are streamed, so they may be
+larger than memory.
+
+Periods that already exist, with the same user and dates, are not loaded
+again, so a load that failed part way can be run again with the same files.
+The last line of each file whose batch was committed is reported as well.
+
+Each row belongs to the user named by its 'user_id', 'username' or 'email'
+column, the first of these the file has. Files without any of them belong to
+the user given with --user.
+
+Usage (from the server directory, after 'python migrations.py'):
+    python bulk_load.py legacy/alice.csv --user alice
+    python bulk_load.py export-*.csv --batch-size 50000
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import List, Tuple, Dict, Iterator, Optional
+from tortoise.transactions import in_transaction
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+import uuid
+
+from database import init_db, close_db, is_postgres
+from logs import get_logger, configure_logging
+from migrations import get_schema_version, LATEST_VERSION
+from models import User, AbsencePeriod
+from utils.dates import parse_iso_date
+
+logger = get_logger(__name__)
+
+# Rows inserted per transaction; larger batches are faster but hold their
+# transaction, and the rows read for it, for longer
+BULK_LOAD_BATCH_SIZE = int(os.getenv("BULK_LOAD_BATCH_SIZE", "10000"))
+
+# Columns that map a row to its user, in order of preference, and the User field each one holds
+USER_COLUMNS = {"user_id": "id", "username": "username", "email": "email"}
+
+PERIOD_COLUMNS = ("id", "user_id", "start_date", "end_date", "created_at")
+
+
+@dataclass
+class LoadStats:
+    """Rows read, loaded and skipped by a bulk load"""
+    rows: int = 0
+    loaded: int = 0
+    # Rows whose dates are missing, invalid or in the wrong order
+    invalid: int = 0
+    # Rows of users that do not exist
+    unknown_user: int = 0
+    # Rows of periods that were already stored, by an earlier load or earlier in the file
+    existing: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    # Last line of the file whose rows are all committed or skipped; not added up by add()
+    committed_line: int = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.invalid + self.unknown_user + self.existing
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add(self, other: "LoadStats"):
+        """Add the counts of another load to these ones"""
+        for field in ("rows", "loaded", "invalid", "unknown_user", "existing", "batches", "seconds"):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def describe(self) -> str:
+        return (f"{self.loaded} periods loaded, {self.skipped} rows skipped "
+                f"({self.invalid} invalid, {self.unknown_user} of unknown users, {self.existing} already loaded) "
+                f"in {self.seconds:.2f} s ({self.rows_per_second:,.0f} rows/s)")
+
+
+def user_column(path: str, fieldnames: Optional[List[str]], default_user: Optional[str]) -> Optional[str]:
+    """
+    Check the header of a CSV file and choose the column that maps rows to users.
+
+    Returns:
+        The name of the user column, or None if every row belongs to default_user
+
+    Raises:
+        ValueError: If the date columns are missing, or the file has no user
+            column and no default user was given
+    """
+    fieldnames = fieldnames or []
+    missing = [column for column in ("start_date", "end_date") if column not in fieldnames]
+    if missing:
+        raise ValueError(f"{path}: CSV file must contain columns: start_date, end_date")
+
+    column = next((column for column in USER_COLUMNS if column in fieldnames), None)
+    if column is None and default_user is None:
+        raise ValueError(f"{path}: CSV file has no {', '.join(USER_COLUMNS)} column; pass --user")
+    return column
+
+
+def read_periods(path: str, default_user: Optional[str], stats: LoadStats) -> Iterator[Tuple[int, str, str, date, date]]:
+    """
+    Stream the absence periods of a CSV file.
+
+    Rows with invalid dates are counted in stats and skipped.
+
+    Args:
+        path: Path to the CSV file
+        default_user: Username of the rows of a file without a user column
+        stats: Statistics of the load, updated as rows are read
+
+    Yields:
+        Tuples of (line number, user field, user key, start_date, end_date)
+    """
+    with open(path, "r", newline="") as csv_file:
+        reader = csv.DictReader(csv_file)
+        column = user_column(path, reader.fieldnames, default_user)
+        field = USER_COLUMNS[column] if column else "username"
+
+        for row in reader:
+            stats.rows += 1
+            try:
+                start_date = parse_iso_date(row["start_date"] or "")
+                end_date = parse_iso_date(row["end_date"] or "")
+                if end_date < start_date:
+                    raise ValueError("End date must be after start date")
+                user_key = row[column] if column else default_user
+                if not user_key:
+                    raise ValueError(f"Missing {column}")
+                if field == "id":
+                    # Normalised so it matches the IDs read back from the database
+                    user_key = str(uuid.UUID(user_key))
+            except (ValueError, TypeError) as e:
+                stats.invalid += 1
+                logger.warning("bulk_load_row_skipped", file=path, line=reader.line_num, reason=str(e))
+                continue
+            yield reader.line_num, field, user_key, start_date, end_date
+
+
+class UserResolver:
+    """Map the user columns of CSV rows to user IDs, querying each user once"""
+
+    def __init__(self):
+        self.ids: Dict[Tuple[str, str], Optional[uuid.UUID]] = {}
+
+    async def resolve(self, keys):
+        """
+        Look up the users of a batch that have not been seen before.
+
+        Args:
+            keys: Iterable of (user field, user key) tuples
+        """
+        missing = {}
+        for field, key in keys:
+            if (field, key) not in self.ids:
+                missing.setdefault(field, set()).add(key)
+
+        for field, values in missing.items():
+            found = await User.filter(**{f"{field}__in": list(values)}).values_list(field, "id")
+            found = {str(value): user_id for value, user_id in found}
+            for value in values:
+                self.ids[(field, value)] = found.get(value)
+                if value not in found:
+                    logger.warning("bulk_load_unknown_user", field=field, value=value)
+
+    def get(self, field: str, key: str) -> Optional[uuid.UUID]:
+        return self.ids.get((field, key))
+
+
+async def insert_periods(conn, records: List[tuple]):
+    """
+    Insert rows into absence_periods in the transaction conn.
+
+    Args:
+        conn: The transaction
+        records: Tuples of the PERIOD_COLUMNS values
+    """
+    if is_postgres():
+        # COPY sends all rows in one stream instead of a statement per row
+        async with conn.acquire_connection() as connection:
+            await connection.copy_records_to_table("absence_periods", records=records, columns=PERIOD_COLUMNS)
+        return
+
+    # SQLite stores UUIDs, dates and timestamps as text, as Tortoise writes them
+    await conn.execute_many(
+        f"INSERT INTO absence_periods ({', '.join(PERIOD_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+        [[str(period_id), str(user_id), start_date.isoformat(), end_date.isoformat(), str(created_at)]
+         for period_id, user_id, start_date, end_date, created_at in records],
+    )
+
+
+async def stored_periods(conn, periods: List[Tuple[uuid.UUID, date, date]]) -> set:
+    """
+    Find which of a batch's periods are already stored.
+
+    Returns:
+        The set of (user_id, start_date, end_date) of periods that exist
+    """
+    users = {user_id for user_id, _, _ in periods}
+    starts = [start_date for _, start_date, _ in periods]
+    # One query per batch: the users' periods in the range of its start dates
+    stored = await AbsencePeriod.filter(
+        user_id__in=list(users), start_date__gte=min(starts), start_date__lte=max(starts)
+    ).using_db(conn).values_list("user_id", "start_date", "end_date")
+    return {tuple(period) for period in stored}
+
+
+async def load_batch(batch: List[Tuple[int, str, str, date, date]], resolver: UserResolver, stats: LoadStats):
+    """
+    Insert a batch of periods in one transaction.
+
+    Periods that are already stored are skipped, so running a load again after
+    it failed does not add the committed batches twice. The data version of
+    every user with new periods is incremented in the same transaction, so
+    running servers do not answer with ETags or cached interval indexes from
+    before the load.
+    """
+    await resolver.resolve((field, key) for _, field, key, _, _ in batch)
+
+    periods = []
+    for _, field, key, start_date, end_date in batch:
+        user_id = resolver.get(field, key)
+        if user_id is None:
+            stats.unknown_user += 1
+            continue
+        periods.append((user_id, start_date, end_date))
+
+    if periods:
+        created_at = datetime.now(timezone.utc)
+        placeholder = "$1" if is_postgres() else "?"
+        async with in_transaction("default") as conn:
+            seen = await stored_periods(conn, periods)
+            records = []
+            for period in periods:
+                if period in seen:
+                    stats.existing += 1
+                    continue
+                seen.add(period)
+                records.append((uuid.uuid4(), *period, created_at))
+            users = {user_id for _, user_id, _, _, _ in records}
+            if records:
+                await insert_periods(conn, records)
+                await conn.execute_many(
+                    f"UPDATE users SET data_version = data_version + 1 WHERE id = {placeholder}",
+                    [[user_id if is_postgres() else str(user_id)] for user_id in users],
+                )
+        if records:
+            stats.loaded += len(records)
+            stats.batches += 1
+    stats.committed_line = batch[-1][0]
+
+
+async def load_file(path: str, default_user: Optional[str], batch_size: int, resolver: UserResolver) -> LoadStats:
+    """
+    Load the absence periods of one CSV file, batch_size rows per transaction.
+
+    Returns:
+        LoadStats of the file
+    """
+    stats = LoadStats()
+    started = time.perf_counter()
+    batch = []
+    try:
+        for period in read_periods(path, default_user, stats):
+            batch.append(period)
+            if len(batch) >= batch_size:
+                await load_batch(batch, resolver, stats)
+                batch = []
+                logger.info("bulk_load_batch", file=path, rows=stats.rows, loaded=stats.loaded,
+                            committed_line=stats.committed_line,
+                            rows_per_second=round(stats.rows / (time.perf_counter() - started)))
+        if batch:
+            await load_batch(batch, resolver, stats)
+    except Exception as e:
+        stats.seconds = time.perf_counter() - started
+        logger.error("bulk_load_failed", file=path, committed_line=stats.committed_line, error=str(e))
+        print(f"{path}: failed after line {stats.committed_line}, which is committed; "
+              f"running the load again skips the periods already loaded. {stats.describe()}", file=sys.stderr)
+        raise
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+async def bulk_load(paths: List[str], default_user: Optional[str] = None,
+                    batch_size: int = BULK_LOAD_BATCH_SIZE) -> LoadStats:
+    """
+    Load the absence periods of CSV files into the database.
+
+    Args:
+        paths: Paths of the CSV files
+        default_user: Username of the rows of files without a user column
+        batch_size: Rows inserted per transaction
+
+    Returns:
+        LoadStats of all files
+
+    Raises:
+        ValueError: If a file lacks the required columns; no file is loaded then
+        RuntimeError: If the database schema is not up to date
+    """
+    # Check every header first, so a bad file is found before any rows are loaded
+    for path in paths:
+        with open(path, "r", newline="") as csv_file:
+            user_column(path, csv.DictReader(csv_file).fieldnames, default_user)
+
+    await init_db()
+    try:
+        current_version = await get_schema_version()
+        if current_version < LATEST_VERSION:
+            raise RuntimeError(
+                f"Database schema is at version {current_version} but version {LATEST_VERSION} is required. "
+                "Run 'python migrations.py' first."
+            )
+
+        resolver = UserResolver()
+        total = LoadStats()
+        for path in paths:
+            stats = await load_file(path, default_user, batch_size, resolver)
+            print(f"{path}: {stats.describe()}")
+            total.add(stats)
+        return total
+    finally:
+        await close_db()
+
+
+# Run a bulk load if this file is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load absence periods from CSV files")
+    parser.add_argument("files", nargs="+", help="CSV files with start_date and end_date columns")
+    parser.add_argument("--user", help="Username of the periods of files without a user_id, username or email column")
+    parser.add_argument("--batch-size", type=int, default=BULK_LOAD_BATCH_SIZE,
+                        help=f"Rows inserted per transaction (default: {BULK_LOAD_BATCH_SIZE})")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    try:
+        total = asyncio.run(bulk_load(args.files, args.user, args.batch_size))
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if len(args.files) > 1:
+        print(f"Total: {total.describe()}")
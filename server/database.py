@@ -1,6 +1,9 @@
 from tortoise import Tortoise
 import os
 
+# Database backend: "postgres" (default) or "sqlite" for single-node and test deployments
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+
 # Get database connection details from environment variables
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
@@ -8,12 +11,55 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "absence_calculator")
 
-# Tortoise ORM database URL
-DATABASE_URL = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# SQLite settings: a database file, or ":memory:" for a throwaway in-memory database
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH", ":memory:")
+DB_SQLITE_JOURNAL_MODE = os.getenv("DB_SQLITE_JOURNAL_MODE", "WAL")
+DB_SQLITE_SYNCHRONOUS = os.getenv("DB_SQLITE_SYNCHRONOUS", "NORMAL")
+
+# Largest number of PostgreSQL connections in the pool of this process (the
+# asyncpg default of 5 if unset); serve.py sets it to each worker's share
+DB_POOL_MAXSIZE = os.getenv("DB_POOL_MAXSIZE")
+
+# Tortoise ORM database URL (DATABASE_URL overrides the DB_* settings, e.g. for load tests)
+DATABASE_URL = os.getenv("DATABASE_URL")
+if DATABASE_URL:
+    DB_BACKEND = "sqlite" if DATABASE_URL.startswith("sqlite:") else "postgres"
+
+if DB_BACKEND not in ("postgres", "sqlite"):
+    raise ValueError(f"Unsupported DB_BACKEND: {DB_BACKEND} (expected 'postgres' or 'sqlite')")
+
+
+def is_postgres():
+    """Whether the configured backend is PostgreSQL"""
+    return DB_BACKEND == "postgres"
+
+
+def build_connection():
+    """Build the Tortoise connection settings for the configured backend"""
+    if DATABASE_URL:
+        return DATABASE_URL
+
+    if DB_BACKEND == "sqlite":
+        # WAL lets readers proceed while a write is in progress; it does not
+        # apply to in-memory databases, where SQLite ignores the setting
+        return {
+            "engine": "tortoise.backends.sqlite",
+            "credentials": {
+                "file_path": DB_SQLITE_PATH,
+                "journal_mode": DB_SQLITE_JOURNAL_MODE,
+                "synchronous": DB_SQLITE_SYNCHRONOUS,
+            },
+        }
+
+    url = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    if DB_POOL_MAXSIZE:
+        url += f"?minsize=1&maxsize={int(DB_POOL_MAXSIZE)}"
+    return url
+
 
 # Tortoise ORM models configuration
 TORTOISE_ORM = {
-    "connections": {"default": DATABASE_URL},
+    "connections": {"default": build_connection()},
     "apps": {
         "models": {
             "models": ["models"],
@@ -25,9 +71,8 @@ TORTOISE_ORM = {
 # Initialize Tortoise ORM
 async def init_db():
     """Initialize the Tortoise ORM with the database connection"""
+    # Schemas are created and updated by migrations.py, not on every start
     await Tortoise.init(config=TORTOISE_ORM)
-    # Generate schemas if needed
-    await Tortoise.generate_schemas()
 
 # Close Tortoise ORM connection
 async def close_db():
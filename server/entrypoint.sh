@@ -11,4 +11,5 @@ python -c "import asyncio; from migrations import initialize_database; asyncio.r
 echo "Database initialization complete."
 
 echo "Starting application..."
-exec uvicorn app:app --host 0.0.0.0 --port 5001 "$@"
+# The pre-fork supervisor runs WEB_CONCURRENCY workers (see serve.py)
+exec python serve.py --host 0.0.0.0 --port 5001 "$@"
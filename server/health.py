@@ -1,5 +1,13 @@
 from fastapi import APIRouter
-from database import init_db, close_db
+from migrations import ensure_schema_ready
+from timing import phase, mark, startup_report, log_startup_report
+from utils.compression import compression_report
+from utils.admission import admission_report
+from periods.intervals import period_indexes
+from jobs import jobs_report
+from logs import logging_report
+from tracing import tracing_report
+from workers import workers_report, start_metrics_writer, stop_metrics_writer
 
 # Create a router for health-related endpoints
 health_router = APIRouter(tags=["health"])
@@ -10,17 +18,76 @@ async def health_check():
     """Health check endpoint to verify the API is running"""
     return {"status": "healthy"}
 
+# Startup timings endpoint
+@health_router.get("/api/health/startup")
+async def startup_timings():
+    """Import and startup phase timings of this server process, in milliseconds"""
+    return startup_report()
+
+# Response compression endpoint
+@health_router.get("/api/health/compression")
+async def compression_stats():
+    """Response compression totals of this server process, including time spent compressing"""
+    return compression_report()
+
+# Admission control endpoint
+@health_router.get("/api/health/admission")
+async def admission_stats():
+    """Admitted and shed requests per rate-limited route of this server process"""
+    return admission_report()
+
+# Worker metrics endpoint
+@health_router.get("/api/health/workers")
+async def worker_stats():
+    """Metrics of every worker started by serve.py and their totals (this process only otherwise)"""
+    return workers_report()
+
+# Interval index cache endpoint
+@health_router.get("/api/health/period-index")
+async def period_index_stats():
+    """Interval index cache totals of this server process"""
+    return period_indexes.report()
+
+# Calculation jobs endpoint
+@health_router.get("/api/health/jobs")
+async def job_stats():
+    """Calculation jobs queued, deduplicated, refused and finished in this server process"""
+    return jobs_report()
+
+# Logging endpoint
+@health_router.get("/api/health/logging")
+async def logging_stats():
+    """Log records queued, dropped and written, and requests logged or sampled out, in this server process"""
+    return logging_report()
+
+# Query tracing endpoint
+@health_router.get("/api/health/queries")
+async def query_stats():
+    """Queries per route, their time and the requests over the query budget, in this server process"""
+    return tracing_report()
+
 # Database event handlers
-async def startup_db_client():
-    """Initialize Tortoise ORM on application startup"""
-    await init_db()
+async def begin_startup():
+    """Mark the start of the application startup events"""
+    mark("startup.begin")
 
-async def shutdown_db_client():
-    """Close Tortoise ORM connections on application shutdown"""
-    await close_db()
+async def startup_db_client():
+    """Check the database schema version on application startup"""
+    # Tortoise connects in its own startup handler, which runs just before this one
+    mark("startup.db_connected")
+    with phase("startup.schema_check"):
+        await ensure_schema_ready()
+    mark("startup.complete")
+    log_startup_report()
 
 # Function to register events with the FastAPI app
 def register_db_events(app):
-    """Register database startup and shutdown events with the FastAPI app"""
+    """
+    Register database startup events with the FastAPI app.
+
+    Must be called after register_tortoise, which opens and closes the connections.
+    """
     app.add_event_handler("startup", startup_db_client)
-    app.add_event_handler("shutdown", shutdown_db_client)
+    # Share this worker's metrics with the others when running under serve.py
+    app.add_event_handler("startup", start_metrics_writer)
+    app.add_event_handler("shutdown", stop_metrics_writer)
@@ -0,0 +1,2 @@
+from .routes import router as jobs_router
+from .queue import start_job_queue, stop_job_queue, jobs_report
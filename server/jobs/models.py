@@ -0,0 +1,15 @@
+from pydantic import field_validator
+from typing import Optional
+
+from periods.models import CalculationRequest
+from .queue import validate_callback_url
+
+class JobRequest(CalculationRequest):
+    # URL that receives the finished job as a POST, restricted to JOBS_CALLBACK_HOSTS
+    callback_url: Optional[str] = None
+    
+    @field_validator('callback_url')
+    def validate_callback(cls, v):
+        if v is not None:
+            validate_callback_url(v)
+        return v
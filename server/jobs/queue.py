@@ -0,0 +1,348 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+import uuid
+
+from logs import get_logger
+from utils.responses import render_json
+
+# Calculations running at the same time in this process
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+
+# Jobs waiting for a worker in this process; more are refused
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", "100"))
+
+# Seconds a finished job and its result are kept
+JOBS_RESULT_TTL_SECONDS = float(os.getenv("JOBS_RESULT_TTL_SECONDS", "600"))
+
+# Seconds after which a job that is still queued or running is taken to have
+# been abandoned by a worker that died, and may be replaced by a new submission;
+# far longer than any calculation takes
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "300"))
+
+# Directory of the job records. serve.py points all workers at the same one, so
+# any worker can answer a poll; jobs run in the worker that accepted them.
+# Without it, a directory of this process is used and removed when it stops.
+JOBS_DIR = os.getenv("JOBS_DIR")
+
+# Hosts that callbacks may be sent to: callbacks are for local consumers only
+JOBS_CALLBACK_HOSTS = set(os.getenv("JOBS_CALLBACK_HOSTS", "localhost,127.0.0.1,::1").split(","))
+
+# Seconds to wait for a callback to be accepted
+JOBS_CALLBACK_TIMEOUT = 5
+
+logger = get_logger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when JOBS_MAX_QUEUED jobs are already waiting"""
+
+def validate_callback_url(callback_url: str) -> str:
+    """
+    Check that a callback goes to a local consumer.
+
+    Raises:
+        ValueError: If the URL is not http(s) or its host is not in JOBS_CALLBACK_HOSTS
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ("http", "https") or parsed.hostname not in JOBS_CALLBACK_HOSTS:
+        raise ValueError(f"Callback URL must be http(s) on one of: {', '.join(sorted(JOBS_CALLBACK_HOSTS))}")
+    return callback_url
+
+class JobStore:
+    """
+    Job records as JSON files in a directory.
+
+    A job is claimed by its input hash with an exclusively created file, so the
+    same input submitted twice, even to different workers, gets the same job
+    while it is queued, running or holding a result. A job left queued or
+    running by a worker that died is given up after stale_seconds.
+    """
+
+    def __init__(self, directory: str, stale_seconds: float = JOBS_STALE_SECONDS):
+        self.directory = directory
+        self.stale_seconds = stale_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The record of a job, or None if it does not exist or has expired"""
+        try:
+            uuid.UUID(job_id)
+            with open(self._path(f"job-{job_id}.json")) as job_file:
+                job = json.load(job_file)
+        except (ValueError, OSError):
+            return None
+        if job["expires_at"] is not None and job["expires_at"] < time.time():
+            return None
+        return job
+
+    def is_stale(self, job: Dict[str, Any], now: float) -> bool:
+        """Whether a job has been queued or running for longer than stale_seconds"""
+        if job["status"] not in ("queued", "running"):
+            return False
+        return (job["started_at"] or job["created_at"]) < now - self.stale_seconds
+
+    def save(self, job: Dict[str, Any]):
+        """Write a job record atomically"""
+        path = self._path(f"job-{job['id']}.json")
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as job_file:
+            job_file.write(render_json(job))
+        os.replace(temporary_path, path)
+
+    def claim(self, input_hash: str, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a new job unless a live job with the same input hash exists.
+
+        Returns:
+            The existing job, or the new one
+        """
+        claim_path = self._path(f"hash-{input_hash}")
+        for _ in range(2):
+            try:
+                descriptor = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                with open(claim_path) as claim_file:
+                    existing = self.get(claim_file.read().strip())
+                if existing is not None and existing["status"] != "failed" and not self.is_stale(existing, time.time()):
+                    return existing
+                # The job expired, failed or was abandoned: take over its claim
+                os.remove(claim_path)
+                continue
+            self.save(job)
+            with os.fdopen(descriptor, "w") as claim_file:
+                claim_file.write(job["id"])
+            return job
+        # Another request took over the claim at the same moment; run without it
+        self.save(job)
+        return job
+
+    def sweep(self) -> int:
+        """
+        Delete expired jobs and their claims, and fail abandoned jobs.
+
+        Returns:
+            Number of jobs deleted
+        """
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not (name.startswith("job-") and name.endswith(".json")):
+                continue
+            try:
+                with open(self._path(name)) as job_file:
+                    job = json.load(job_file)
+            except (OSError, ValueError):
+                continue
+            if self.is_stale(job, now):
+                # Polls then see that the job will not finish
+                job["status"] = "failed"
+                job["error"] = "The server stopped before the job finished"
+                job["finished_at"] = now
+                job["expires_at"] = now + self.stale_seconds
+                self.save(job)
+                continue
+            if job["expires_at"] is None or job["expires_at"] >= now:
+                continue
+            self._release(job)
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+            removed += 1
+        return removed
+
+    def _release(self, job: Dict[str, Any]):
+        """Delete the claim of a job, unless a newer job has taken it over"""
+        claim_path = self._path(f"hash-{job['input_hash']}")
+        try:
+            with open(claim_path) as claim_file:
+                if claim_file.read().strip() == job["id"]:
+                    os.remove(claim_path)
+        except OSError:
+            pass
+
+class JobQueue:
+    """
+    Runs calculation jobs on a bounded number of worker tasks.
+
+    The calculation itself runs in a thread, so the event loop keeps serving
+    requests while a large job is computed.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOBS_WORKERS, max_queued: int = JOBS_MAX_QUEUED,
+                 ttl_seconds: float = JOBS_RESULT_TTL_SECONDS):
+        self.store = store
+        self.num_workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.tasks = []
+        self.stats = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "refused": 0}
+
+    async def start(self):
+        """Start the workers and the sweeper of expired jobs"""
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+        self.tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        """Stop the workers; running and queued jobs are failed so they can be submitted again"""
+        # Tasks of an event loop that is already closed, as when startup and
+        # shutdown run in separate loops, cannot be cancelled or awaited
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self.tasks if task.get_loop() is loop]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+        while not self.queue.empty():
+            job, _ = self.queue.get_nowait()
+            self._fail(job, "The server stopped before the job ran")
+
+    def _fail(self, job: Dict[str, Any], error: str):
+        """Record a job as failed; a new submission of its input then replaces it"""
+        job["status"] = "failed"
+        job["error"] = error
+        job["finished_at"] = time.time()
+        job["expires_at"] = job["finished_at"] + self.ttl_seconds
+        self.store.save(job)
+
+    def submit(self, user_id: str, input_hash: str, calculate: Callable[[], Dict[str, Any]],
+               callback_url: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a calculation, or return the live job with the same input.
+
+        Args:
+            user_id: ID of the user submitting the job
+            input_hash: Hash of everything the result depends on
+            calculate: Function computing the result
+            callback_url: URL that receives the finished job as a POST, if any
+
+        Returns:
+            Tuple of the job record and whether it is an existing job with the same input
+
+        Raises:
+            QueueFullError: If JOBS_MAX_QUEUED jobs are already waiting
+        """
+        if self.queue.full():
+            self.stats["refused"] += 1
+            raise QueueFullError("Too many calculation jobs are waiting")
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "input_hash": input_hash,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "callback_url": callback_url,
+            "result": None,
+            "error": None,
+        }
+        claimed = self.store.claim(input_hash, job)
+        if claimed["id"] != job["id"]:
+            self.stats["deduplicated"] += 1
+            return claimed, True
+
+        self.queue.put_nowait((job, calculate))
+        self.stats["submitted"] += 1
+        return job, False
+
+    async def _work(self):
+        while True:
+            job, calculate = await self.queue.get()
+            try:
+                await self._run(job, calculate)
+            except Exception:
+                logger.exception("calculation_job_error", job_id=job["id"])
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Dict[str, Any], calculate: Callable[[], Dict[str, Any]]):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        self.store.save(job)
+
+        try:
+            job["result"] = await asyncio.to_thread(calculate)
+            job["status"] = "succeeded"
+            self.stats["succeeded"] += 1
+        except asyncio.CancelledError:
+            # The worker is stopping; the calculation's thread cannot be stopped,
+            # but the job must not stay running for later submissions to find
+            self._fail(job, "The server stopped before the job finished")
+            self.stats["failed"] += 1
+            raise
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+            self.stats["failed"] += 1
+        job["finished_at"] = time.time()
+        job["expires_at"] = job["finished_at"] + self.ttl_seconds
+        self.store.save(job)
+
+        if job["callback_url"]:
+            try:
+                await asyncio.to_thread(send_callback, job)
+            except Exception as e:
+                logger.warning("calculation_job_callback_failed", job_id=job["id"], error=str(e))
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, self.ttl_seconds)))
+            self.store.sweep()
+
+    def report(self) -> Dict[str, Any]:
+        """Job totals of this process"""
+        return {"queued": self.queue.qsize(), "workers": self.num_workers, **self.stats}
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a job record that are sent to clients"""
+    return {key: value for key, value in job.items() if key not in ("user_id", "input_hash")}
+
+def send_callback(job: Dict[str, Any]):
+    """POST the finished job to its callback URL"""
+    request = urllib.request.Request(
+        job["callback_url"],
+        data=render_json(job_view(job)),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=JOBS_CALLBACK_TIMEOUT):
+        pass
+
+# Queue of this process, created when the application starts
+job_queue = None
+
+def get_job_queue() -> JobQueue:
+    """The job queue of this process"""
+    if job_queue is None:
+        raise RuntimeError("The calculation job queue is not running")
+    return job_queue
+
+async def start_job_queue():
+    """Create the job queue of this process and start its workers"""
+    global job_queue
+    job_queue = JobQueue(JobStore(JOBS_DIR or tempfile.mkdtemp(prefix="absence-jobs-")))
+    await job_queue.start()
+
+async def stop_job_queue():
+    """Stop the job queue of this process"""
+    if job_queue is None:
+        return
+    await job_queue.stop()
+    if not JOBS_DIR:
+        shutil.rmtree(job_queue.store.directory, ignore_errors=True)
+
+def jobs_report() -> Dict[str, Any]:
+    """Job totals of this process, or None before the queue has started"""
+    return job_queue.report() if job_queue is not None else None
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from typing import Dict
+import hashlib
+
+from auth.request_user import get_request_user
+from periods.inputs import load_calculation_input
+from periods.versioning import calculation_etag
+from absence_engine import calculate_180_day_rule
+from utils.responses import FastJSONResponse
+from .models import JobRequest
+from .queue import get_job_queue, job_view, QueueFullError
+
+router = APIRouter(prefix="/api/calculate", tags=["calculation_jobs"])
+
+@router.post('/jobs', status_code=202, response_class=FastJSONResponse)
+async def submit_calculation_job(job_request: JobRequest, request: Request, current_user: Dict = Depends(get_request_user)):
+    """
+    Queue a calculation and answer at once with the ID of its job.
+    
+    The result is polled from the URL in the Location header, and is also
+    POSTed to callback_url if one is given. Submitting the same input again
+    with the same callback_url while its job is queued, running or holding a
+    result returns that job.
+    """
+    try:
+        # The job depends on the same inputs as the calculation's ETag, per user;
+        # the callback URL is part of the key too, as a job posts to only one URL
+        etag = calculation_etag(current_user, job_request.decision_date, job_request.absence_periods, job_request.rule_sets)
+        job_key = f'{current_user["id"]}:{etag}:{job_request.callback_url or ""}'
+        input_hash = hashlib.sha256(job_key.encode()).hexdigest()
+        
+        # Stored periods are read now, so the job uses the data as of submission
+        decision_date, absence_periods, rule_sets = await load_calculation_input(job_request, current_user)
+        
+        job, deduplicated = get_job_queue().submit(
+            current_user["id"],
+            input_hash,
+            lambda: calculate_180_day_rule(absence_periods, decision_date, rule_sets),
+            job_request.callback_url,
+        )
+        
+        location = str(request.url_for("get_calculation_job", job_id=job["id"]))
+        return FastJSONResponse(
+            {"job_id": job["id"], "status": job["status"], "deduplicated": deduplicated},
+            status_code=202,
+            headers={"Location": location},
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get('/jobs/{job_id}', response_class=FastJSONResponse)
+async def get_calculation_job(job_id: str, current_user: Dict = Depends(get_request_user)):
+    """
+    Get the status of a calculation job, and its result once it has succeeded.
+    
+    Finished jobs are kept for JOBS_RESULT_TTL_SECONDS, then answer 404.
+    """
+    job = get_job_queue().store.get(job_id)
+    # Jobs of other users are reported as missing
+    if job is None or job["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
@@ -0,0 +1,300 @@
+"""
+Structured logging that keeps writes off the event loop.
+
+Log calls put the record on a bounded queue and return; a listener thread
+formats it and writes it to stderr. When the queue is full, records are
+dropped and counted instead of blocking the request that logged them.
+
+Loggers take their fields as keyword arguments:
+
+    logger = get_logger(__name__)
+    logger.info("login_succeeded", user_id=user_id)
+
+Fields named like secrets (see REDACTED_FIELDS) are never written.
+
+Variables:
+    LOG_LEVEL          Level of all loggers (default INFO)
+    LOG_LEVELS         Levels of single loggers, e.g. "auth.routes=DEBUG,tortoise=WARNING"
+    LOG_FORMAT         'json' (default) or 'text'
+    LOG_QUEUE_SIZE     Records waiting to be written before new ones are dropped (default 10000)
+    LOG_REQUESTS       1 (default) logs one line per request; 0 turns this off
+    LOG_SAMPLE_RATES   JSON object of "METHOD /path" to the share of its requests logged
+"""
+from logging.handlers import QueueHandler, QueueListener
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "1") == "1"
+
+# Share of the requests to a route that are logged; errors are always logged.
+# Health checks are polled by orchestrators every few seconds.
+DEFAULT_SAMPLE_RATES = {
+    "GET /api/health": 0.01,
+    "GET /api/health/startup": 0.01,
+}
+
+# Field names whose values are replaced before a record is written
+REDACTED_FIELDS = {"password", "password_hash", "token", "access_token", "authorization", "secret", "jwt_secret"}
+
+# Attributes every LogRecord has; anything else was passed as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Totals of this process, reported by logging_report
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "dropped": 0, "written": 0, "requests_logged": 0, "requests_sampled_out": 0}
+
+_handler = None
+_listener = None
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+def logging_report():
+    """
+    Logging totals of this process.
+
+    Returns:
+        Dictionary with the records queued, dropped because the queue was full,
+        and written, the requests logged and left out by sampling, and the
+        records waiting to be written
+    """
+    with _stats_lock:
+        report = dict(_stats)
+    report["waiting"] = _handler.queue.qsize() if _handler is not None else 0
+    return report
+
+def record_fields(record: logging.LogRecord):
+    """The fields passed to a log call, with secrets redacted"""
+    return {
+        key: "[redacted]" if key.lower() in REDACTED_FIELDS else value
+        for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES
+    }
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Readable lines of the event followed by key=value fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in record_fields(record).items())
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of waiting when the queue is full.
+
+    Uses a SimpleQueue, which has no locks of its own to take, and bounds it by
+    its size; with several threads logging the bound is approximate.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message here; formatting happens in the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            _count("dropped")
+            return
+        self.queue.put_nowait(record)
+        _count("queued")
+
+class CountingStreamHandler(logging.StreamHandler):
+    """Stream handler of the listener thread, counting the records written"""
+
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        _count("written")
+
+class StructuredLogger:
+    """
+    Logger taking the fields of a record as keyword arguments.
+
+    A thinner wrapper than logging.LoggerAdapter: a call below the level costs
+    one level check.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    # Each method checks the level itself, so the fields are not passed on twice
+
+    def log(self, level: int, event: str, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            # The fields become attributes of the record
+            self.logger._log(level, event, (), exc_info=exc_info, extra=fields)
+
+    def debug(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger._log(logging.DEBUG, event, (), extra=fields)
+
+    def info(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger._log(logging.INFO, event, (), extra=fields)
+
+    def warning(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger._log(logging.WARNING, event, (), extra=fields)
+
+    def error(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger._log(logging.ERROR, event, (), extra=fields)
+
+    def exception(self, event: str, **fields):
+        """Log at ERROR level with the exception being handled"""
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger._log(logging.ERROR, event, (), exc_info=True, extra=fields)
+
+def get_logger(name: str) -> StructuredLogger:
+    """Logger of a module, usually get_logger(__name__)"""
+    return StructuredLogger(logging.getLogger(name))
+
+def _start_listener():
+    global _listener
+    stream_handler = CountingStreamHandler(sys.stderr)
+    stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = QueueListener(_handler.queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+def _restart_after_fork():
+    # Threads do not survive fork: workers of serve.py start their own listener
+    # on a fresh queue, since the parent's listener may have been reading it
+    if _handler is not None:
+        _handler.queue = queue.SimpleQueue()
+        _start_listener()
+
+def configure_logging():
+    """
+    Send the records of all loggers through the queue.
+
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    # Skip the record attributes no formatter here writes: the caller's frame,
+    # which is looked up by walking the stack, and thread and process names
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    _handler = NonBlockingQueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(LOG_LEVEL)
+    for setting in filter(None, LOG_LEVELS.split(",")):
+        name, level = setting.split("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _start_listener()
+    os.register_at_fork(after_in_child=_restart_after_fork)
+    atexit.register(flush_logs)
+
+def flush_logs():
+    """Write the records still in the queue and stop the listener"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+def load_sample_rates(overrides=None):
+    """
+    The request log sample rates, with overrides from LOG_SAMPLE_RATES.
+
+    Args:
+        overrides: JSON string to use instead of LOG_SAMPLE_RATES
+
+    Returns:
+        Dictionary mapping "METHOD /path" to the share of requests logged
+    """
+    overrides = overrides if overrides is not None else os.getenv("LOG_SAMPLE_RATES", "")
+    return {**DEFAULT_SAMPLE_RATES, **(json.loads(overrides) if overrides else {})}
+
+request_logger = get_logger("requests")
+
+class RequestLogMiddleware:
+    """
+    Log one line per request with its route, status, duration and user, and
+    the number of queries it ran when query tracing is on.
+
+    Routes in the sample rates are logged for that share of their requests
+    only; responses with status 500 or above are always logged.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rates=None, enabled: bool = LOG_REQUESTS):
+        self.app = app
+        self.sample_rates = sample_rates if sample_rates is not None else load_sample_rates()
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = f'{scope["method"]} {scope["path"]}'
+            rate = self.sample_rates.get(route, 1.0)
+            if status_code < 500 and rate < 1.0 and random.random() >= rate:
+                _count("requests_sampled_out")
+            else:
+                _count("requests_logged")
+                state = scope.get("state", {})
+                user = state.get("user")
+                # Query totals of the request, if tracing.QueryTracingMiddleware runs
+                trace = state.get("trace")
+                request_logger.info(
+                    "request",
+                    method=scope["method"],
+                    path=scope["path"],
+                    status=status_code,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 2),
+                    user_id=user["id"] if user else None,
+                    queries=trace.queries if trace else None,
+                    db_ms=round(trace.db_seconds * 1000, 2) if trace else None,
+                )
@@ -0,0 +1,271 @@
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+from tortoise.utils import get_schema_sql
+import argparse
+import asyncio
+import os
+import sys
+
+from database import init_db, close_db, is_postgres
+from logs import get_logger, configure_logging
+from models import SchemaVersion
+
+logger = get_logger(__name__)
+
+# Key of the PostgreSQL advisory lock that serialises concurrent migration runs
+MIGRATION_LOCK_ID = 180180
+
+# Apply pending migrations when the application starts instead of in a separate
+# deploy step. On by default for SQLite, where the database lives with the app.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "0" if is_postgres() else "1") == "1"
+
+# applied_at holds timezone-aware times, as Tortoise writes them (TIMESTAMPTZ on PostgreSQL)
+CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT NOT NULL PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+async def create_version_table():
+    """Create the schema_version table if it does not exist"""
+    timestamp = "TIMESTAMPTZ" if is_postgres() else "TIMESTAMP"
+    await Tortoise.get_connection("default").execute_script(CREATE_VERSION_TABLE.format(timestamp=timestamp))
+
+
+async def create_baseline_schema(conn):
+    """Create the tables and indexes of all models that do not exist yet"""
+    schema = get_schema_sql(Tortoise.get_connection("default"), safe=True)
+    await conn.execute_script(schema)
+
+
+async def fix_legacy_absence_period_columns(conn):
+    """Add or rename columns missing from absence_periods tables created by older versions"""
+    # Only PostgreSQL databases predate the current models
+    if not is_postgres():
+        return
+
+    # Check for columns in absence_periods table
+    result_columns = await conn.execute_query("""
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name = 'absence_periods'
+    """)
+    columns = [row[0] for row in result_columns[1]]
+
+    # Check for created_at column
+    if 'created_at' not in columns:
+        logger.info("adding_column", table="absence_periods", column="created_at")
+        await conn.execute_script("""
+        ALTER TABLE absence_periods
+        ADD COLUMN created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        """)
+
+    # Check for user_id column
+    if 'user_id' not in columns:
+        # If we have a 'user_id' column but it's named differently
+        user_col = next((col for col in columns if col.endswith('_id')), None)
+        if user_col:
+            logger.info("renaming_column", table="absence_periods", column=user_col, new_name="user_id")
+            await conn.execute_script(f"""
+            ALTER TABLE absence_periods
+            RENAME COLUMN {user_col} TO user_id
+            """)
+        else:
+            logger.info("adding_column", table="absence_periods", column="user_id")
+            await conn.execute_script("""
+            ALTER TABLE absence_periods
+            ADD COLUMN user_id UUID REFERENCES users(id) ON DELETE CASCADE
+            """)
+
+
+async def get_table_columns(conn, table):
+    """Names of the columns of a table, on PostgreSQL and SQLite"""
+    if is_postgres():
+        rows = await conn.execute_query_dict(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = $1", [table]
+        )
+    else:
+        rows = await conn.execute_query_dict(
+            "SELECT name AS column_name FROM pragma_table_info(?)", [table]
+        )
+    return [row["column_name"] for row in rows]
+
+
+async def add_user_data_version(conn):
+    """Add the data_version column used for the ETags of periods and calculations"""
+    if 'data_version' in await get_table_columns(conn, 'users'):
+        return
+    logger.info("adding_column", table="users", column="data_version")
+    await conn.execute_script("""
+    ALTER TABLE users
+    ADD COLUMN data_version INT NOT NULL DEFAULT 0
+    """)
+
+
+async def add_absence_period_keyset_index(conn):
+    """Add the (user_id, start_date, id) index that the paginated period list scans"""
+    await conn.execute_script("""
+    CREATE INDEX IF NOT EXISTS idx_absence_periods_user_start_id
+    ON absence_periods (user_id, start_date, id)
+    """)
+
+
+async def add_data_version_notify_trigger(conn):
+    """
+    Announce every change of a user's data version on the data_version channel.
+
+    Every worker listens on it, so live result streams are pushed changes made
+    by any process (see periods/live.py). SQLite has no notifications.
+    """
+    if not is_postgres():
+        return
+    await conn.execute_script("""
+    CREATE OR REPLACE FUNCTION notify_data_version() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('data_version', NEW.id::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS users_data_version_notify ON users;
+    CREATE TRIGGER users_data_version_notify
+    AFTER UPDATE OF data_version ON users
+    FOR EACH ROW WHEN (NEW.data_version IS DISTINCT FROM OLD.data_version)
+    EXECUTE FUNCTION notify_data_version();
+    """)
+
+
+async def add_stream_tickets_table(conn):
+    """Add the stream_tickets table of the single-use tickets that open result streams"""
+    # The baseline schema of the current models creates only the tables that are missing
+    await create_baseline_schema(conn)
+
+
+# Ordered list of (version, description, migration). Never change a migration
+# that has been released; append a new one instead. Because the baseline schema
+# is generated from the current models, later migrations must check whether
+# their change is already present.
+MIGRATIONS = [
+    (1, "Create baseline schema", create_baseline_schema),
+    (2, "Fix legacy absence_periods columns", fix_legacy_absence_period_columns),
+    (3, "Add users.data_version", add_user_data_version),
+    (4, "Add absence_periods (user_id, start_date, id) index", add_absence_period_keyset_index),
+    (5, "Notify data version changes", add_data_version_notify_trigger),
+    (6, "Add stream_tickets table", add_stream_tickets_table),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn=None):
+    """
+    Get the latest applied schema version.
+
+    Args:
+        conn: Connection or transaction to use, defaults to the default connection
+
+    Returns:
+        The latest applied version, or 0 if no migration has been applied
+    """
+    try:
+        latest = await SchemaVersion.all().using_db(conn).order_by("-version").first()
+    except OperationalError:
+        # The schema_version table does not exist yet
+        return 0
+    return latest.version if latest else 0
+
+
+async def run_migrations():
+    """
+    Apply all pending migrations in one transaction.
+
+    Runs are idempotent: only versions newer than the recorded one are applied.
+    On PostgreSQL concurrent runs (e.g. several pods starting at once) wait for
+    each other on an advisory lock, so every migration is applied exactly once.
+
+    Returns:
+        List of the versions that were applied
+    """
+    await create_version_table()
+
+    applied = []
+    async with in_transaction("default") as conn:
+        if is_postgres():
+            await conn.execute_query(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+
+        current_version = await get_schema_version(conn)
+        for version, description, migrate in MIGRATIONS:
+            if version <= current_version:
+                continue
+            logger.info("applying_migration", version=version, description=description)
+            await migrate(conn)
+            await SchemaVersion.create(version=version, description=description, using_db=conn)
+            applied.append(version)
+
+    return applied
+
+
+async def ensure_schema_ready():
+    """
+    Make sure the database schema is usable by this build.
+
+    Called on application startup. Applies pending migrations when DB_AUTO_MIGRATE
+    is enabled, otherwise only reads the schema version, which is a single query.
+
+    Raises:
+        RuntimeError: If the schema is older than this build expects
+    """
+    if DB_AUTO_MIGRATE:
+        await run_migrations()
+        return
+
+    current_version = await get_schema_version()
+    if current_version < LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {current_version} but version {LATEST_VERSION} is required. "
+            "Run 'python migrations.py' before starting the server."
+        )
+
+
+async def initialize_database():
+    """Connect to the database, apply pending migrations and disconnect"""
+    await init_db()
+    try:
+        applied = await run_migrations()
+        if applied:
+            print(f"Applied migrations: {', '.join(str(version) for version in applied)}")
+        else:
+            print(f"Database schema is up to date (version {LATEST_VERSION})")
+    finally:
+        await close_db()
+
+
+async def print_status():
+    """Print the current and latest schema versions"""
+    await init_db()
+    try:
+        current_version = await get_schema_version()
+    finally:
+        await close_db()
+    print(f"Database schema version: {current_version} (latest: {LATEST_VERSION})")
+    return current_version >= LATEST_VERSION
+
+
+# Run migrations if this file is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--check", action="store_true",
+                        help="Only report the schema version; exit with status 1 if migrations are pending")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.check:
+        sys.exit(0 if asyncio.run(print_status()) else 1)
+
+    print("Running database schema migrations...")
+    asyncio.run(initialize_database())
+    print("Migration complete!")
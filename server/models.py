@@ -1,8 +1,6 @@
-from tortoise import fields, models, Tortoise
+from tortoise import fields, models
 from tortoise.contrib.pydantic import pydantic_model_creator
 import uuid
-import asyncio
-import os
 from datetime import datetime, timedelta, date
 
 class User(models.Model):
@@ -12,9 +10,12 @@ class User(models.Model):
     email = fields.CharField(max_length=255, unique=True)
     password_hash = fields.CharField(max_length=255)
     created_at = fields.DatetimeField(auto_now_add=True)
+    # Incremented on every change to the user's absence periods (see periods/versioning.py)
+    data_version = fields.IntField(default=0)
     
     # Define reverse relationships
     tokens: fields.ReverseRelation["Token"]
+    stream_tickets: fields.ReverseRelation["StreamTicket"]
     absence_periods: fields.ReverseRelation["AbsencePeriod"]
     
     class Meta:
@@ -47,6 +48,18 @@ class Token(models.Model):
         """Create a new token for a user"""
         return await cls.create(id=uuid.uuid4(), user=user, token=token, expires_at=expires_at)
 
+class StreamTicket(models.Model):
+    """Single-use ticket that opens one result stream (see auth/tickets.py)"""
+    ticket = fields.CharField(max_length=64, pk=True)
+    user = fields.ForeignKeyField('models.User', related_name='stream_tickets', on_delete=fields.CASCADE)
+    expires_at = fields.DatetimeField()
+    
+    class Meta:
+        table = "stream_tickets"
+    
+    def __str__(self):
+        return f"Stream ticket (expires: {self.expires_at})"
+
 class AbsencePeriod(models.Model):
     """Absence period model for tracking time away"""
     id = fields.UUIDField(pk=True)
@@ -57,6 +70,8 @@ class AbsencePeriod(models.Model):
     
     class Meta:
         table = "absence_periods"
+        # Pages of the period list are read through the (user_id, start_date, id)
+        # index created by migration 4 (see migrations.py)
     
     def __str__(self):
         return f"Absence: {self.start_date} to {self.end_date} for {self.user.username}"
@@ -75,110 +90,35 @@ class AbsencePeriod(models.Model):
             "user_id": str(self.user_id)
         }
 
-# Create Pydantic models for API validation and serialization
-User_Pydantic = pydantic_model_creator(User, name="User", exclude=("password_hash",))
-UserIn_Pydantic = pydantic_model_creator(User, name="UserIn", exclude_readonly=True, exclude=("id", "created_at"))
-Token_Pydantic = pydantic_model_creator(Token, name="Token")
-AbsencePeriod_Pydantic = pydantic_model_creator(AbsencePeriod, name="AbsencePeriod")
-AbsencePeriodIn_Pydantic = pydantic_model_creator(AbsencePeriod, name="AbsencePeriodIn", exclude_readonly=True, exclude=("id", "created_at", "user_id"))
-
-
-# Database migration utilities
-async def ensure_schema_consistency():
-    """Ensure database schema is consistent with models"""
-    # Get connection
-    conn = Tortoise.get_connection("default")
-    
-    try:
-        # Check for columns in absence_periods table
-        query_columns = """
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = 'absence_periods'
-        """
-        result_columns = await conn.execute_query(query_columns)
-        columns = [row[0] for row in result_columns[1]]
-        print(f"Existing columns in absence_periods: {columns}")
-        
-        # Check for created_at column
-        if 'created_at' not in columns:
-            print("Adding created_at column to absence_periods table...")
-            await conn.execute_script("""
-            ALTER TABLE absence_periods 
-            ADD COLUMN created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            """)
-            print("created_at column added successfully!")
-        
-        # Check for user_id column
-        if 'user_id' not in columns:
-            # If we have a 'user_id' column but it's named differently
-            if any(col.endswith('_id') for col in columns):
-                user_col = next((col for col in columns if col.endswith('_id')), None)
-                if user_col and user_col != 'user_id':
-                    print(f"Renaming column {user_col} to user_id...")
-                    await conn.execute_script(f"""
-                    ALTER TABLE absence_periods 
-                    RENAME COLUMN {user_col} TO user_id
-                    """)
-                    print("Column renamed successfully!")
-            else:
-                print("Adding user_id column to absence_periods table...")
-                await conn.execute_script("""
-                ALTER TABLE absence_periods 
-                ADD COLUMN user_id UUID REFERENCES users(id) ON DELETE CASCADE
-                """)
-                print("user_id column added successfully!")
-    except Exception as e:
-        print(f"Error ensuring schema consistency: {e}")
-
-
-def run_schema_migration():
-    """Run the schema migration function"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # Get database connection details from environment variables
-    DB_USER = os.getenv("DB_USER", "postgres")
-    DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    DB_NAME = os.getenv("DB_NAME", "absence_calculator")
-    
-    # Tortoise ORM database URL
-    DATABASE_URL = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    
-    # Tortoise ORM models configuration
-    TORTOISE_ORM = {
-        "connections": {"default": DATABASE_URL},
-        "apps": {
-            "models": {
-                "models": ["models"],
-                "default_connection": "default",
-            },
-        },
-    }
-    
-    async def _run_migration():
-        # Connect to the database
-        await Tortoise.init(config=TORTOISE_ORM)
-        
-        # Generate schemas for any missing tables
-        await Tortoise.generate_schemas()
-        
-        # Ensure schema consistency
-        await ensure_schema_consistency()
-        
-        # Close the connection
-        await Tortoise.close_connections()
-    
-    # Run the migration
-    loop.run_until_complete(_run_migration())
-    loop.close()
-
+class SchemaVersion(models.Model):
+    """Schema migrations that have been applied to the database (see migrations.py)"""
+    version = fields.IntField(pk=True, generated=False)
+    description = fields.CharField(max_length=255)
+    applied_at = fields.DatetimeField(auto_now_add=True)
+    
+    class Meta:
+        table = "schema_version"
+    
+    def __str__(self):
+        return f"Schema version {self.version}: {self.description}"
 
-# Run migration if this file is executed directly
-if __name__ == "__main__":
-    print("Running database schema migration...")
-    run_schema_migration()
-    print("Migration complete!")
+# Pydantic models for API validation and serialization. Building them is slow
+# and most processes never use them, so each one is created on first access.
+_PYDANTIC_MODELS = {
+    "User_Pydantic": lambda: pydantic_model_creator(User, name="User", exclude=("password_hash",)),
+    "UserIn_Pydantic": lambda: pydantic_model_creator(User, name="UserIn", exclude_readonly=True, exclude=("id", "created_at", "data_version")),
+    "Token_Pydantic": lambda: pydantic_model_creator(Token, name="Token"),
+    "AbsencePeriod_Pydantic": lambda: pydantic_model_creator(AbsencePeriod, name="AbsencePeriod"),
+    "AbsencePeriodIn_Pydantic": lambda: pydantic_model_creator(AbsencePeriod, name="AbsencePeriodIn", exclude_readonly=True, exclude=("id", "created_at", "user_id")),
+}
 
+def __getattr__(name):
+    """Create the Pydantic models listed in _PYDANTIC_MODELS on first access"""
+    factory = _PYDANTIC_MODELS.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    # Cache the model as a module attribute so it is only built once
+    model = factory()
+    globals()[name] = model
+    return model
@@ -1 +1,2 @@
 from .routes import router as periods_router
+from .live import start_live_listener, stop_live_listener
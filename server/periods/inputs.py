@@ -0,0 +1,41 @@
+from absence_engine import get_rule_sets
+from .intervals import period_indexes, merge_periods
+
+async def load_absence_periods(request_periods, current_user):
+    """
+    Resolve the absence periods a request calculates with.
+
+    Args:
+        request_periods: Absence periods (DateRange) sent with the request, if any
+        current_user: The user from the request state, including data_version
+
+    Returns:
+        The merged (start_date, end_date) tuples of the request, or of the user if
+        the request has none
+    """
+    if request_periods:
+        # Use provided absence periods; overlapping periods count each day once
+        return merge_periods([(period.start_date, period.end_date) for period in request_periods])
+    
+    # Get the user's merged periods from their interval index
+    index = await period_indexes.load(current_user["id"], current_user["data_version"])
+    return index.merged()
+
+async def load_calculation_input(calc_request, current_user):
+    """
+    Resolve the inputs of a calculation request.
+
+    Args:
+        calc_request: The CalculationRequest
+        current_user: The user from the request state, including data_version
+
+    Returns:
+        Tuple of the decision date, the merged (start_date, end_date) tuples to
+        calculate with, and the further rule sets requested (or None)
+    """
+    # Dates were parsed once, when the request was validated
+    decision_date = calc_request.decision_date
+    
+    absence_periods = await load_absence_periods(calc_request.absence_periods, current_user)
+    rule_sets = get_rule_sets(calc_request.rule_sets) if calc_request.rule_sets else None
+    return decision_date, absence_periods, rule_sets
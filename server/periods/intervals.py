@@ -0,0 +1,206 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import os
+
+from absence_engine import merge_periods
+from models import AbsencePeriod
+
+# What the period handlers do when a new or changed period overlaps another one
+# of the same user: 'allow' stores it as-is, 'merge' combines the overlapping
+# periods into one, 'reject' answers 409. Requests may choose with ?overlap=
+OVERLAP_MODES = ("allow", "merge", "reject")
+PERIOD_OVERLAP_MODE = os.getenv("PERIOD_OVERLAP_MODE", "allow").lower()
+
+# Number of users whose interval index is kept in memory
+PERIOD_INDEX_CACHE_SIZE = int(os.getenv("PERIOD_INDEX_CACHE_SIZE", "1024"))
+
+class IndexedPeriod(NamedTuple):
+    start_date: date
+    end_date: date
+    id: str
+
+def periods_overlap(start_date: date, end_date: date, other_start: date, other_end: date) -> bool:
+    """
+    Whether two periods overlap by more than a shared travel day.
+
+    Only the days strictly between start and end are absent, so periods that
+    overlap like this either count some days twice or, when one starts the day
+    before the other ends, can be combined without changing any count.
+    """
+    return other_start < end_date and start_date < other_end
+
+class IntervalIndex:
+    """
+    The absence periods of one user, sorted by start date.
+
+    Alongside the start dates it keeps the running maximum of the end dates,
+    which never decreases, so both ends of an overlap query are found by binary
+    search and only periods near the queried range are looked at.
+    """
+
+    def __init__(self, periods: Iterable[Tuple[str, date, date]] = ()):
+        """
+        Args:
+            periods: (id, start_date, end_date) tuples
+        """
+        self.periods: List[IndexedPeriod] = sorted(IndexedPeriod(start, end, str(period_id)) for period_id, start, end in periods)
+        self._reindex()
+
+    def _reindex(self):
+        self.starts = [period.start_date for period in self.periods]
+        self.max_ends = list(accumulate((period.end_date for period in self.periods), max))
+        self._merged = None
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __contains__(self, period_id) -> bool:
+        period_id = str(period_id)
+        return any(period.id == period_id for period in self.periods)
+
+    def add(self, period_id: str, start_date: date, end_date: date):
+        """Add a period"""
+        insort(self.periods, IndexedPeriod(start_date, end_date, str(period_id)))
+        self._reindex()
+
+    def remove(self, period_id: str):
+        """Remove a period by ID, if it is in the index"""
+        period_id = str(period_id)
+        self.periods = [period for period in self.periods if period.id != period_id]
+        self._reindex()
+
+    def overlapping(self, first_day: date, last_day: date) -> List[IndexedPeriod]:
+        """
+        Periods whose dates overlap the days from first_day to last_day, both included.
+
+        Returns:
+            Matching periods sorted by start date
+        """
+        # Periods from `last` on start after the range; periods before `first`
+        # (and every period before them) end before it
+        last = bisect_right(self.starts, last_day)
+        first = bisect_left(self.max_ends, first_day, 0, last)
+        return [period for period in self.periods[first:last] if period.end_date >= first_day]
+
+    def conflicts(self, start_date: date, end_date: date, exclude_id: Optional[str] = None) -> List[IndexedPeriod]:
+        """
+        Periods that overlap a new or changed period (see periods_overlap).
+
+        Args:
+            start_date: Start date of the new or changed period
+            end_date: End date of the new or changed period
+            exclude_id: ID of the period being changed, which never conflicts with itself
+
+        Returns:
+            Conflicting periods sorted by start date
+        """
+        exclude_id = str(exclude_id) if exclude_id is not None else None
+        # Periods starting before end_date and ending after start_date
+        return [
+            period for period in self.overlapping(start_date + timedelta(days=1), end_date - timedelta(days=1))
+            if period.id != exclude_id
+            and periods_overlap(start_date, end_date, period.start_date, period.end_date)
+        ]
+
+    def merged(self) -> List[Tuple[date, date]]:
+        """The minimal non-overlapping periods with the same absence days (see merge_periods)"""
+        if self._merged is None:
+            # The periods are sorted already, so this is a single pass
+            self._merged = merge_periods((period.start_date, period.end_date) for period in self.periods)
+        return list(self._merged)
+
+async def load_period_index(user_id: str, connection=None) -> IntervalIndex:
+    """Build the index of a user's periods from the database, through connection if given"""
+    rows = await AbsencePeriod.filter(user_id=str(user_id)).using_db(connection).values_list("id", "start_date", "end_date")
+    return IntervalIndex(rows)
+
+class PeriodIndexCache:
+    """
+    Interval indexes of recently active users, validated by their data version.
+
+    An index is used only while its version equals the user's current data
+    version, so a change made by another process makes it stale and it is
+    rebuilt from the database. Changes made by this process are applied to the
+    cached index directly.
+    """
+
+    def __init__(self, max_users: int = PERIOD_INDEX_CACHE_SIZE):
+        self.max_users = max_users
+        self.indexes: "OrderedDict[str, Tuple[int, IntervalIndex]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "builds": 0, "updates": 0, "invalidations": 0}
+
+    async def load(self, user_id: str, data_version: int, connection=None) -> IntervalIndex:
+        """
+        Return the index of a user at a data version, building it if needed.
+
+        Args:
+            user_id: ID of the user
+            data_version: The user's current data version
+            connection: Connection to build the index through, if not the default one
+        """
+        user_id = str(user_id)
+        cached = self.indexes.get(user_id)
+        if cached is not None and cached[0] == data_version:
+            self.indexes.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return cached[1]
+
+        index = await load_period_index(user_id, connection)
+        self.stats["builds"] += 1
+        self.store(user_id, data_version, index)
+        return index
+
+    def store(self, user_id: str, data_version: int, index: IntervalIndex):
+        """Cache an index, dropping the least recently used one when full"""
+        self.indexes[str(user_id)] = (data_version, index)
+        self.indexes.move_to_end(str(user_id))
+        while len(self.indexes) > self.max_users:
+            self.indexes.popitem(last=False)
+
+    def apply(self, user_id: str, previous_version: int, new_version: int, change: Callable[[IntervalIndex], None]):
+        """
+        Apply a change saved by this process to the cached index of a user.
+
+        The change is applied only if it is the one change between the two
+        versions and the cached index is at the previous version. Otherwise
+        the index is dropped and rebuilt on its next use.
+
+        Args:
+            user_id: ID of the user
+            previous_version: Data version the request saw before the change
+            new_version: Data version after the change (see bump_data_version)
+            change: Function updating the index in place
+        """
+        user_id = str(user_id)
+        cached = self.indexes.get(user_id)
+        if cached is None:
+            return
+        if cached[0] != previous_version or new_version != previous_version + 1:
+            del self.indexes[user_id]
+            self.stats["invalidations"] += 1
+            return
+        change(cached[1])
+        self.indexes[user_id] = (new_version, cached[1])
+        self.stats["updates"] += 1
+
+    def report(self) -> Dict[str, int]:
+        """Cache totals of this process"""
+        return {"users": len(self.indexes), **self.stats}
+
+def resolve_overlap_mode(requested: Optional[str]) -> str:
+    """
+    The overlap mode of a request: the ?overlap= parameter or PERIOD_OVERLAP_MODE.
+
+    Raises:
+        ValueError: If the mode is not one of OVERLAP_MODES
+    """
+    mode = (requested or PERIOD_OVERLAP_MODE).lower()
+    if mode not in OVERLAP_MODES:
+        raise ValueError(f"Overlap mode must be one of: {', '.join(OVERLAP_MODES)}")
+    return mode
+
+# Indexes shared by the routes of this process
+period_indexes = PeriodIndexCache()
@@ -0,0 +1,267 @@
+from datetime import date
+from typing import Dict, Set
+import asyncio
+import os
+import time
+
+from tortoise import Tortoise
+
+from database import is_postgres
+from logs import get_logger
+from models import User
+from .intervals import period_indexes
+from absence_engine import calculate_180_day_rule
+from utils.responses import render_json
+
+# Quiet time after a change before results are pushed; bursts of edits within
+# this window are coalesced into a single recalculation
+LIVE_DEBOUNCE_SECONDS = float(os.getenv("LIVE_DEBOUNCE_MS", "250")) / 1000
+
+# Seconds between keep-alive comments on an idle stream
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# Streams are closed after this many seconds and the browser reconnects, so a
+# server shutdown never waits long for open streams and expired tokens are noticed
+LIVE_MAX_STREAM_SECONDS = float(os.getenv("LIVE_MAX_STREAM_SECONDS", "300"))
+
+# Milliseconds the browser waits before reconnecting a closed stream
+LIVE_RETRY_MS = 2000
+
+# PostgreSQL channel announcing the ID of every user whose data version changed
+# (by the trigger of migration 5), whichever process made the change
+DATA_VERSION_CHANNEL = "data_version"
+
+# Seconds between attempts to reconnect a lost listening connection
+LIVE_LISTEN_RETRY_SECONDS = 5.0
+
+logger = get_logger(__name__)
+
+class Subscription:
+    """One open result stream of a user for one decision date"""
+
+    def __init__(self, user_id: str, decision_date: date):
+        self.user_id = user_id
+        self.decision_date = decision_date
+        # Holds at most the latest event; older unsent results are replaced
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def push(self, event: bytes):
+        """Queue an event, replacing one that has not been sent yet"""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+class LiveHub:
+    """
+    Pushes recalculated results to the open streams of a user.
+
+    Period changes call notify(). Changes are debounced per user: the periods are
+    loaded once after LIVE_DEBOUNCE_SECONDS without further changes, and the rule
+    is calculated once per distinct decision date, however many streams are open.
+
+    The hub only knows the streams of its own process. On PostgreSQL a
+    ChangeListener calls notify() for the changes of every process; without
+    one (on SQLite) only the changes of this process are pushed.
+    """
+
+    def __init__(self, debounce_seconds: float = LIVE_DEBOUNCE_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.subscriptions: Dict[str, Set[Subscription]] = {}
+        self.dirty: Set[str] = set()
+        self.pending: Dict[str, asyncio.Task] = {}
+        # Whether a ChangeListener is connected and reports every change
+        self.listening = False
+
+    def subscribe(self, user_id: str, decision_date: date) -> Subscription:
+        """Register a stream of a user for a decision date"""
+        subscription = Subscription(user_id, decision_date)
+        self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a closed stream"""
+        subscriptions = self.subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self.subscriptions[subscription.user_id]
+
+    def notify(self, user_id: str):
+        """
+        Schedule a push of new results after the periods of a user changed.
+
+        Args:
+            user_id: ID of the user whose periods changed
+        """
+        if user_id not in self.subscriptions:
+            return
+        self.dirty.add(user_id)
+        if user_id not in self.pending:
+            self.pending[user_id] = asyncio.create_task(self._publish_when_quiet(user_id))
+
+    async def _publish_when_quiet(self, user_id: str):
+        """Publish results once no change arrived for debounce_seconds"""
+        try:
+            while user_id in self.dirty:
+                self.dirty.discard(user_id)
+                await asyncio.sleep(self.debounce_seconds)
+                if user_id in self.dirty:
+                    # Another change arrived while waiting; wait for it to settle too
+                    continue
+                await self.publish(user_id)
+        except Exception:
+            logger.exception("live_recalculation_error", user_id=user_id)
+        finally:
+            self.pending.pop(user_id, None)
+
+    async def publish(self, user_id: str):
+        """Load the periods of a user once and push results to all of their streams"""
+        subscriptions = list(self.subscriptions.get(user_id, ()))
+        if not subscriptions:
+            return
+
+        data_version, absence_periods = await load_user_periods(user_id)
+        events = {}
+        for subscription in subscriptions:
+            if subscription.decision_date not in events:
+                events[subscription.decision_date] = result_event(data_version, absence_periods, subscription.decision_date)
+            subscription.push(events[subscription.decision_date])
+
+class ChangeListener:
+    """
+    Forwards the data version changes announced on DATA_VERSION_CHANNEL to a hub.
+
+    Holds one PostgreSQL connection of its own for LISTEN, outside the pool.
+    A lost connection is reopened after LIVE_LISTEN_RETRY_SECONDS, and every
+    open stream is then refreshed, since changes may have been missed.
+    """
+
+    def __init__(self, hub: LiveHub):
+        self.hub = hub
+        self.task = None
+
+    def start(self):
+        """Start listening in the background"""
+        self.task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop listening and close the connection"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def _on_notification(self, connection, pid, channel, user_id):
+        self.hub.notify(user_id)
+
+    async def _listen(self):
+        import asyncpg
+
+        client = Tortoise.get_connection("default")
+        while True:
+            try:
+                connection = await asyncpg.connect(user=client.user, password=client.password, host=client.host,
+                                                   port=client.port, database=client.database)
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("live_listener_connect_failed", error=str(e))
+                await asyncio.sleep(LIVE_LISTEN_RETRY_SECONDS)
+                continue
+
+            closed = asyncio.get_running_loop().create_future()
+
+            def on_close(_):
+                if not closed.done():
+                    closed.set_result(None)
+
+            try:
+                connection.add_termination_listener(on_close)
+                await connection.add_listener(DATA_VERSION_CHANNEL, self._on_notification)
+                self.hub.listening = True
+                for user_id in list(self.hub.subscriptions):
+                    self.hub.notify(user_id)
+                await closed
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("live_listener_failed", error=str(e))
+            finally:
+                self.hub.listening = False
+                connection.terminate()
+            logger.warning("live_listener_disconnected")
+            await asyncio.sleep(LIVE_LISTEN_RETRY_SECONDS)
+
+async def load_user_periods(user_id: str):
+    """
+    Load the data version and absence periods of a user.
+
+    The version is read first, so the periods are at least as new as the version.
+
+    Returns:
+        Tuple of the data version and a list of merged (start_date, end_date) tuples
+    """
+    data_version = await User.filter(id=user_id).first().values_list("data_version", flat=True)
+    index = await period_indexes.load(user_id, data_version)
+    return data_version, index.merged()
+
+def result_event(data_version: int, absence_periods, decision_date: date) -> bytes:
+    """
+    Calculate the rule and format the result as a server-sent event.
+
+    Args:
+        data_version: Data version the periods belong to, sent as the event id
+        absence_periods: List of (start_date, end_date) tuples
+        decision_date: The decision date
+
+    Returns:
+        The encoded 'result' event
+    """
+    result = calculate_180_day_rule(absence_periods, decision_date)
+    return b"event: result\nid: %d\ndata: %s\n\n" % (data_version, render_json(result))
+
+async def result_stream(subscription: Subscription, hub: LiveHub, is_disconnected, send_current: bool = True):
+    """
+    Generate the events of one stream.
+
+    Sends the current result first and then every pushed result, with keep-alive
+    comments while idle. Ends after LIVE_MAX_STREAM_SECONDS or when the client
+    disconnects.
+
+    Args:
+        subscription: The stream's subscription, already registered with the hub
+        hub: The hub the subscription belongs to
+        is_disconnected: Coroutine function telling whether the client is gone
+        send_current: False if the client already has the current result, e.g.
+            when it reconnects with the current data version as Last-Event-ID
+    """
+    try:
+        yield b"retry: %d\n\n" % LIVE_RETRY_MS
+        if send_current:
+            data_version, absence_periods = await load_user_periods(subscription.user_id)
+            yield result_event(data_version, absence_periods, subscription.decision_date)
+
+        closes_at = time.monotonic() + LIVE_MAX_STREAM_SECONDS
+        while time.monotonic() < closes_at:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+# Hub shared by the routes of this process
+live_hub = LiveHub()
+live_listener = ChangeListener(live_hub)
+
+async def start_live_listener():
+    """Push the changes of every process to the streams of this one (PostgreSQL only)"""
+    if is_postgres():
+        live_listener.start()
+
+async def stop_live_listener():
+    """Stop listening for changes"""
+    await live_listener.stop()
@@ -1,48 +1,104 @@
-from pydantic import BaseModel, field_validator, ConfigDict
-from typing import List, Optional, Dict
-from datetime import datetime
+from pydantic import BaseModel, BeforeValidator, field_validator, ConfigDict
+from typing import Annotated, List, Optional
+from datetime import date, datetime
 
-class AbsencePeriodBase(BaseModel):
+from absence_engine import get_rule_sets, DEFAULT_RULE_SET
+from utils.dates import parse_iso_date
+
+def check_iso_date(value):
+    """
+    Accept exactly the YYYY-MM-DD strings that query strings and bulk loads accept.
+
+    Pydantic's own date parsing also takes integers, Unix timestamps and
+    datetimes at midnight, which the other input paths reject.
+    """
+    if isinstance(value, str):
+        return parse_iso_date(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    raise ValueError("Dates must be in format YYYY-MM-DD")
+
+# Dates are parsed once, when the request is validated, so handlers and the
+# calculation receive datetime.date values
+IsoDate = Annotated[date, BeforeValidator(check_iso_date)]
+
+class DateRange(BaseModel):
     model_config = ConfigDict(extra='ignore')
-    start_date: str
-    end_date: str
-    
-    @field_validator('start_date', 'end_date')
-    def validate_date_format(cls, v):
-        try:
-            datetime.strptime(v, "%Y-%m-%d")
-            return v
-        except ValueError:
-            raise ValueError("Date must be in format YYYY-MM-DD")
-    
+    start_date: IsoDate
+    end_date: IsoDate
+
+class AbsencePeriodBase(DateRange):
     @field_validator('end_date')
     def validate_end_date(cls, v, info):
+        # start_date is missing from info.data when it failed validation
         start_date = info.data.get('start_date')
-        if start_date:
-            try:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                end = datetime.strptime(v, "%Y-%m-%d")
-                if end < start:
-                    raise ValueError("End date must be after start date")
-            except ValueError as e:
-                if "format" not in str(e):  # Only re-raise if it's our custom error
-                    raise
+        if start_date and v < start_date:
+            raise ValueError("End date must be after start date")
         return v
 
 class AbsencePeriodResponse(BaseModel):
     id: str
     start_date: str
     end_date: str
+    # IDs of the overlapping periods this one replaced in 'merge' overlap mode
+    merged_ids: List[str] = []
+
+def check_period_order(periods):
+    """
+    Check that no period of a request ends before it starts.
+
+    Checked in one pass over the list rather than by a validator per period,
+    which costs a Python call for each of possibly thousands of periods.
+    """
+    for position, period in enumerate(periods or []):
+        if period.end_date < period.start_date:
+            raise ValueError(f"End date must be after start date (period {position})")
+    return periods
 
 class CalculationRequest(BaseModel):
     model_config = ConfigDict(extra='ignore')
-    decision_date: str
-    absence_periods: Optional[List[Dict[str, str]]] = None
+    decision_date: IsoDate
+    absence_periods: Optional[List[DateRange]] = None
+    rule_sets: Optional[List[str]] = None
+    
+    @field_validator('absence_periods')
+    def validate_periods(cls, v):
+        return check_period_order(v)
+    
+    @field_validator('rule_sets')
+    def validate_rule_sets(cls, v):
+        if v is not None:
+            # Raises ValueError naming the unknown and the available rule sets
+            get_rule_sets(v)
+        return v
+
+# Most departure dates of one trip plan request, and the most days between the
+# earliest and latest of them (the planner builds one series spanning them all)
+TRIP_PLAN_MAX_DEPARTURES = 366
+TRIP_PLAN_MAX_SPAN_DAYS = 3660
+
+class TripPlanRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+    departure_dates: List[IsoDate]
+    rule_set: str = DEFAULT_RULE_SET.name
+    absence_periods: Optional[List[DateRange]] = None
+    
+    @field_validator('departure_dates')
+    def validate_departure_dates(cls, v):
+        if not v:
+            raise ValueError("At least one departure date is required")
+        if len(v) > TRIP_PLAN_MAX_DEPARTURES:
+            raise ValueError(f"At most {TRIP_PLAN_MAX_DEPARTURES} departure dates can be planned at once")
+        if (max(v) - min(v)).days > TRIP_PLAN_MAX_SPAN_DAYS:
+            raise ValueError(f"Departure dates must be within {TRIP_PLAN_MAX_SPAN_DAYS} days of each other")
+        return v
+    
+    @field_validator('rule_set')
+    def validate_rule_set(cls, v):
+        # Raises ValueError naming the unknown and the available rule sets
+        get_rule_sets([v])
+        return v
     
-    @field_validator('decision_date')
-    def validate_decision_date(cls, v):
-        try:
-            datetime.strptime(v, "%Y-%m-%d")
-            return v
-        except ValueError:
-            raise ValueError("Decision date must be in format YYYY-MM-DD")
+    @field_validator('absence_periods')
+    def validate_periods(cls, v):
+        return check_period_order(v)
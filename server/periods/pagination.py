@@ -0,0 +1,81 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from typing import List, Optional, Tuple
+import os
+import uuid
+
+from tortoise.expressions import Q
+
+from models import AbsencePeriod
+from utils.dates import parse_iso_date
+
+# Periods per page of GET /api/absence-periods when no limit is given, and the
+# largest limit a request may ask for
+PERIODS_PAGE_SIZE = int(os.getenv("PERIODS_PAGE_SIZE", "200"))
+PERIODS_MAX_PAGE_SIZE = int(os.getenv("PERIODS_MAX_PAGE_SIZE", "1000"))
+
+def encode_cursor(start_date: date, period_id) -> str:
+    """
+    Cursor pointing after a period in (start_date, id) order.
+
+    Returns:
+        Opaque URL-safe string
+    """
+    raw = f"{start_date.strftime('%Y-%m-%d')}|{period_id}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[date, uuid.UUID]:
+    """
+    Read a cursor made by encode_cursor.
+
+    Returns:
+        Tuple of the start date and ID of the last period of the previous page
+
+    Raises:
+        ValueError: If the cursor is not valid
+    """
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start_date, period_id = raw.split("|")
+        return parse_iso_date(start_date), uuid.UUID(period_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+async def fetch_period_page(user_id: str, limit: int, cursor: Optional[str] = None,
+                            from_date: Optional[date] = None, to_date: Optional[date] = None) -> Tuple[List[AbsencePeriod], Optional[str]]:
+    """
+    Load one page of a user's absence periods ordered by (start_date, id).
+
+    The page starts after the cursor instead of at an offset, so every page is
+    one range scan of the (user_id, start_date, id) index, however far into
+    the history it is.
+
+    Args:
+        user_id: ID of the user
+        limit: Maximum number of periods on the page
+        cursor: Cursor returned with the previous page, if any
+        from_date: Only periods ending on or after this date
+        to_date: Only periods starting on or before this date
+
+    Returns:
+        Tuple of the periods and the cursor of the next page, or None on the last page
+
+    Raises:
+        ValueError: If the cursor is not valid
+    """
+    # Periods overlapping the range, including those that start before it
+    query = AbsencePeriod.filter(user_id=user_id)
+    if from_date is not None:
+        query = query.filter(end_date__gte=from_date)
+    if to_date is not None:
+        query = query.filter(start_date__lte=to_date)
+    if cursor:
+        after_start, after_id = decode_cursor(cursor)
+        query = query.filter(Q(start_date__gt=after_start) | Q(start_date=after_start, id__gt=after_id))
+
+    # One extra row tells whether there is a next page
+    periods = await query.order_by("start_date", "id").limit(limit + 1)
+    if len(periods) <= limit:
+        return periods, None
+    periods = periods[:limit]
+    return periods, encode_cursor(periods[-1].start_date, periods[-1].id)
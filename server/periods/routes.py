@@ -1,73 +1,235 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from tortoise.transactions import in_transaction
+from typing import List, Dict, Optional
 import uuid
-from datetime import datetime
 
-from models import AbsencePeriod, User
+from models import AbsencePeriod
 from auth.request_user import get_request_user
-from .models import AbsencePeriodBase, AbsencePeriodResponse, CalculationRequest
-from utils.calculation import calculate_180_day_rule
+from .models import AbsencePeriodBase, AbsencePeriodResponse, CalculationRequest, TripPlanRequest
+from .inputs import load_calculation_input, load_absence_periods
+from .intervals import period_indexes, resolve_overlap_mode
+from .live import live_hub, result_stream
+from .pagination import fetch_period_page, PERIODS_PAGE_SIZE, PERIODS_MAX_PAGE_SIZE
+from .versioning import lock_user, bump_data_version, notify_data_change, periods_etag, calculation_etag, etag_matches, CACHE_CONTROL
+from absence_engine import (
+    calculate_180_day_rule, evaluate_rule_sets, chart_series, plan_trips, get_rule_sets, RULE_SETS, DEFAULT_RULE_SET,
+)
+from utils.dates import parse_iso_date
+from utils.responses import FastJSONResponse
+from tracing import trace_phase
 
 router = APIRouter(prefix="/api", tags=["absence_periods"])
 
 @router.get('/absence-periods', response_model=List[Dict])
-async def get_absence_periods(request: Request, current_user: Dict = Depends(get_request_user)):
-    """Get all absence periods for the current user"""
-    user = await User.get(id=current_user["id"])
-    periods = await AbsencePeriod.filter(user=user)
+async def get_absence_periods(request: Request, response: Response,
+                              limit: int = Query(PERIODS_PAGE_SIZE, ge=1, le=PERIODS_MAX_PAGE_SIZE),
+                              cursor: Optional[str] = None,
+                              from_date: Optional[str] = Query(None, alias="from"),
+                              to_date: Optional[str] = Query(None, alias="to"),
+                              current_user: Dict = Depends(get_request_user)):
+    """
+    Get a page of the current user's absence periods, ordered by start date.
+    
+    The optional 'from' and 'to' dates keep periods that overlap that range:
+    those ending on or after 'from' and starting on or before 'to'.
+    When there are more periods, the X-Next-Cursor and Link headers hold the
+    cursor of the next page, which is passed back as 'cursor'.
+    """
+    try:
+        first_day = parse_iso_date(from_date) if from_date else None
+        last_day = parse_iso_date(to_date) if to_date else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be in format YYYY-MM-DD")
+    
+    # Answer 304 without loading the periods if the client's copy of this page is current
+    etag = periods_etag(current_user, request.url.query)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    
+    try:
+        periods, next_cursor = await fetch_period_page(current_user["id"], limit, cursor, first_day, last_day)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     return [period.to_dict() for period in periods]
 
+# ?overlap= chooses what happens when a period overlaps another one (see periods/intervals.py)
+OVERLAP_QUERY = Query(None, pattern="^(allow|merge|reject)$")
+
+def period_summary(period):
+    """Format an indexed period for a response"""
+    return {
+        "id": period.id,
+        "start_date": period.start_date.strftime("%Y-%m-%d"),
+        "end_date": period.end_date.strftime("%Y-%m-%d")
+    }
+
+async def resolve_overlaps(connection, user_id, data_version, mode, start_date, end_date, period_id=None):
+    """
+    Check a new or changed period against the user's other periods.
+    
+    Must be called in the transaction that saves the period, after lock_user,
+    so no change saved by another request can come between the check and the
+    save and create an overlap.
+    
+    Args:
+        connection: The transaction that saves the period
+        user_id: ID of the user
+        data_version: The user's data version returned by lock_user
+        mode: 'allow', 'merge' or 'reject'
+        start_date: Start date of the new or changed period
+        end_date: End date of the new or changed period
+        period_id: ID of the period being changed, if any
+    
+    Returns:
+        Tuple of the (start_date, end_date) to store and the periods it absorbs
+    
+    Raises:
+        HTTPException: 409 listing the overlapping periods in 'reject' mode
+    """
+    if mode == "allow":
+        return (start_date, end_date), []
+    
+    # Every change bumps the data version as it is saved, so under the lock an
+    # index cached at the user's version holds every period
+    index = await period_indexes.load(user_id, data_version, connection)
+    conflicts = index.conflicts(start_date, end_date, exclude_id=period_id)
+    if conflicts and mode == "reject":
+        raise HTTPException(status_code=409, detail={
+            "message": "Period overlaps existing absence periods",
+            "conflicts": [period_summary(conflict) for conflict in conflicts]
+        })
+    
+    # Absorb the overlapping periods, and any the combined period then reaches
+    absorbed = {}
+    while conflicts:
+        absorbed.update((conflict.id, conflict) for conflict in conflicts)
+        start_date = min(start_date, *(conflict.start_date for conflict in conflicts))
+        end_date = max(end_date, *(conflict.end_date for conflict in conflicts))
+        conflicts = [conflict for conflict in index.conflicts(start_date, end_date, exclude_id=period_id) if conflict.id not in absorbed]
+    return (start_date, end_date), list(absorbed.values())
+
+async def raise_missing_period(period_id: str, action: str):
+    """
+    Raise the error for a period the user cannot change: 403 if it belongs to
+    another user, 404 if it does not exist. Only runs once a change found no
+    period of the user, so successful changes need no extra query.
+    """
+    if await AbsencePeriod.exists(id=period_id):
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action} this period")
+    raise HTTPException(status_code=404, detail="Period not found")
+
+@router.get('/absence-periods/overlapping', response_model=List[Dict])
+async def get_overlapping_periods(start_date: str, end_date: str, current_user: Dict = Depends(get_request_user)):
+    """Get the absence periods whose dates overlap a date range, both dates included"""
+    try:
+        first_day = parse_iso_date(start_date)
+        last_day = parse_iso_date(end_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be in format YYYY-MM-DD")
+    
+    index = await period_indexes.load(current_user["id"], current_user["data_version"])
+    return [period_summary(period) for period in index.overlapping(first_day, last_day)]
+
 @router.post('/absence-periods', response_model=AbsencePeriodResponse)
-async def create_absence_period(period: AbsencePeriodBase, request: Request, current_user: Dict = Depends(get_request_user)):
+async def create_absence_period(period: AbsencePeriodBase, request: Request, overlap: Optional[str] = OVERLAP_QUERY,
+                                current_user: Dict = Depends(get_request_user)):
     """Create a new absence period for the current user"""
     try:
-        # Parse dates
-        start_date = datetime.strptime(period.start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(period.end_date, "%Y-%m-%d").date()
+        start_date = period.start_date
+        end_date = period.end_date
         
-        # Get user
-        user = await User.get(id=current_user["id"])
+        mode = resolve_overlap_mode(overlap)
         
-        # Create period
-        new_period = await AbsencePeriod.create(
-            id=uuid.uuid4(),
-            user=user,
-            start_date=start_date,
-            end_date=end_date
-        )
+        # Create period, replacing the periods it absorbs
+        async with in_transaction() as connection:
+            previous_version = await lock_user(current_user["id"], connection)
+            # Merge with or reject overlapping periods, depending on the overlap mode
+            (start_date, end_date), absorbed = await resolve_overlaps(
+                connection, current_user["id"], previous_version, mode, start_date, end_date
+            )
+            absorbed_ids = [absorbed_period.id for absorbed_period in absorbed]
+            new_period = await AbsencePeriod.create(
+                id=uuid.uuid4(),
+                user_id=current_user["id"],
+                start_date=start_date,
+                end_date=end_date
+            )
+            if absorbed_ids:
+                await AbsencePeriod.filter(id__in=absorbed_ids, user_id=current_user["id"]).delete()
+            data_version = await bump_data_version(current_user["id"], connection)
+        notify_data_change(current_user["id"])
+        
+        def change(index):
+            for absorbed_id in absorbed_ids:
+                index.remove(absorbed_id)
+            index.add(new_period.id, start_date, end_date)
+        period_indexes.apply(current_user["id"], previous_version, data_version, change)
         
         # Return response
         return {
             "id": str(new_period.id),
             "start_date": new_period.start_date.strftime("%Y-%m-%d"),
-            "end_date": new_period.end_date.strftime("%Y-%m-%d")
+            "end_date": new_period.end_date.strftime("%Y-%m-%d"),
+            "merged_ids": absorbed_ids
         }
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put('/absence-periods/{period_id}')
-async def update_absence_period_endpoint(period_id: str, period: AbsencePeriodBase, request: Request, current_user: Dict = Depends(get_request_user)):
+async def update_absence_period_endpoint(period_id: str, period: AbsencePeriodBase, request: Request, overlap: Optional[str] = OVERLAP_QUERY,
+                                         current_user: Dict = Depends(get_request_user)):
     """Update an existing absence period"""
     try:
-        # Parse dates
-        start_date = datetime.strptime(period.start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(period.end_date, "%Y-%m-%d").date()
+        start_date = period.start_date
+        end_date = period.end_date
+        
+        # Check the period against the user's index, which is usually cached;
+        # the update below still only changes a period of this user
+        index = await period_indexes.load(current_user["id"], current_user["data_version"])
+        if period_id not in index:
+            await raise_missing_period(period_id, "update")
         
-        # Get period
-        db_period = await AbsencePeriod.filter(id=period_id).first()
-        if not db_period:
-            raise HTTPException(status_code=404, detail="Period not found")
+        mode = resolve_overlap_mode(overlap)
         
-        # Check if period belongs to user
-        if str(db_period.user_id) != current_user["id"]:
-            raise HTTPException(status_code=403, detail="Not authorized to update this period")
+        # Update period, replacing the periods it absorbs
+        async with in_transaction() as connection:
+            previous_version = await lock_user(current_user["id"], connection)
+            # Merge with or reject overlapping periods, depending on the overlap mode
+            (start_date, end_date), absorbed = await resolve_overlaps(
+                connection, current_user["id"], previous_version, mode, start_date, end_date, period_id
+            )
+            absorbed_ids = [absorbed_period.id for absorbed_period in absorbed]
+            updated = await AbsencePeriod.filter(id=period_id, user_id=current_user["id"]).update(start_date=start_date, end_date=end_date)
+            if not updated:
+                await raise_missing_period(period_id, "update")
+            if absorbed_ids:
+                await AbsencePeriod.filter(id__in=absorbed_ids, user_id=current_user["id"]).delete()
+            data_version = await bump_data_version(current_user["id"], connection)
+        notify_data_change(current_user["id"])
         
-        # Update period
-        db_period.start_date = start_date
-        db_period.end_date = end_date
-        await db_period.save()
+        def change(index):
+            for removed_id in [period_id, *absorbed_ids]:
+                index.remove(removed_id)
+            index.add(period_id, start_date, end_date)
+        period_indexes.apply(current_user["id"], previous_version, data_version, change)
         
-        return {"message": "Period updated successfully"}
+        return {
+            "message": "Period updated successfully",
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "merged_ids": absorbed_ids
+        }
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -75,49 +237,145 @@ async def update_absence_period_endpoint(period_id: str, period: AbsencePeriodBa
 async def delete_absence_period_endpoint(period_id: str, request: Request, current_user: Dict = Depends(get_request_user)):
     """Delete an absence period"""
     try:
-        # Get period
-        period = await AbsencePeriod.filter(id=period_id).first()
-        if not period:
-            raise HTTPException(status_code=404, detail="Period not found")
-        
-        # Check if period belongs to user
-        if str(period.user_id) != current_user["id"]:
-            raise HTTPException(status_code=403, detail="Not authorized to delete this period")
-        
-        # Delete period
-        await period.delete()
+        # Delete period, if it belongs to the user
+        async with in_transaction() as connection:
+            previous_version = await lock_user(current_user["id"], connection)
+            deleted = await AbsencePeriod.filter(id=period_id, user_id=current_user["id"]).delete()
+            if not deleted:
+                await raise_missing_period(period_id, "delete")
+            data_version = await bump_data_version(current_user["id"], connection)
+        notify_data_change(current_user["id"])
+        period_indexes.apply(current_user["id"], previous_version, data_version, lambda index: index.remove(period_id))
         
         return {"message": "Period deleted successfully"}
+    except HTTPException as http_exc:
+        raise http_exc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post('/calculate')
+@router.post('/calculate', response_class=FastJSONResponse)
 async def calculate_rule(calc_request: CalculationRequest, request: Request, current_user: Dict = Depends(get_request_user)):
     """Calculate the 180-day rule based on absence periods"""
     try:
-        # Parse decision date
-        decision_date = datetime.strptime(calc_request.decision_date, "%Y-%m-%d").date()
+        # Answer 304 without loading periods or recalculating if the client's result is current
+        etag = calculation_etag(current_user, calc_request.decision_date, calc_request.absence_periods, calc_request.rule_sets)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers=headers)
         
-        # Get absence periods
-        absence_periods = []
+        # Calculate the rule, and any further rule sets requested in the same pass
+        decision_date, absence_periods, rule_sets = await load_calculation_input(calc_request, current_user)
+        with trace_phase("calc"):
+            result = calculate_180_day_rule(absence_periods, decision_date, rule_sets)
         
-        if calc_request.absence_periods:
-            # Use provided absence periods
-            for period in calc_request.absence_periods:
-                start_date = datetime.strptime(period["start_date"], "%Y-%m-%d").date()
-                end_date = datetime.strptime(period["end_date"], "%Y-%m-%d").date()
-                absence_periods.append((start_date, end_date))
-        else:
-            # Get periods from database
-            user = await User.get(id=current_user["id"])
-            db_periods = await AbsencePeriod.filter(user=user)
-            
-            for period in db_periods:
-                absence_periods.append((period.start_date, period.end_date))
+        # The result only holds strings, numbers and booleans, so it is
+        # serialized directly instead of going through jsonable_encoder
+        return FastJSONResponse(result, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Points of GET /api/calculate/chart when none are asked for, and the most a request may ask for
+CHART_POINTS = 300
+CHART_MAX_POINTS = 2000
+
+@router.get('/calculate/chart', response_class=FastJSONResponse)
+async def calculate_chart(decision_date: str, request: Request,
+                          points: int = Query(CHART_POINTS, ge=4, le=CHART_MAX_POINTS),
+                          rule_set: str = DEFAULT_RULE_SET.name,
+                          current_user: Dict = Depends(get_request_user)):
+    """
+    Get the days absent in every window of a rule set, downsampled for a chart.
+    
+    The series has a window for every day of the qualifying period, about 1,826
+    for the 180-day rule. At most 'points' of them are returned, keeping the
+    lowest and highest window of each stretch of days, so the worst window is
+    always drawn and the response has the same size whatever the horizon.
+    """
+    try:
+        parsed_decision_date = parse_iso_date(decision_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Decision date must be in format YYYY-MM-DD")
+    try:
+        selected = get_rule_sets([rule_set])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        # Answer 304 without loading periods or recalculating if the client's chart is current
+        etag = calculation_etag(current_user, parsed_decision_date, rule_sets=[selected.name], view=f"chart:{points}")
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers=headers)
         
-        # Calculate the rule
-        result = calculate_180_day_rule(absence_periods, decision_date)
+        index = await period_indexes.load(current_user["id"], current_user["data_version"])
+        with trace_phase("calc"):
+            result = evaluate_rule_sets(index.merged(), parsed_decision_date, [selected])[selected.name]
+            chart = chart_series(result, points)
         
-        return result
+        return FastJSONResponse(chart, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post('/trip-plans', response_class=FastJSONResponse)
+async def plan_trip(plan_request: TripPlanRequest, current_user: Dict = Depends(get_request_user)):
+    """
+    Find the longest trip from each departure date that keeps every window of
+    the rule set within its threshold, given the user's periods (or the periods
+    sent with the request).
+    """
+    try:
+        absence_periods = await load_absence_periods(plan_request.absence_periods, current_user)
+        rule_set = RULE_SETS[plan_request.rule_set]
+        with trace_phase("calc"):
+            trips = plan_trips(absence_periods, plan_request.departure_dates, rule_set)
+        
+        return FastJSONResponse({
+            "rule_set": rule_set.name,
+            "window_days": rule_set.window_days,
+            "threshold": rule_set.threshold,
+            "trips": [trip.summary() for trip in trips],
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get('/rule-sets')
+async def list_rule_sets():
+    """List the rule sets that /api/calculate can evaluate besides the 180-day rule"""
+    return [
+        {
+            "name": rule_set.name,
+            "description": rule_set.description,
+            "window_days": rule_set.window_days,
+            "threshold": rule_set.threshold,
+            "horizon_days": rule_set.horizon_days,
+        }
+        for rule_set in RULE_SETS.values()
+    ]
+
+@router.get('/calculate/stream')
+async def calculate_rule_stream(decision_date: str, request: Request, current_user: Dict = Depends(get_request_user)):
+    """
+    Stream 180-day rule results as server-sent events.
+
+    Sends the current result and then a new one whenever the user's absence
+    periods change. Browsers cannot set headers on an EventSource, so it may
+    be opened with a single-use ticket from POST /api/stream-tickets as the
+    'ticket' query parameter, and may pass the last event ID it received as
+    'last_event_id' when it opens a new stream to resume one.
+    """
+    try:
+        parsed_decision_date = parse_iso_date(decision_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Decision date must be in format YYYY-MM-DD")
+    
+    # A reconnecting browser sends the data version of the last result it received
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    send_current = last_event_id != str(current_user["data_version"])
+    
+    subscription = live_hub.subscribe(current_user["id"], parsed_decision_date)
+    return StreamingResponse(
+        result_stream(subscription, live_hub, request.is_disconnected, send_current),
+        media_type="text/event-stream",
+        # Tell proxies such as nginx not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
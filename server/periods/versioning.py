@@ -0,0 +1,135 @@
+import hashlib
+
+from database import is_postgres
+from utils.compression import decoded_etag
+from .live import live_hub
+
+# Part of every calculation ETag. Increase it when the calculation results
+# change, so clients do not keep results computed by an older version.
+# 2: overlapping periods are merged before calculating
+# 3: results without absences have the same keys as any other result
+CALCULATION_VERSION = 3
+
+# Sent with every response that carries an ETag: clients may store it, but
+# must revalidate it with If-None-Match before using it again
+CACHE_CONTROL = "private, no-cache"
+
+async def lock_user(user_id, connection) -> int:
+    """
+    Lock the row of a user until the transaction of connection ends.
+
+    Changes to a user's periods take this lock first, so they run one at a
+    time and each sees the periods the last one saved. SQLite has no row
+    locks; there transactions are already serialised by the connection, and
+    writes across processes by the database lock.
+
+    Returns:
+        The user's data version, that of the last change saved
+    """
+    placeholder = "$1" if is_postgres() else "?"
+    lock = " FOR UPDATE" if is_postgres() else ""
+    rows = await connection.execute_query_dict(
+        f"SELECT data_version FROM users WHERE id = {placeholder}{lock}", [str(user_id)]
+    )
+    return rows[0]["data_version"]
+
+async def bump_data_version(user_id, connection) -> int:
+    """
+    Increment the data version of a user in the transaction that changes their absence periods.
+
+    The new version becomes visible with the change, when the transaction
+    commits, so a response carrying it never holds the old data and a change
+    is never saved without a new version. Call notify_data_change once the
+    transaction has committed.
+
+    Args:
+        user_id: ID of the user whose periods changed
+        connection: The transaction that changes the periods
+    
+    Returns:
+        The data version after the increment
+    """
+    # Increment in the database so concurrent changes each get their own version,
+    # reading it back in the same statement (RETURNING needs SQLite 3.35 or later)
+    placeholder = "$1" if is_postgres() else "?"
+    rows = await connection.execute_query_dict(
+        f"UPDATE users SET data_version = data_version + 1 WHERE id = {placeholder} RETURNING data_version", [str(user_id)]
+    )
+    return rows[0]["data_version"]
+
+def notify_data_change(user_id):
+    """Push new results to the user's open result streams, once a change has committed"""
+    # With a listener the notification of the trigger does this, for the streams of every process
+    if not live_hub.listening:
+        live_hub.notify(user_id)
+
+def periods_etag(current_user, query=""):
+    """
+    Strong ETag of the absence periods of a user.
+
+    Args:
+        current_user: The user from the request state, including data_version
+        query: Query string selecting a page or date range of the periods, if any
+
+    Returns:
+        The quoted ETag value
+    """
+    if not query:
+        return f'"periods-{current_user["id"]}-{current_user["data_version"]}"'
+    # Every page and filter of the list has its own ETag
+    digest = hashlib.sha256(query.encode()).hexdigest()
+    return f'"periods-{current_user["id"]}-{current_user["data_version"]}-{digest[:16]}"'
+
+def calculation_etag(current_user, decision_date, absence_periods=None, rule_sets=None, view=""):
+    """
+    Strong ETag of a calculation result.
+
+    Results of stored periods depend on the user's data version and the decision
+    date. Results of periods sent with the request depend on those periods only.
+
+    Args:
+        current_user: The user from the request state, including data_version
+        decision_date: The decision date
+        absence_periods: Absence periods (DateRange) sent with the request, if any
+        rule_sets: Names of the further rule sets requested, if any
+        view: Form of the result other than the full one, e.g. a chart of it
+
+    Returns:
+        The quoted ETag value
+    """
+    if absence_periods:
+        source = ",".join(f"{period.start_date}/{period.end_date}" for period in absence_periods)
+    else:
+        source = f'{current_user["id"]}:{current_user["data_version"]}'
+
+    # The requested rule sets are part of the result, in the order they were given
+    rules = ",".join(rule_sets or [])
+    
+    digest = hashlib.sha256(f"{CALCULATION_VERSION}:{decision_date}:{rules}:{view}:{source}".encode()).hexdigest()
+    return f'"calc-{digest[:32]}"'
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against the current ETag.
+
+    Args:
+        if_none_match: Value of the If-None-Match header, or None
+        etag: The current quoted ETag
+
+    Returns:
+        True if the client's copy is current and a 304 can be sent
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored, and so is
+    # the encoding suffix CompressionMiddleware adds for compressed bodies
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if decoded_etag(candidate) == etag:
+            return True
+    return False
@@ -0,0 +1,278 @@
+"""
+Pre-fork multi-worker server.
+
+Imports the application and warms up the calculation once, then forks the
+workers, which share the listening socket and the preloaded code. The total
+database connection budget is split between the workers, so adding workers
+never opens more PostgreSQL connections than DB_MAX_CONNECTIONS. The
+admission budgets are split between them the same way.
+
+Signals:
+    SIGTERM, SIGINT  Stop: workers finish their requests, then exit
+    SIGHUP           Restart the workers one at a time without dropping connections
+
+Workers that exit, or reach --max-requests, are replaced. Restarts reuse the
+preloaded code; restart the whole process to deploy new code.
+
+Usage:
+    python serve.py --workers 4 --port 5001
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from datetime import date
+
+from logs import get_logger, configure_logging, flush_logs
+
+# Number of workers when --workers is not given (defaults to the number of CPUs)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+
+# Database connections all workers of this server may open together
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+
+# Seconds a worker gets to finish its requests when stopping or restarting
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# A worker that exits sooner than this after starting is restarted with a delay
+MIN_WORKER_LIFETIME = 5.0
+
+logger = get_logger("serve")
+
+
+def pool_size_per_worker(total_connections, workers):
+    """Database connections each worker may open, at least one"""
+    return max(1, total_connections // workers)
+
+
+def prepare_environment(workers):
+    """
+    Set the variables the workers read when the application is imported.
+
+    Returns:
+        The directory the workers write their metrics and calculation jobs to
+    """
+    # An explicit DB_POOL_MAXSIZE wins over the share of the budget
+    os.environ.setdefault("DB_POOL_MAXSIZE", str(pool_size_per_worker(DB_MAX_CONNECTIONS, workers)))
+    # Each worker enforces its share of the admission budgets
+    os.environ["ADMISSION_WORKERS"] = str(workers)
+    metrics_dir = tempfile.mkdtemp(prefix="absence-workers-")
+    os.environ["WORKER_METRICS_DIR"] = metrics_dir
+    # Any worker can then answer a poll for a job another worker accepted
+    os.environ.setdefault("JOBS_DIR", os.path.join(metrics_dir, "jobs"))
+    return metrics_dir
+
+
+def migrate_before_fork():
+    """
+    Apply pending migrations once in the supervisor, if the workers would do it.
+
+    Workers starting at the same time would otherwise all try to migrate, which
+    SQLite cannot serialise like the PostgreSQL advisory lock does.
+    """
+    import migrations
+    if migrations.DB_AUTO_MIGRATE:
+        asyncio.run(migrations.initialize_database())
+    # The workers inherit the imported module, so the setting is changed there
+    migrations.DB_AUTO_MIGRATE = False
+
+
+def preload():
+    """Import the application and warm up the calculation before forking"""
+    from app import app
+    from absence_engine import calculate_180_day_rule
+
+    # Builds the window keys of today's decision date, shared by every worker
+    today = date.today()
+    calculate_180_day_rule([(date(today.year - 1, 1, 1), date(today.year - 1, 1, 10))], today)
+    return app
+
+
+def bind_socket(host, port):
+    """Open the listening socket shared by all workers"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and handles signals"""
+
+    def __init__(self, app, sock, workers, metrics_dir, max_requests=None):
+        """
+        Args:
+            app: The preloaded ASGI application
+            sock: The listening socket
+            workers: Number of workers to keep running
+            metrics_dir: Directory of the workers' metrics snapshots
+            max_requests: Requests after which a worker is replaced, if any
+        """
+        self.app = app
+        self.sock = sock
+        self.num_workers = workers
+        self.metrics_dir = metrics_dir
+        self.max_requests = max_requests
+        self.workers = {}
+        self.retiring = set()
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self):
+        """Fork a worker serving the shared socket"""
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+
+        # In the worker: uvicorn installs its own SIGTERM and SIGINT handlers
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        status = 0
+        try:
+            import uvicorn
+            from logs import LOG_REQUESTS
+            config = uvicorn.Config(
+                self.app,
+                lifespan="on",
+                limit_max_requests=self.max_requests,
+                timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+                # The request log replaces uvicorn's access log, which writes on the event loop
+                access_log=not LOG_REQUESTS,
+            )
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException:
+            logger.exception("worker_failed", pid=os.getpid())
+            status = 1
+        finally:
+            # os._exit skips atexit, so write the queued records first
+            flush_logs()
+            os._exit(status)
+
+    def reap(self):
+        """Collect exited workers and replace them unless stopping"""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            try:
+                os.remove(os.path.join(self.metrics_dir, f"worker-{pid}.json"))
+            except OSError:
+                pass
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if self.stopping or started is None:
+                continue
+            logger.warning("worker_exited", pid=pid, status=os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                # Do not fork in a tight loop when workers fail on startup
+                time.sleep(1)
+            self.spawn()
+
+    def restart_workers(self):
+        """Replace the workers one at a time, starting each new one before stopping an old one"""
+        logger.info("restarting_workers", workers=len(self.workers))
+        for pid in list(self.workers):
+            self.spawn()
+            # Give the new worker time to start accepting connections
+            time.sleep(1)
+            self.stop_worker(pid)
+
+    def stop_worker(self, pid):
+        """Ask a worker to finish its requests and exit"""
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        """Stop all workers, killing those that do not exit within GRACEFUL_TIMEOUT"""
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning("worker_killed", pid=pid, reason="did not stop in time")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+    def run(self):
+        """Start the workers and supervise them until stopped"""
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_restart(signum, frame):
+            self.restart_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_restart)
+
+        for _ in range(self.num_workers):
+            self.spawn()
+        logger.info("supervisor_started", pid=os.getpid(), workers=self.num_workers,
+                    db_connections_per_worker=int(os.environ["DB_POOL_MAXSIZE"]))
+
+        try:
+            while not self.stopping:
+                self.reap()
+                if self.restart_requested:
+                    self.restart_requested = False
+                    self.restart_workers()
+                time.sleep(0.2)
+        finally:
+            self.stop()
+            self.sock.close()
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with several pre-forked worker processes")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=5001, help="Port to listen on (default: 5001)")
+    parser.add_argument("--workers", "-w", type=int, default=WEB_CONCURRENCY,
+                        help="Number of worker processes (default: WEB_CONCURRENCY or the number of CPUs)")
+    parser.add_argument("--max-requests", type=int, default=None,
+                        help="Replace a worker after it has served this many requests")
+    args = parser.parse_args(argv)
+
+    metrics_dir = prepare_environment(args.workers)
+
+    # Imported after prepare_environment, which sets the pool size it reads
+    from database import DB_BACKEND, DB_SQLITE_PATH, DATABASE_URL
+    if DB_BACKEND == "sqlite" and not DATABASE_URL and DB_SQLITE_PATH == ":memory:" and args.workers > 1:
+        print("An in-memory SQLite database cannot be shared between workers; set DB_SQLITE_PATH or use --workers 1",
+              file=sys.stderr)
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        return 2
+    if DB_BACKEND == "sqlite" and args.workers > 1:
+        print("Warning: with SQLite, live result streams only receive the changes made by their own worker",
+              file=sys.stderr)
+
+    # Before migrating, so the migrations' records are written too
+    configure_logging()
+    migrate_before_fork()
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    Supervisor(app, sock, args.workers, metrics_dir, args.max_requests).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# Tests import the server modules the way the server does, from the server directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path, monkeypatch):
+    """
+    Point the database settings at a test database of each backend: a new
+    SQLite file, and the database of TEST_POSTGRES_URL if it is set
+    """
+    from tortoise.backends.base.executor import EXECUTOR_CACHE
+    import database
+
+    if request.param == "sqlite":
+        url = f"sqlite://{tmp_path}/test.db"
+    else:
+        url = os.getenv("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL is not set")
+        pytest.importorskip("asyncpg")
+    monkeypatch.setattr(database, "DB_BACKEND", request.param)
+    monkeypatch.setitem(database.TORTOISE_ORM["connections"], "default", url)
+    # Tortoise keeps the insert statements of each connection name, in the SQL
+    # dialect of the backend that first used it
+    EXECUTOR_CACHE.clear()
+    return request.param
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    """A TestClient of the application on the test database of each backend"""
+    from fastapi.testclient import TestClient
+    import migrations
+    from app import app
+
+    # The test databases start empty, or at an older schema version
+    monkeypatch.setattr(migrations, "DB_AUTO_MIGRATE", True)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Headers of a new user who is logged in; the user is deleted after the test"""
+    name = f"user{uuid.uuid4().hex[:12]}"
+    response = client.post("/api/signup", json={"username": name, "email": f"{name}@example.com", "password": "password123"})
+    assert response.status_code == 200, response.text
+    token = client.post("/api/login", json={"username": name, "password": "password123"}).json()["access_token"]
+    yield {"Authorization": f"Bearer {token}"}
+
+    from models import User
+    client.portal.call(User.filter(username=name).delete)
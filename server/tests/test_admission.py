@@ -0,0 +1,139 @@
+"""
+Tests of the admission limits of routes without a logged-in user, such as
+login, which are keyed by the username in the body and by the address behind
+trusted proxies, on the middleware alone and in the app.
+
+Usage (from the server directory):
+    python -m pytest tests/test_admission.py
+"""
+import asyncio
+import json
+import uuid
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from utils.admission import AdmissionMiddleware, RoutePolicy, forwarded_client, parse_networks
+
+LOGIN = "POST /api/login"
+
+
+class EchoApp:
+    """Answers with the body it received; holds requests while gate is closed"""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self, scope, receive, send):
+        body = await Request(scope, receive).body()
+        await self.gate.wait()
+        await JSONResponse({"body": body.decode()})(scope, receive, send)
+
+
+def login_request(middleware, username, peer="10.0.0.5", forwarded_for=None):
+    """Send a login request through middleware and return its status, headers and body"""
+    body = json.dumps({"username": username, "password": "secret"}).encode()
+    headers = [(b"content-type", b"application/json")]
+    if forwarded_for:
+        headers.append((b"x-forwarded-for", forwarded_for.encode()))
+    scope = {"type": "http", "method": "POST", "path": "/api/login", "headers": headers,
+             "client": (peer, 40000), "query_string": b"", "state": {}}
+    # The body arrives in two messages, as large bodies do
+    messages = [{"type": "http.request", "body": body[:10], "more_body": True},
+                {"type": "http.request", "body": body[10:], "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    async def call():
+        await middleware(scope, receive, send)
+        start = next(message for message in sent if message["type"] == "http.response.start")
+        body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+        return start["status"], dict(start["headers"]), json.loads(body)
+
+    return call()
+
+
+def make_middleware(policy, trusted_proxies=""):
+    app = EchoApp()
+    return app, AdmissionMiddleware(app, policies={LOGIN: policy}, trusted_proxies=trusted_proxies)
+
+
+def test_login_is_rate_limited_per_username():
+    _, middleware = make_middleware(RoutePolicy(rate=0.01, burst=2, key_field="username"))
+
+    async def scenario():
+        alice = [await login_request(middleware, "alice") for _ in range(3)]
+        bob = await login_request(middleware, "bob")
+        return alice, bob
+
+    alice, bob = asyncio.run(scenario())
+
+    assert [status for status, _, _ in alice] == [200, 200, 429]
+    assert int(alice[2][1][b"retry-after"]) >= 1
+    assert bob[0] == 200
+    # The body read to find the username still reaches the handler
+    assert json.loads(alice[0][2]["body"])["username"] == "alice"
+
+
+def test_one_username_cannot_take_every_login_slot():
+    app, middleware = make_middleware(RoutePolicy(global_concurrency=4, client_concurrency=1, key_field="username"))
+
+    async def scenario():
+        app.gate.clear()
+        held = asyncio.ensure_future(login_request(middleware, "alice"))
+        await asyncio.sleep(0.01)
+        second = await login_request(middleware, "alice")
+        other = asyncio.ensure_future(login_request(middleware, "bob"))
+        await asyncio.sleep(0.01)
+        app.gate.set()
+        return second, await held, await other
+
+    second, held, other = asyncio.run(scenario())
+
+    assert (second[0], held[0], other[0]) == (429, 200, 200)
+
+
+def test_addresses_are_limited_only_behind_trusted_proxies():
+    policy = RoutePolicy(rate=0.01, burst=1, key_field="username")
+    _, trusting = make_middleware(policy, trusted_proxies="10.0.0.0/8")
+    _, untrusting = make_middleware(policy)
+
+    async def scenario(middleware):
+        first = await login_request(middleware, "alice", forwarded_for="203.0.113.7")
+        # Another username from the same client address, with a forged first entry
+        second = await login_request(middleware, "bob", forwarded_for="198.51.100.1, 203.0.113.7")
+        return first[0], second[0]
+
+    assert asyncio.run(scenario(trusting)) == (200, 429)
+    assert asyncio.run(scenario(untrusting)) == (200, 200)
+
+
+def test_forwarded_client_skips_trusted_proxies_from_the_right():
+    trusted = parse_networks("10.0.0.0/8, 192.168.1.1")
+
+    assert forwarded_client("10.1.2.3", "203.0.113.7, 192.168.1.1", trusted) == "203.0.113.7"
+    assert forwarded_client("10.1.2.3", "1.1.1.1, 203.0.113.7", trusted) == "203.0.113.7"
+    assert forwarded_client("10.1.2.3", None, trusted) is None
+    assert forwarded_client("203.0.113.9", "1.1.1.1", trusted) is None
+
+
+def test_the_app_answers_429_with_retry_after_to_repeated_logins(client):
+    username = f"nobody-{uuid.uuid4().hex[:12]}"
+
+    statuses = []
+    for _ in range(8):
+        response = client.post("/api/login", json={"username": username, "password": "wrong"})
+        statuses.append(response.status_code)
+
+    # The burst of the login policy is answered, then the rate applies
+    refused = statuses.index(429)
+    assert set(statuses[:refused]) == {401} and set(statuses[refused:]) == {429}
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other usernames are not refused
+    assert client.post("/api/login", json={"username": f"{username}-2", "password": "wrong"}).status_code == 401
@@ -0,0 +1,97 @@
+"""
+Differential tests of the calculation backends.
+
+Evaluates every rule set with every available backend on randomized
+histories and compares each RuleResult, including the days absent in every
+window, with the reference backend. Histories include the cases where
+backends tend to drift: periods crossing the start of the qualifying period
+or the decision date, periods of zero or one day, overlapping periods and
+datetime inputs.
+
+Usage (from the server directory):
+    python -m pytest tests/test_differential.py
+    DIFFERENTIAL_HISTORIES=2000 python -m pytest tests/test_differential.py
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Tuple
+import os
+import random
+
+import pytest
+
+from absence_engine import evaluate_rule_sets, calculate_180_day_rule, available_backends, RULE_SETS
+
+REFERENCE = "reference"
+
+# Random histories per seed; raise it for a longer run before changing a backend
+HISTORIES = int(os.getenv("DIFFERENTIAL_HISTORIES", "150"))
+
+
+def random_history(rng: random.Random, decision_date: date) -> List[Tuple[date, date]]:
+    """
+    A random list of absence periods around the qualifying periods of the rule sets.
+
+    Returns:
+        List of (start_date, end_date) tuples, sometimes as datetimes
+    """
+    longest_horizon = max(rule_set.horizon_days for rule_set in RULE_SETS.values())
+    history = []
+    for _ in range(rng.choice([0, 1, 2, 5, 20, 80])):
+        kind = rng.random()
+        if kind < 0.15:
+            # Around the start of a qualifying period
+            horizon = rng.choice([rule_set.horizon_days for rule_set in RULE_SETS.values()])
+            start_date = decision_date - timedelta(days=horizon + rng.randint(-3, 3))
+        elif kind < 0.25:
+            # Around the decision date, sometimes entirely after it
+            start_date = decision_date + timedelta(days=rng.randint(-20, 20))
+        else:
+            start_date = decision_date - timedelta(days=rng.randint(0, longest_horizon + 400))
+        # Zero, one or more days between the start and end date
+        length = rng.choice([0, 1, 2, rng.randint(3, 30), rng.randint(30, 400)])
+        history.append((start_date, start_date + timedelta(days=length)))
+
+    if rng.random() < 0.2:
+        history = [(datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()))
+                   for start, end in history]
+    return history
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_backends_agree_with_reference(seed):
+    rng = random.Random(seed)
+    rule_sets = list(RULE_SETS.values())
+    backends = [name for name in available_backends() if name != REFERENCE]
+    mismatches = []
+    for case in range(HISTORIES):
+        decision_date = date(2025, 10, 15) + timedelta(days=rng.randint(-2000, 2000))
+        history = random_history(rng, decision_date)
+        expected = evaluate_rule_sets(history, decision_date, rule_sets, REFERENCE)
+        for backend in backends:
+            actual = evaluate_rule_sets(history, decision_date, rule_sets, backend)
+            mismatches.extend(
+                f"case {case}: {backend} on {rule_set.name}, decision date {decision_date}, {len(history)} periods"
+                for rule_set in rule_sets if actual[rule_set.name] != expected[rule_set.name]
+            )
+    assert not mismatches, f"backends disagree with {REFERENCE} (seed {seed}): {mismatches[:5]}"
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_overlapping_periods_count_each_day_once(backend):
+    decision_date = date(2023, 12, 31)
+    overlapping = [(date(2023, 1, 1), date(2023, 3, 1)), (date(2023, 2, 1), date(2023, 4, 1))]
+    merged = [(date(2023, 1, 1), date(2023, 4, 1))]
+
+    result = calculate_180_day_rule(overlapping, decision_date, backend=backend)
+    assert result == calculate_180_day_rule(merged, decision_date, backend=backend)
+    # The days from 2 January to 31 March
+    assert result["worst_period_days"] == 89
+
+
+def test_datetime_periods_match_dates():
+    decision_date = date(2024, 6, 1)
+    periods = [(date(2023, 5, 1), date(2023, 7, 20)), (date(2024, 1, 3), date(2024, 2, 1))]
+    as_datetimes = [(datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()))
+                    for start, end in periods]
+    assert calculate_180_day_rule(as_datetimes, datetime.combine(decision_date, datetime.min.time())) == \
+        calculate_180_day_rule(periods, decision_date)
@@ -0,0 +1,122 @@
+"""
+Tests of the calculation job queue: jobs interrupted by a worker that stops
+or dies must not be handed out again to later submissions of their input.
+Through the app: deduplication, the result TTL and the callback allow-list.
+
+Usage (from the server directory):
+    python -m pytest tests/test_jobs.py
+"""
+import asyncio
+import threading
+import time
+
+from jobs.queue import JobQueue, JobStore
+
+
+def blocking_calculation(release: threading.Event, started: threading.Event):
+    """A calculation that runs until release is set"""
+    def calculate():
+        started.set()
+        release.wait(5)
+        return {"done": True}
+    return calculate
+
+
+def test_stopping_a_worker_fails_its_running_and_queued_jobs(tmp_path):
+    release, started = threading.Event(), threading.Event()
+
+    async def scenario():
+        queue = JobQueue(JobStore(str(tmp_path)), workers=1)
+        await queue.start()
+        running, _ = queue.submit("user", "hash-a", blocking_calculation(release, started))
+        queued, _ = queue.submit("user", "hash-b", lambda: {"done": True})
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        release.set()
+
+        # A restarted worker sharing the directory runs both inputs again
+        restarted = JobQueue(JobStore(str(tmp_path)), workers=1)
+        await restarted.start()
+        again = [restarted.submit("user", input_hash, lambda: {"done": True}) for input_hash in ("hash-a", "hash-b")]
+        await restarted.queue.join()
+        await restarted.stop()
+        stored = [restarted.store.get(job["id"]) for job in (running, queued)]
+        return stored, again, [restarted.store.get(job["id"]) for job, _ in again]
+
+    stored, again, rerun = asyncio.run(scenario())
+
+    assert [job["status"] for job in stored] == ["failed", "failed"]
+    assert [deduplicated for _, deduplicated in again] == [False, False]
+    assert [job["status"] for job in rerun] == ["succeeded", "succeeded"]
+
+
+def test_jobs_of_a_dead_worker_are_replaced_after_the_stale_timeout(tmp_path):
+    store = JobStore(str(tmp_path), stale_seconds=60)
+    queue = JobQueue(store)
+    # The worker that accepted the job died without updating its record
+    dead, _ = queue.submit("user", "hash-a", lambda: {"done": True})
+    dead["status"] = "running"
+    dead["started_at"] = time.time() - 30
+    store.save(dead)
+
+    job, deduplicated = queue.submit("user", "hash-a", lambda: {"done": True})
+    assert deduplicated and job["id"] == dead["id"]
+
+    dead["started_at"] = time.time() - 120
+    store.save(dead)
+    job, deduplicated = queue.submit("user", "hash-a", lambda: {"done": True})
+    assert not deduplicated and job["id"] != dead["id"]
+
+    # Sweeping fails the abandoned job and keeps the claim of its replacement
+    store.sweep()
+    assert store.get(dead["id"])["status"] == "failed"
+    assert queue.submit("user", "hash-a", lambda: {"done": True}) == (store.get(job["id"]), True)
+
+
+def wait_for_job(client, auth_headers, location):
+    """Poll a job until it has finished"""
+    for _ in range(200):
+        job = client.get(location, headers=auth_headers).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job did not finish: {job}")
+
+
+def test_jobs_of_the_same_input_are_deduplicated_until_they_expire(client, auth_headers, monkeypatch):
+    from jobs.queue import get_job_queue
+
+    monkeypatch.setattr(get_job_queue(), "ttl_seconds", 0.5)
+    body = {"decision_date": "2024-01-01", "absence_periods": [{"start_date": "2023-01-01", "end_date": "2023-01-10"}]}
+
+    first = client.post("/api/calculate/jobs", json=body, headers=auth_headers)
+    again = client.post("/api/calculate/jobs", json=body, headers=auth_headers)
+    other = client.post("/api/calculate/jobs", json={**body, "decision_date": "2024-01-02"}, headers=auth_headers)
+
+    assert first.status_code == 202 and not first.json()["deduplicated"]
+    assert (again.json()["job_id"], again.json()["deduplicated"]) == (first.json()["job_id"], True)
+    assert other.json()["job_id"] != first.json()["job_id"]
+    job = wait_for_job(client, auth_headers, first.headers["Location"])
+    assert job["status"] == "succeeded"
+
+    # Finished jobs are kept for the TTL; then they are gone and the input runs again
+    time.sleep(0.6)
+    assert client.get(first.headers["Location"], headers=auth_headers).status_code == 404
+    rerun = client.post("/api/calculate/jobs", json=body, headers=auth_headers)
+    assert rerun.json()["job_id"] != first.json()["job_id"] and not rerun.json()["deduplicated"]
+
+
+def test_job_callbacks_only_go_to_allowed_hosts(client, auth_headers):
+    body = {"decision_date": "2024-01-01"}
+
+    refused = client.post("/api/calculate/jobs", json={**body, "callback_url": "http://203.0.113.7/hook"}, headers=auth_headers)
+    local = client.post("/api/calculate/jobs", json={**body, "callback_url": "http://127.0.0.1:9/hook"}, headers=auth_headers)
+    plain = client.post("/api/calculate/jobs", json=body, headers=auth_headers)
+
+    assert refused.status_code == 422
+    assert local.status_code == 202
+    # A job posts to one URL, so the callback is part of what is deduplicated
+    assert plain.json()["job_id"] != local.json()["job_id"]
+    # A callback that cannot be delivered does not fail the job
+    assert wait_for_job(client, auth_headers, local.headers["Location"])["status"] == "succeeded"
@@ -0,0 +1,74 @@
+"""
+Tests of the overlap modes of the period routes under concurrent requests, on
+SQLite and, when TEST_POSTGRES_URL is set, on PostgreSQL.
+
+Usage (from the server directory):
+    python -m pytest tests/test_overlaps.py
+"""
+from datetime import date
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import database
+from migrations import run_migrations
+from models import User, AbsencePeriod
+from periods.models import AbsencePeriodBase
+from periods.routes import create_absence_period
+
+
+def create_concurrently(mode, periods):
+    """
+    Create periods of a new user in concurrent requests with an overlap mode.
+
+    Returns:
+        The status code of each request and the (start_date, end_date) of the
+        periods stored afterwards
+    """
+    async def scenario():
+        await database.init_db()
+        try:
+            await run_migrations()
+            name = f"overlap-{uuid.uuid4().hex[:12]}"
+            user = await User.create(id=uuid.uuid4(), username=name, email=f"{name}@example.com", password_hash="x")
+            try:
+                # Every request saw the user before any of the periods was saved
+                current_user = {"id": str(user.id), "data_version": 0}
+
+                async def create(start_date, end_date):
+                    try:
+                        await create_absence_period(AbsencePeriodBase(start_date=start_date, end_date=end_date),
+                                                    None, mode, current_user)
+                    except HTTPException as e:
+                        return e.status_code
+                    return 200
+
+                statuses = await asyncio.gather(*(create(start_date, end_date) for start_date, end_date in periods))
+                stored = await AbsencePeriod.filter(user_id=user.id).order_by("start_date").values_list("start_date", "end_date")
+                return list(statuses), [tuple(period) for period in stored]
+            finally:
+                await User.filter(id=user.id).delete()
+        finally:
+            await database.close_db()
+    return asyncio.run(scenario())
+
+
+PERIODS = [(date(2023, 1, 1), date(2023, 1, 10)), (date(2023, 1, 5), date(2023, 1, 20)), (date(2023, 1, 15), date(2023, 1, 25))]
+
+
+def test_concurrent_rejected_periods_do_not_overlap(backend):
+    statuses, stored = create_concurrently("reject", PERIODS)
+
+    assert sorted(statuses) == [200, 200, 409] or sorted(statuses) == [200, 409, 409]
+    assert len(stored) == statuses.count(200)
+    for (_, end_date), (next_start, _) in zip(stored, stored[1:]):
+        assert end_date <= next_start
+
+
+def test_concurrent_merged_periods_become_one(backend):
+    statuses, stored = create_concurrently("merge", PERIODS)
+
+    assert statuses == [200, 200, 200]
+    assert stored == [(date(2023, 1, 1), date(2023, 1, 25))]
@@ -0,0 +1,128 @@
+"""
+Tests of the HTTP behaviour of the period and calculation routes: ETags and
+304 answers, including the tag of each compressed encoding, the data version
+changed by every edit, and cursor pagination.
+
+Usage (from the server directory):
+    python -m pytest tests/test_periods_api.py
+"""
+import pytest
+
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+def data_version(client, auth_headers):
+    """The user's data version, read from the ETag of the whole period list"""
+    etag = client.get("/api/absence-periods", headers={**auth_headers, **IDENTITY}).headers["ETag"]
+    return int(etag.strip('"').rsplit("-", 1)[1])
+
+
+def create_period(client, auth_headers, start_date, end_date):
+    response = client.post("/api/absence-periods", json={"start_date": start_date, "end_date": end_date}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def revalidate(client, method, url, auth_headers, encoding, **kwargs):
+    """Request a URL, then again with its ETag; returns both responses"""
+    headers = {**auth_headers, "Accept-Encoding": encoding}
+    first = client.request(method, url, headers=headers, **kwargs)
+    assert first.status_code == 200, first.text
+    second = client.request(method, url, headers={**headers, "If-None-Match": first.headers["ETag"]}, **kwargs)
+    return first, second
+
+
+def test_every_change_of_the_periods_bumps_the_data_version(client, auth_headers):
+    versions = [data_version(client, auth_headers)]
+
+    period_id = create_period(client, auth_headers, "2023-01-01", "2023-01-10")
+    versions.append(data_version(client, auth_headers))
+    response = client.put(f"/api/absence-periods/{period_id}", json={"start_date": "2023-01-02", "end_date": "2023-01-10"},
+                          headers=auth_headers)
+    assert response.status_code == 200, response.text
+    versions.append(data_version(client, auth_headers))
+    assert client.delete(f"/api/absence-periods/{period_id}", headers=auth_headers).status_code == 200
+    versions.append(data_version(client, auth_headers))
+
+    assert versions == [0, 1, 2, 3]
+
+
+def test_a_rejected_change_keeps_the_data_version(client, auth_headers):
+    create_period(client, auth_headers, "2023-01-01", "2023-01-10")
+    before = data_version(client, auth_headers)
+
+    response = client.post("/api/absence-periods?overlap=reject", json={"start_date": "2023-01-05", "end_date": "2023-01-12"},
+                           headers=auth_headers)
+
+    assert response.status_code == 409
+    assert data_version(client, auth_headers) == before
+
+
+def test_periods_answer_304_until_they_change(client, auth_headers):
+    create_period(client, auth_headers, "2023-01-01", "2023-01-10")
+    first, second = revalidate(client, "GET", "/api/absence-periods", auth_headers, "identity")
+
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert "no-cache" in second.headers["Cache-Control"]
+
+    create_period(client, auth_headers, "2023-02-01", "2023-02-10")
+    third = client.get("/api/absence-periods", headers={**auth_headers, **IDENTITY, "If-None-Match": first.headers["ETag"]})
+    assert third.status_code == 200
+    assert len(third.json()) == 2
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip", "br"])
+def test_calculations_and_charts_answer_304_per_encoding(client, auth_headers, encoding):
+    for month in range(1, 13):
+        create_period(client, auth_headers, f"2023-{month:02d}-01", f"2023-{month:02d}-05")
+
+    calculation = revalidate(client, "POST", "/api/calculate", auth_headers, encoding,
+                             json={"decision_date": "2024-01-01", "rule_sets": ["uk_long_residence_10y"]})
+    chart = revalidate(client, "GET", "/api/calculate/chart?decision_date=2024-01-01", auth_headers, encoding)
+
+    for first, second in (calculation, chart):
+        etag = first.headers["ETag"]
+        assert first.headers.get("Content-Encoding", "identity") == encoding
+        # A strong tag promises identical bytes, so each encoding has its own
+        assert etag.endswith(f'-{encoding}"') == (encoding != "identity")
+        assert second.status_code == 304
+
+    # A tag of one encoding still matches when the client asks for another one
+    plain = client.post("/api/calculate", json={"decision_date": "2024-01-01", "rule_sets": ["uk_long_residence_10y"]},
+                        headers={**auth_headers, **IDENTITY, "If-None-Match": calculation[0].headers["ETag"]})
+    assert plain.status_code == 304
+
+
+def test_calculations_change_with_the_periods(client, auth_headers):
+    create_period(client, auth_headers, "2023-01-01", "2023-01-10")
+    first, _ = revalidate(client, "POST", "/api/calculate", auth_headers, "identity", json={"decision_date": "2024-01-01"})
+
+    create_period(client, auth_headers, "2023-02-01", "2023-02-10")
+    response = client.post("/api/calculate", json={"decision_date": "2024-01-01"},
+                           headers={**auth_headers, **IDENTITY, "If-None-Match": first.headers["ETag"]})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first.headers["ETag"]
+
+
+def test_cursor_pages_hold_every_period_once_in_order(client, auth_headers):
+    starts = [f"2023-{month:02d}-01" for month in (5, 1, 3, 2, 4)]
+    for start_date in starts:
+        create_period(client, auth_headers, start_date, start_date[:8] + "05")
+
+    pages, url = [], "/api/absence-periods?limit=2"
+    while url:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200, response.text
+        pages.append([period["start_date"] for period in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"/api/absence-periods?limit=2&cursor={cursor}" if cursor else None
+        if cursor:
+            assert 'rel="next"' in response.headers["Link"]
+
+    assert pages == [sorted(starts)[:2], sorted(starts)[2:4], sorted(starts)[4:]]
+
+    filtered = client.get("/api/absence-periods?from=2023-02-03&to=2023-03-01", headers=auth_headers).json()
+    assert [period["start_date"] for period in filtered] == ["2023-02-01", "2023-03-01"]
+    assert client.get("/api/absence-periods?cursor=not-a-cursor", headers=auth_headers).status_code == 422
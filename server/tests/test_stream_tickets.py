@@ -0,0 +1,54 @@
+"""
+Tests of the single-use tickets that open the result stream in place of the
+session token.
+
+Usage (from the server directory):
+    python -m pytest tests/test_stream_tickets.py
+"""
+from datetime import datetime, timedelta, timezone
+
+from auth.tickets import redeem_stream_ticket
+from models import StreamTicket
+
+STREAM = "/api/calculate/stream?decision_date=2024-01-01"
+
+
+def test_the_stream_does_not_accept_the_session_token(client, auth_headers):
+    token = auth_headers["Authorization"].split(" ", 1)[1]
+
+    response = client.get(f"{STREAM}&token={token}")
+
+    assert response.status_code == 401
+
+
+def test_tickets_are_issued_only_to_logged_in_users(client, auth_headers):
+    assert client.post("/api/stream-tickets").status_code == 401
+
+    response = client.post("/api/stream-tickets", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["expires_in"] > 0
+    assert response.json()["ticket"] not in auth_headers["Authorization"]
+
+
+def test_a_ticket_opens_one_stream(client, auth_headers):
+    ticket = client.post("/api/stream-tickets", headers=auth_headers).json()["ticket"]
+    me = client.get("/api/me", headers=auth_headers).json()
+
+    user = client.portal.call(redeem_stream_ticket, ticket)
+    assert user is not None and user.username == me["username"]
+
+    assert client.portal.call(redeem_stream_ticket, ticket) is None
+    assert client.get(f"{STREAM}&ticket={ticket}").status_code == 401
+
+
+def test_an_expired_ticket_is_rejected(client, auth_headers):
+    ticket = client.post("/api/stream-tickets", headers=auth_headers).json()["ticket"]
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    async def expire():
+        await StreamTicket.filter(ticket=ticket).update(expires_at=expired)
+    client.portal.call(expire)
+
+    assert client.get(f"{STREAM}&ticket={ticket}").status_code == 401
+    assert client.get(f"{STREAM}&ticket=unknown").status_code == 401
@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+
+# Reference point for the startup timeline: app.py imports this module first
+_process_started = time.perf_counter()
+
+# Durations of named phases, and points on the timeline, in seconds
+_phases = {}
+_marks = {}
+
+
+@contextmanager
+def phase(name):
+    """Context manager that records how long the enclosed block takes"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = time.perf_counter() - started
+
+
+def mark(name):
+    """Record the time elapsed since this module was imported"""
+    _marks[name] = time.perf_counter() - _process_started
+
+
+def startup_report():
+    """
+    Get the recorded import and startup timings.
+    
+    Returns:
+        Dictionary with 'phases' (durations) and 'marks' (offsets on the startup timeline),
+        both in milliseconds
+    """
+    return {
+        "phases": {name: round(seconds * 1000, 2) for name, seconds in _phases.items()},
+        "marks": {name: round(seconds * 1000, 2) for name, seconds in _marks.items()},
+    }
+
+
+def log_startup_report():
+    """Log the import and startup timings as one record"""
+    from logs import get_logger
+    report = startup_report()
+    get_logger(__name__).info("startup_complete", phases_ms=report["phases"], marks_ms=report["marks"])
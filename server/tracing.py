@@ -0,0 +1,243 @@
+"""
+Per-request database query tracing.
+
+The query methods of the Tortoise clients are wrapped so that every query run
+while serving a request is counted and timed on that request's trace. The
+trace also times named phases, such as authentication and the calculation,
+and comes back to the client as a Server-Timing header:
+
+    Server-Timing: db;dur=3.1;desc="4 queries", auth;dur=1.2, calc;dur=8.4, total;dur=14.0
+
+A request that runs more queries than its budget is logged as a warning, so
+a handler that starts querying once per period shows up at once.
+
+Variables:
+    DB_QUERY_BUDGET      Queries a request may run before it is logged (default 10)
+    DB_QUERY_BUDGETS     JSON object of "METHOD /path" to the budget of that route
+    SERVER_TIMING        1 (default) adds the Server-Timing header; 0 turns it off
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import json
+import os
+import threading
+import time
+
+from logs import get_logger
+
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", "10"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# Query methods of the Tortoise clients; every query goes through one of them
+QUERY_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+# Per-route totals of this process, reported by tracing_report
+_stats_lock = threading.Lock()
+_stats = {}
+
+logger = get_logger(__name__)
+
+class RequestTrace:
+    """Queries and phase timings of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.phases = {}
+        # Set once the request is over; tasks it started may still run queries
+        self.finished = False
+
+    def add_query(self, seconds: float):
+        if not self.finished:
+            self.queries += 1
+            self.db_seconds += seconds
+
+    def add_phase(self, name: str, seconds: float):
+        if not self.finished:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """The Server-Timing header value, in milliseconds"""
+        metrics = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"']
+        metrics += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(metrics)
+
+# Trace of the request being served; tasks and threads started by the request
+# inherit it, so their queries are counted too
+_current_trace: ContextVar = ContextVar("request_trace", default=None)
+
+# Set while a traced query method runs, so methods calling each other count once
+_in_query: ContextVar = ContextVar("in_traced_query", default=False)
+
+def current_trace():
+    """The trace of the request being served, or None outside a request"""
+    return _current_trace.get()
+
+@contextmanager
+def trace_phase(name: str):
+    """Time the enclosed block as a phase of the current request, if any"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_phase(name, time.perf_counter() - started)
+
+def _traced(method):
+    @wraps(method)
+    async def traced_method(self, *args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None or _in_query.get():
+            return await method(self, *args, **kwargs)
+        token = _in_query.set(True)
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            trace.add_query(time.perf_counter() - started)
+            _in_query.reset(token)
+    traced_method.__traced__ = True
+    return traced_method
+
+def _client_classes():
+    from tortoise.backends.base.client import BaseDBAsyncClient
+    pending = [BaseDBAsyncClient]
+    while pending:
+        cls = pending.pop()
+        yield cls
+        pending.extend(cls.__subclasses__())
+
+def instrument_tortoise():
+    """
+    Wrap the query methods of every Tortoise client class.
+
+    Must run after Tortoise has imported the backend of the configured
+    database, e.g. in a startup handler after register_tortoise. Classes
+    wrapped already are left alone, so it is safe to call more than once.
+    """
+    for cls in _client_classes():
+        for name in QUERY_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "__traced__", False):
+                setattr(cls, name, _traced(method))
+
+def load_budgets(overrides=None):
+    """
+    The query budgets of routes, from the DB_QUERY_BUDGETS variable.
+
+    Args:
+        overrides: JSON string to use instead of DB_QUERY_BUDGETS
+
+    Returns:
+        Dictionary mapping "METHOD /path" to the number of queries allowed
+    """
+    overrides = overrides if overrides is not None else os.getenv("DB_QUERY_BUDGETS", "")
+    return json.loads(overrides) if overrides else {}
+
+def route_key(scope: Scope) -> str:
+    """
+    "METHOD /path" of a finished request, with path parameters in braces,
+    e.g. "PUT /api/absence-periods/{period_id}", so routes holding IDs are
+    counted once. Requests answered before reaching a route, such as those
+    refused by the authentication middleware, are counted together.
+    """
+    if "endpoint" not in scope:
+        return f'{scope["method"]} (no route)'
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return f'{scope["method"]} {path}'
+
+def _route_stats(route):
+    return _stats.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "over_budget": 0, "db_ms": 0.0})
+
+def tracing_report():
+    """
+    Query totals of this process per route.
+
+    Returns:
+        Dictionary mapping "METHOD /path" to the requests served, the queries
+        they ran, the most queries of one request, the requests over budget and
+        the time spent in queries
+    """
+    with _stats_lock:
+        report = {route: dict(values) for route, values in _stats.items()}
+    for values in report.values():
+        values["avg_queries"] = round(values["queries"] / values["requests"], 2)
+        values["db_ms"] = round(values["db_ms"], 2)
+    return report
+
+class QueryTracingMiddleware:
+    """
+    Trace the queries of each request, report them in a Server-Timing header
+    and log requests that exceed their query budget.
+
+    Routes are keyed by method and path, with path parameters in braces
+    (see route_key).
+    """
+
+    def __init__(self, app: ASGIApp, budget: int = DB_QUERY_BUDGET, budgets=None, server_timing: bool = SERVER_TIMING):
+        """
+        Args:
+            app: The ASGI application
+            budget: Queries a request may run before it is logged
+            budgets: Dictionary mapping "METHOD /path" to its own budget (see load_budgets)
+            server_timing: False leaves out the Server-Timing header
+        """
+        self.app = app
+        self.budget = budget
+        self.budgets = budgets if budgets is not None else load_budgets()
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        # The request log reads the trace from here once the request is over
+        scope.setdefault("state", {})["trace"] = trace
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            trace.finished = True
+            _current_trace.reset(token)
+            self.record(scope, trace)
+
+    def record(self, scope: Scope, trace: RequestTrace):
+        """Add a finished request to the totals and log it if it was over budget"""
+        route = route_key(scope)
+        budget = self.budgets.get(route, self.budget)
+        over_budget = trace.queries > budget
+        with _stats_lock:
+            stats = _route_stats(route)
+            stats["requests"] += 1
+            stats["queries"] += trace.queries
+            stats["max_queries"] = max(stats["max_queries"], trace.queries)
+            stats["db_ms"] += trace.db_seconds * 1000
+            if over_budget:
+                stats["over_budget"] += 1
+        if over_budget:
+            logger.warning(
+                "query_budget_exceeded",
+                method=scope["method"],
+                path=scope["path"],
+                queries=trace.queries,
+                budget=budget,
+                db_ms=round(trace.db_seconds * 1000, 2),
+            )
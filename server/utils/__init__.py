@@ -1 +1,4 @@
-from .calculation import calculate_180_day_rule
+from .dates import parse_iso_date
+from .responses import FastJSONResponse, render_json
+from .compression import CompressionMiddleware
+from .admission import AdmissionMiddleware
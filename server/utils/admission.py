@@ -0,0 +1,377 @@
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import List, Optional
+import ipaddress
+import json
+import math
+import os
+import threading
+import time
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """
+    Admission budget of one route.
+
+    A request is admitted only if its client has a token left in its bucket and
+    neither the client nor the route as a whole is at its concurrency limit.
+    0 disables a limit. The client of a request with a logged-in user is the
+    user. Requests without one are limited per address, if the address is
+    known (see ADMISSION_TRUSTED_PROXIES), and per value of key_field in their
+    JSON body, so each counts against both.
+    """
+    # Requests of the route running at the same time, across all clients
+    global_concurrency: int = 0
+    # Requests of the route running at the same time for one client
+    client_concurrency: int = 0
+    # Tokens added to a client's bucket per second
+    rate: float = 0.0
+    # Size of a client's bucket, i.e. the longest burst that is admitted at once
+    burst: int = 1
+    # Field of the JSON body that names the client of requests without a user,
+    # such as the username being logged in to; empty for none
+    key_field: str = ""
+
+# The routes that spend most of their time on the CPU: the window scan of the
+# calculation, and bcrypt when logging in or signing up, plus job submissions,
+# which each take a slot of the bounded job queue. Login and signup have no
+# user yet; they are limited per username, which throttles password guessing
+# against one account, and per address when it is known
+DEFAULT_POLICIES = {
+    "POST /api/calculate": RoutePolicy(global_concurrency=16, client_concurrency=2, rate=5.0, burst=20),
+    "GET /api/calculate/chart": RoutePolicy(global_concurrency=16, client_concurrency=2, rate=5.0, burst=20),
+    "POST /api/trip-plans": RoutePolicy(global_concurrency=16, client_concurrency=2, rate=5.0, burst=20),
+    "POST /api/calculate/jobs": RoutePolicy(global_concurrency=16, client_concurrency=2, rate=2.0, burst=10),
+    "POST /api/login": RoutePolicy(global_concurrency=4, client_concurrency=1, rate=0.5, burst=5, key_field="username"),
+    "POST /api/signup": RoutePolicy(global_concurrency=2, client_concurrency=1, rate=0.2, burst=3, key_field="username"),
+}
+
+# Token buckets kept per process; the least recently used client is forgotten first
+MAX_TRACKED_CLIENTS = 10000
+
+# Proxies whose X-Forwarded-For header is trusted, as comma-separated addresses or
+# CIDR ranges (e.g. the ingress's pod network). Requests without a user are then
+# also limited per client address. Without it, addresses are not used: behind the
+# ingress or a container network every request comes from the same peer.
+ADMISSION_TRUSTED_PROXIES = os.getenv("ADMISSION_TRUSTED_PROXIES", "")
+
+# Most bytes of a request body read to find its key_field; larger bodies are
+# not keyed by it
+MAX_KEY_BODY_BYTES = 16384
+
+# Processes serving the same socket (set by serve.py). Each enforces its share of
+# every budget, so the server as a whole admits about what the policies say
+ADMISSION_WORKERS = int(os.getenv("ADMISSION_WORKERS", "1"))
+
+# Totals of the decisions made by AdmissionMiddleware in this process
+_stats_lock = threading.Lock()
+_stats = {}
+
+def worker_share(policy: RoutePolicy, workers: int) -> RoutePolicy:
+    """
+    The part of a route's budget that one of several worker processes enforces.
+
+    Limits are divided evenly, keeping at least 1 of every limit that is on.
+    Requests are spread over the workers by the kernel, not by client, so the
+    per-client limits of the whole server hold only on average.
+    """
+    if workers <= 1:
+        return policy
+
+    def share(limit):
+        return max(1, limit // workers) if limit else 0
+
+    return replace(
+        policy,
+        global_concurrency=share(policy.global_concurrency),
+        client_concurrency=share(policy.client_concurrency),
+        rate=policy.rate / workers,
+        burst=share(policy.burst),
+    )
+
+def load_policies(overrides=None, workers=None):
+    """
+    The route policies, with overrides from the ADMISSION_POLICIES variable.
+
+    ADMISSION_POLICIES is a JSON object mapping "METHOD /path" to the fields of
+    RoutePolicy to change, e.g. {"POST /api/calculate": {"rate": 10, "burst": 40}}.
+    Routes that are not in DEFAULT_POLICIES may be added the same way. Policies
+    are budgets of the whole server, and each worker gets its share.
+
+    Args:
+        overrides: JSON string to use instead of ADMISSION_POLICIES
+        workers: Number of worker processes instead of ADMISSION_WORKERS
+
+    Returns:
+        Dictionary mapping "METHOD /path" to the RoutePolicy of this process
+    """
+    overrides = overrides if overrides is not None else os.getenv("ADMISSION_POLICIES", "")
+    workers = workers if workers is not None else ADMISSION_WORKERS
+    policies = dict(DEFAULT_POLICIES)
+    for route, fields in (json.loads(overrides) if overrides else {}).items():
+        policies[route] = replace(policies.get(route, RoutePolicy()), **fields)
+    return {route: worker_share(policy, workers) for route, policy in policies.items()}
+
+def parse_networks(value: str) -> list:
+    """
+    Parse comma-separated addresses and CIDR ranges.
+
+    Raises:
+        ValueError: If an entry is not an address or range
+    """
+    return [ipaddress.ip_network(entry.strip(), strict=False) for entry in value.split(",") if entry.strip()]
+
+def forwarded_client(peer: Optional[str], forwarded_for: Optional[str], trusted) -> Optional[str]:
+    """
+    The address of the client behind trusted proxies.
+
+    X-Forwarded-For is read from the right, since each proxy appends the
+    address it received the request from; the first address that is not a
+    trusted proxy is the client. Entries left of it were sent by the client
+    and may be forged.
+
+    Args:
+        peer: Address of the connection
+        forwarded_for: The X-Forwarded-For header, if any
+        trusted: Networks of the trusted proxies (see parse_networks)
+
+    Returns:
+        The client address, or None if the peer is not a trusted proxy
+    """
+    def is_trusted(address):
+        try:
+            parsed = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(parsed in network for network in trusted)
+
+    if not peer or not is_trusted(peer):
+        return None
+    hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted(hop):
+            return hop
+    return hops[0] if hops else None
+
+def _route_stats(route):
+    return _stats.setdefault(route, {
+        "admitted": 0,
+        "shed_rate": 0,
+        "shed_client_concurrency": 0,
+        "shed_global_concurrency": 0,
+        "in_flight": 0,
+        "peak_in_flight": 0,
+    })
+
+def admission_report(policies=None):
+    """
+    Admission totals of this process.
+
+    Returns:
+        Dictionary mapping routes to their policy, admitted and shed counts,
+        requests in flight and the highest number in flight
+    """
+    policies = policies or load_policies()
+    with _stats_lock:
+        report = {route: dict(_route_stats(route)) for route in [*policies, *_stats]}
+    for route, values in report.items():
+        values["shed"] = values["shed_rate"] + values["shed_client_concurrency"] + values["shed_global_concurrency"]
+        total = values["admitted"] + values["shed"]
+        values["shed_ratio"] = round(values["shed"] / total, 4) if total else None
+        if route in policies:
+            values["policy"] = asdict(policies[route])
+    return report
+
+class TokenBucket:
+    """Tokens refilled continuously at rate per second, up to burst"""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """
+        Take a token if one is left.
+
+        Returns:
+            0 if a token was taken, otherwise the seconds until one is available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionMiddleware:
+    """
+    Shed requests to CPU-heavy routes before they reach the handler.
+
+    Each route in the policies has a token bucket per client and concurrency
+    limits per client and across clients. Requests over budget are answered at
+    once with 429 Too Many Requests and a Retry-After header instead of queueing
+    on the event loop. Clients are identified by the user that AuthMiddleware
+    put in the request state.
+
+    Requests without a user are limited by the key_field of their route's
+    policy, read from the JSON body, and by their address behind trusted
+    proxies. The address of the connection itself is not used: behind the
+    ingress or a container network every request comes from the same peer, so
+    a bucket per peer would be shared by all clients.
+    """
+
+    def __init__(self, app: ASGIApp, policies=None, enabled: bool = True, trusted_proxies=None):
+        """
+        Args:
+            app: The ASGI application
+            policies: Dictionary mapping "METHOD /path" to RoutePolicy (see load_policies)
+            enabled: False admits every request without any bookkeeping
+            trusted_proxies: Trusted proxies instead of ADMISSION_TRUSTED_PROXIES
+        """
+        self.app = app
+        self.policies = policies if policies is not None else load_policies()
+        self.enabled = enabled
+        self.trusted_proxies = parse_networks(trusted_proxies if trusted_proxies is not None else ADMISSION_TRUSTED_PROXIES)
+        self.buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self.in_flight = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route = f'{scope["method"]} {scope["path"]}'
+        policy = self.policies.get(route)
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        clients = self.client_keys(scope)
+        if policy.key_field and not scope.get("state", {}).get("user"):
+            body_key, receive = await self.body_key(receive, policy.key_field)
+            if body_key:
+                clients.append(body_key)
+        reason, retry_after = self.check(route, clients, policy)
+        with _stats_lock:
+            stats = _route_stats(route)
+            if reason:
+                stats[f"shed_{reason}"] += 1
+            else:
+                stats["admitted"] += 1
+                stats["in_flight"] += 1
+                stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        if reason:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests, please retry later"},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        # Count the request as running until the response has been sent
+        self.in_flight[route] = self.in_flight.get(route, 0) + 1
+        for client in clients:
+            self.in_flight[(route, client)] = self.in_flight.get((route, client), 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.release(route)
+            for client in clients:
+                self.release((route, client))
+            with _stats_lock:
+                _route_stats(route)["in_flight"] -= 1
+
+    def client_keys(self, scope: Scope) -> List[str]:
+        """
+        The clients a request counts against: the user set by AuthMiddleware, or
+        for requests without one, the address behind trusted proxies if known
+        """
+        user = scope.get("state", {}).get("user")
+        if user:
+            return [f'user:{user["id"]}']
+        if not self.trusted_proxies:
+            return []
+        forwarded_for = next((value.decode("latin-1") for name, value in scope.get("headers", [])
+                              if name == b"x-forwarded-for"), None)
+        peer = scope["client"][0] if scope.get("client") else None
+        address = forwarded_client(peer, forwarded_for, self.trusted_proxies)
+        return [f"address:{address}"] if address else []
+
+    async def body_key(self, receive: Receive, field: str):
+        """
+        Read the request body to find the client named by one of its JSON fields.
+
+        Returns:
+            Tuple of the client key, or None if the body does not name one, and
+            a receive function that replays the body to the application
+        """
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body") or len(body) > MAX_KEY_BODY_BYTES:
+                break
+
+        async def replay():
+            return messages.pop(0) if messages else await receive()
+
+        key = None
+        if len(body) <= MAX_KEY_BODY_BYTES:
+            try:
+                value = json.loads(body).get(field)
+            except (ValueError, AttributeError):
+                value = None
+            if isinstance(value, str) and value:
+                key = f"{field}:{value[:256]}"
+        return key, replay
+
+    def check(self, route: str, clients: List[str], policy: RoutePolicy):
+        """
+        Decide whether a request may run.
+
+        The client limits apply to each client the request counts against;
+        only the global concurrency limit is checked for requests without any.
+
+        Returns:
+            Tuple of None and 0 when admitted, otherwise the reason ('rate',
+            'client_concurrency' or 'global_concurrency') and seconds to wait
+        """
+        if policy.global_concurrency and self.in_flight.get(route, 0) >= policy.global_concurrency:
+            return "global_concurrency", 1
+        if policy.client_concurrency and any(
+            self.in_flight.get((route, client), 0) >= policy.client_concurrency for client in clients
+        ):
+            return "client_concurrency", 1
+        if policy.rate > 0:
+            now = time.monotonic()
+            wait = 0.0
+            for client in clients:
+                key = (route, client)
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(policy.rate, policy.burst, now)
+                    while len(self.buckets) > MAX_TRACKED_CLIENTS:
+                        self.buckets.popitem(last=False)
+                else:
+                    self.buckets.move_to_end(key)
+                wait = max(wait, bucket.take(now))
+            if wait:
+                return "rate", wait
+        return None, 0
+
+    def release(self, key):
+        """Count a request as finished"""
+        remaining = self.in_flight[key] - 1
+        if remaining:
+            self.in_flight[key] = remaining
+        else:
+            del self.in_flight[key]
@@ -0,0 +1,217 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import gzip
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is listed in requirements.txt
+    brotli = None
+
+# Content types worth compressing; everything else (images, archives) is sent as is
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+# Responses delivered incrementally, which must not be held back until they end
+STREAMING_TYPES = ("text/event-stream",)
+
+# Content encodings the middleware applies
+ENCODINGS = ("br", "gzip")
+
+# Totals of the work done by CompressionMiddleware in this process
+_stats_lock = threading.Lock()
+_stats = {
+    "responses": 0,
+    "compressed": 0,
+    "skipped_small": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "compress_seconds": 0.0,
+    "encodings": {},
+}
+
+def choose_encoding(accept_encoding, brotli_enabled=True):
+    """
+    Pick the content encoding for a response.
+
+    Args:
+        accept_encoding: Value of the request's Accept-Encoding header
+        brotli_enabled: Whether brotli may be used
+
+    Returns:
+        "br", "gzip" or None if the client accepts neither
+    """
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        # An explicit q=0 means the client refuses the coding
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+
+    if brotli is not None and brotli_enabled and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def encoded_etag(etag, encoding):
+    """
+    The ETag of a response body compressed with an encoding.
+
+    A strong ETag promises identical bytes, so each encoding of a body gets its
+    own tag: '"calc-1f2e"' becomes '"calc-1f2e-br"'. Weak ETags are returned
+    unchanged, since they may be shared by every encoding.
+    """
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def decoded_etag(etag):
+    """The ETag of the uncompressed body, from a tag that encoded_etag may have changed"""
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+def record_response(encoding=None, bytes_in=0, bytes_out=0, seconds=0.0, skipped_small=False):
+    """Add one response to the compression totals"""
+    with _stats_lock:
+        _stats["responses"] += 1
+        if skipped_small:
+            _stats["skipped_small"] += 1
+        if encoding is None:
+            return
+        _stats["compressed"] += 1
+        _stats["bytes_in"] += bytes_in
+        _stats["bytes_out"] += bytes_out
+        _stats["compress_seconds"] += seconds
+        per_encoding = _stats["encodings"].setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "compress_seconds": 0.0})
+        per_encoding["responses"] += 1
+        per_encoding["bytes_in"] += bytes_in
+        per_encoding["bytes_out"] += bytes_out
+        per_encoding["compress_seconds"] += seconds
+
+def compression_report():
+    """
+    Compression totals of this process.
+
+    Returns:
+        Dictionary with counts, byte totals, the compression ratio and the
+        average time spent compressing a response in milliseconds
+    """
+    with _stats_lock:
+        report = {key: value for key, value in _stats.items() if key != "encodings"}
+        encodings = {name: dict(values) for name, values in _stats["encodings"].items()}
+
+    for values in [report, *encodings.values()]:
+        compressed = values.get("compressed", values.get("responses"))
+        values["ratio"] = round(values["bytes_out"] / values["bytes_in"], 4) if values["bytes_in"] else None
+        values["avg_compress_ms"] = round(values["compress_seconds"] * 1000 / compressed, 3) if compressed else None
+        values["compress_seconds"] = round(values["compress_seconds"], 6)
+    report["encodings"] = encodings
+    report["brotli_available"] = brotli is not None
+    return report
+
+class CompressionMiddleware:
+    """
+    Compress large responses with brotli or gzip.
+
+    Responses smaller than minimum_size, responses with a content type that does
+    not compress well and responses that are already encoded are sent unchanged.
+    Event streams are passed through as they are produced. Other responses are
+    collected, compressed in one go and sent with Content-Encoding and
+    Vary: Accept-Encoding. A strong ETag is given the encoding as a suffix
+    (see encoded_etag), and a 304 confirms the encoded tag the client sent.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        """
+        Args:
+            app: The ASGI application
+            minimum_size: Smallest body in bytes that is compressed
+            gzip_level: gzip compression level, 1 (fastest) to 9 (smallest)
+            brotli_quality: brotli quality, 0 (fastest) to 11 (smallest); below 0 disables brotli
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), self.brotli_quality >= 0)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if message["status"] == 304 and "etag" in headers:
+                    # Confirm the tag the client holds, which is an encoded one if
+                    # it was sent a compressed body
+                    for candidate in request_headers.get("if-none-match", "").split(","):
+                        candidate = candidate.strip()
+                        if decoded_etag(candidate) == headers["etag"]:
+                            MutableHeaders(raw=message["headers"])["ETag"] = candidate
+                            break
+                if (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(STREAMING_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # Collect the body until the application has sent all of it
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(body_parts)
+
+            if len(body) < self.minimum_size:
+                record_response(skipped_small=True)
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            started = time.perf_counter()
+            compressed = self.compress(body, encoding)
+            record_response(encoding, len(body), len(compressed), time.perf_counter() - started)
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers:
+                headers["ETag"] = encoded_etag(headers["etag"], encoding)
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, body, encoding):
+        """Compress a response body with the chosen encoding"""
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
@@ -0,0 +1,17 @@
+from datetime import date
+
+
+def parse_iso_date(value: str) -> date:
+    """
+    Parse a YYYY-MM-DD date.
+
+    date.fromisoformat is several times faster than strptime, but since Python
+    3.11 it also accepts forms such as '20230110' or '2023-W02-2', so only the
+    10-character YYYY-MM-DD form is passed to it.
+
+    Raises:
+        ValueError: If the value is not a valid YYYY-MM-DD date
+    """
+    if len(value) != 10 or value[4] != "-" or value[7] != "-":
+        raise ValueError(f"Invalid date: {value!r}")
+    return date.fromisoformat(value)
@@ -0,0 +1,33 @@
+from fastapi.responses import JSONResponse
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+
+def render_json(content: Any) -> bytes:
+    """Serialize content to JSON bytes, with orjson when it is installed"""
+    if orjson is None:
+        return JSONResponse(content).body
+    return orjson.dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson when it is installed.
+    
+    orjson serializes large dictionaries of strings and integers, such as the
+    detailed periods of a calculation, several times faster than the standard
+    library. Without orjson this behaves exactly like JSONResponse.
+    
+    Routes that build a payload of plain str/int/bool/None values can return
+    FastJSONResponse(payload) directly, which also skips FastAPI's
+    jsonable_encoder pass over the payload.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return render_json(content)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import time
+
+from logs import get_logger, logging_report
+from timing import startup_report
+from utils.admission import admission_report
+from utils.compression import compression_report
+from periods.intervals import period_indexes
+from jobs import jobs_report
+from tracing import tracing_report
+
+# Directory where every worker of serve.py writes its metrics; unset when the
+# server runs as a single process
+WORKER_METRICS_DIR = os.getenv("WORKER_METRICS_DIR")
+
+# Seconds between two metrics snapshots of a worker
+WORKER_METRICS_INTERVAL = float(os.getenv("WORKER_METRICS_INTERVAL", "5"))
+
+# Derived values and maxima that cannot be added up across workers; they are left out of the totals
+DERIVED_KEYS = {"ratio", "shed_ratio", "avg_compress_ms", "avg_queries", "max_queries"}
+
+_writer_task = None
+
+logger = get_logger(__name__)
+
+def process_metrics():
+    """Metrics of this process"""
+    return {
+        "pid": os.getpid(),
+        "updated_at": time.time(),
+        "compression": compression_report(),
+        "admission": admission_report(),
+        "period_index": period_indexes.report(),
+        "jobs": jobs_report(),
+        "logging": logging_report(),
+        "queries": tracing_report(),
+        "startup": startup_report(),
+    }
+
+def metrics_path(pid=None):
+    """File holding the metrics snapshot of a worker"""
+    return os.path.join(WORKER_METRICS_DIR, f"worker-{pid or os.getpid()}.json")
+
+def write_snapshot():
+    """Write the metrics of this process for the other workers to read"""
+    temporary_path = f"{metrics_path()}.tmp"
+    with open(temporary_path, "w") as snapshot_file:
+        json.dump(process_metrics(), snapshot_file)
+    os.replace(temporary_path, metrics_path())
+
+def read_snapshots():
+    """Latest metrics of every worker, with fresh metrics for this process"""
+    snapshots = {os.getpid(): process_metrics()}
+    for name in os.listdir(WORKER_METRICS_DIR):
+        if not (name.startswith("worker-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(WORKER_METRICS_DIR, name)) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            # The worker exited or is replacing its file
+            continue
+        snapshots.setdefault(snapshot["pid"], snapshot)
+    return [snapshots[pid] for pid in sorted(snapshots)]
+
+def add_counters(total, values):
+    """Add the numbers in values to total, recursing into nested dictionaries"""
+    for key, value in values.items():
+        if key in DERIVED_KEYS:
+            continue
+        if isinstance(value, dict):
+            add_counters(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+        else:
+            total.setdefault(key, value)
+    return total
+
+def workers_report():
+    """
+    Metrics of all workers and their totals.
+
+    Counters are added up across workers; ratios and averages are only given
+    per worker. Snapshots are at most WORKER_METRICS_INTERVAL seconds old.
+
+    Returns:
+        Dictionary with the number of workers, the totals and the per-worker metrics
+    """
+    snapshots = read_snapshots() if WORKER_METRICS_DIR else [process_metrics()]
+    totals = {}
+    for snapshot in snapshots:
+        add_counters(totals, {key: value for key, value in snapshot.items()
+                              if key in ("compression", "admission", "period_index", "jobs", "logging", "queries") and value})
+    return {"workers": len(snapshots), "totals": totals, "per_worker": snapshots}
+
+async def _write_snapshots():
+    while True:
+        try:
+            write_snapshot()
+        except OSError as e:
+            logger.warning("worker_metrics_write_failed", error=str(e))
+        await asyncio.sleep(WORKER_METRICS_INTERVAL)
+
+async def start_metrics_writer():
+    """Start writing metrics snapshots when running under serve.py"""
+    global _writer_task
+    if WORKER_METRICS_DIR:
+        _writer_task = asyncio.create_task(_write_snapshots())
+
+async def stop_metrics_writer():
+    """Stop writing snapshots and remove this worker's file"""
+    if _writer_task is not None:
+        _writer_task.cancel()
+    if WORKER_METRICS_DIR:
+        try:
+            os.remove(metrics_path())
+        except OSError:
+            pass